@@ -19,6 +19,12 @@ Args:
   config   - config file to update with signing key. May contain wildcard
              e.g. --config config
                   --config ../configs/config.*
+  fill-pool - only make N keys ahead of time (key pool) for later
+             refreshes - which then just use one.
+  prune-keep, prune-age
+           - remove old key directories: all but the newest N and/or
+             those not current for longer than AGE (e.g. 52w).
+             Default is to keep all.
 
  NB:
    We always check the config - even if not refreshing keys to
@@ -38,11 +44,18 @@ def main():
         print('Problem initializing')
         return 0
 
+    if genkeys.fill_pool > 0:
+        genkeys.fill_key_pool()
+        print('Success: all done' if genkeys.okay else 'Error making keys')
+        return 0
+
     if genkeys.refresh_needed():
         genkeys.make_new_keys()
 
-    elif genkeys.verb:
-        print('Key refresh not needed yet')
+    else:
+        if genkeys.verb:
+            print('Key refresh not needed yet')
+        genkeys.index_keys()
 
     # always update to be sure config has key even if no refresh
     genkeys.update_configs()
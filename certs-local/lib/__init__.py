@@ -1,8 +1,71 @@
-# SPDX-License-Identifier: MIT
+# SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
 """
 genkeys module
+
+Names are imported from their module on first use (PEP 562) so that
+sign_module.py never loads the key generation code and genkeys.py
+never loads the signing code.
 """
-from .class_genkeys import GenKeys
-from .signer_class import (KernelModSigner, ModuleTool)
-from .run_prog_local import run_prog
+from typing import (TYPE_CHECKING, Any)
+import importlib
+
+if TYPE_CHECKING:
+    from .class_genkeys import GenKeys
+    from .signer_class import (KernelModSigner, ModuleTool, ToolOpts)
+    from .sign_pool import (SignResult, sign_modules)
+    from .sign_manifest import SignManifest
+    from .kernel_signers import (KernelSigners, installed_kernels)
+    from .mod_verify import (ModuleVerifier, VerifyResult)
+    from .sign_report import (prog_usage, write_report)
+    from .mod_find import (FindOpts, find_modules)
+    from .sign_client import (daemon_sign, socket_path)
+    from .sign_daemon import serve
+    from ._sign_opts import SignOpts
+    from .run_prog_local import (run_many, run_prog, run_prog_result)
+    from .run_prog_copy import ProgResult
+    from .prog_usage import ProgUsage
+    from .kernel_config import KernelConfig
+
+_EXPORTS: dict[str, str] = {
+        'GenKeys': '.class_genkeys',
+        'KernelModSigner': '.signer_class',
+        'ModuleTool': '.signer_class',
+        'ToolOpts': '.signer_class',
+        'SignResult': '.sign_pool',
+        'sign_modules': '.sign_pool',
+        'SignManifest': '.sign_manifest',
+        'KernelSigners': '.kernel_signers',
+        'installed_kernels': '.kernel_signers',
+        'ModuleVerifier': '.mod_verify',
+        'VerifyResult': '.mod_verify',
+        'write_report': '.sign_report',
+        'prog_usage': '.sign_report',
+        'FindOpts': '.mod_find',
+        'find_modules': '.mod_find',
+        'daemon_sign': '.sign_client',
+        'socket_path': '.sign_client',
+        'serve': '.sign_daemon',
+        'SignOpts': '._sign_opts',
+        'run_prog': '.run_prog_local',
+        'run_many': '.run_prog_local',
+        'run_prog_result': '.run_prog_local',
+        'ProgResult': '.run_prog_copy',
+        'ProgUsage': '.prog_usage',
+        'KernelConfig': '.kernel_config',
+        }
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str) -> Any:
+    """
+    Import name from its module when first used.
+    """
+    module_name = _EXPORTS.get(name)
+    if not module_name:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
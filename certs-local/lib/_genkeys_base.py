@@ -8,11 +8,13 @@
 from typing import (Any)
 import os
 import sys
-import argparse
 
-from .utils import file_list_glob
+from .prog_usage import ProgUsage
+from .utils import (file_list_glob, parse_opts)
 
 from .get_key_hash import get_key_hash_types
+from .kconfig_cache import KCONFIG_CACHE_NAME
+from .kernel_config import KernelConfig
 
 type _Opt = tuple[str | tuple[str, str] | tuple[str, str, str], dict[str, Any]]
 
@@ -39,7 +41,13 @@ class GenKeysBase:
         self.khash = 'sha512'
         self.ktype = 'ec'
         self.kconfig_list: list[str] = []
+        self.kconfigs: dict[str, KernelConfig] = {}
+        self.openssl = False
+        self.fill_pool = 0
+        self.prune_keep = 0
+        self.prune_age = ''
         self.okay = True
+        self.prog_usage = ProgUsage()
 
         #
         # parse command line options
@@ -49,7 +57,9 @@ class GenKeysBase:
         #
         # Retrieve kernel module signing key and hash types
         #
-        (okay, ktype, khash) = get_key_hash_types(self.kconfig_list)
+        cache_path = os.path.join(self.cert_dir, KCONFIG_CACHE_NAME)
+        (okay, ktype, khash) = get_key_hash_types(self.kconfig_list,
+                                                  cache_path, self.kconfigs)
         if not okay:
             self.okay = False
         self.ktype = ktype
@@ -69,26 +79,9 @@ def _parse_args(genkeys: GenKeysBase):
     options = _avail_options(genkeys.refresh, genkeys.config)
 
     #
-    # Add options and Parse
+    # Parse into genkeys
     #
-    par = argparse.ArgumentParser(description=desc)
-
-    for opt in options:
-        opt_list, kwargs = opt
-        if isinstance(opt_list, str):
-            par.add_argument(opt_list, **kwargs)
-        else:
-            par.add_argument(*opt_list, **kwargs)
-
-    #
-    # save into genkeys
-    #
-    parsed = par.parse_args()
-    if not parsed:
-        return
-
-    for (key, val) in vars(parsed).items():
-        setattr(genkeys, key, val)
+    parse_opts(genkeys, desc, options)
 
     genkeys.kconfig_list = file_list_glob(genkeys.config)
     if not genkeys.kconfig_list:
@@ -126,6 +119,30 @@ def _avail_options(refresh: str, conf: str) -> list[_Opt]:
                   'help': 'Verbose (False)'
                   }
                  ))
+
+    opts.append((('--openssl'),
+                 {'action': 'store_true',
+                  'help': 'Make keys using openssl, not in process (False)'
+                  }
+                 ))
+
+    opts.append((('--prune-keep'),
+                 {'type': int, 'default': 0, 'metavar': 'N',
+                  'help': 'Remove old keys - all but newest N besides current'
+                  }
+                 ))
+
+    opts.append((('--prune-age'),
+                 {'default': '', 'metavar': 'AGE',
+                  'help': 'Remove old keys no longer current for AGE e.g. 52w'
+                  }
+                 ))
+
+    opts.append((('--fill-pool'),
+                 {'type': int, 'default': 0, 'metavar': 'N',
+                  'help': 'Only make keys ahead of time, until N are ready'
+                  }
+                 ))
     #
     # deprecated options - warn to avoid any script breakage
     #
@@ -0,0 +1,263 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Command line options for sign_module
+"""
+# pylint: disable=too-few-public-methods, too-many-instance-attributes
+from typing import (Any)
+import os
+import sys
+
+from .utils import parse_opts
+
+type _Opt = tuple[str | tuple[str, str] | tuple[str, str, str], dict[str, Any]]
+
+
+class SignOpts:
+    """
+    sign_module command line options.
+
+    Either a list of modules or a module directory (-d)
+    """
+    def __init__(self):
+        self.myname: str = sys.argv[0]
+        self.dir: str = ''
+        self.recursive: bool = False
+        self.include: list[str] = []
+        self.exclude: list[str] = []
+        self.symlinks: str = 'skip'
+        self.one_file_system: bool = False
+        self.modules: list[str] = []
+        self.jobs: int = 1
+        self.sign_file: bool = False
+        self.stream_size: int = 32
+        self.bufsize: int = 1024
+        self.level: int | None = None
+        self.threads: int = 0
+        self.force: bool = False
+        self.no_manifest: bool = False
+        self.rebuild_manifest: bool = False
+        self.verify_manifest: bool = False
+        self.serve: bool = False
+        self.no_daemon: bool = False
+        self.report: str = ''
+        self.json: bool = False
+        self.verb: bool = False
+        self.verify: bool = False
+        self.audit: str = ''
+        self.kernel: list[str] = []
+        self.all_kernels: bool = False
+        self.kernel_root: str = '/usr/lib/modules'
+
+        _parse_args(self)
+
+        if self.json:
+            self.report = '-'
+
+        # checking signatures is cheap - use all cpus unless told
+        if self.jobs is None:
+            self.jobs = 0 if (self.verify or self.audit) else 1
+
+        if self.jobs < 1:
+            self.jobs = os.cpu_count() or 1
+
+        # share cpus between parallel jobs
+        # xz keeps its block layout unless threads given (see ToolOpts)
+        self.threads_given: bool = self.threads >= 1
+        if self.threads < 1:
+            self.threads = max((os.cpu_count() or 1) // self.jobs, 1)
+
+
+def _parse_args(opts: SignOpts):
+    """
+    Parse command line and update opts
+    """
+    desc = os.path.basename(sys.argv[0])
+    options = _avail_options(opts)
+
+    parse_opts(opts, desc, options)
+
+
+def _avail_options(defaults: SignOpts) -> list[_Opt]:
+    """
+    List of command line options.
+
+    Args:
+        defaults (SignOpts):
+        Provides default values.
+    """
+    stream_size = defaults.stream_size
+    bufsize = defaults.bufsize
+    threads = defaults.threads
+
+    opts: list[_Opt] = []
+
+    opts.append((('-d', '--dir'),
+                 {'default': '',
+                  'help': 'Sign all modules in this directory'
+                  }
+                 ))
+
+    opts.append((('-r', '--recursive'),
+                 {'action': 'store_true',
+                  'help': 'With -d, also sign modules in sub directories'
+                  }
+                 ))
+
+    opts.append((('-I', '--include'),
+                 {'action': 'append', 'default': [], 'metavar': 'GLOB',
+                  'help': 'With -d, only modules matching (path or name)'
+                  }
+                 ))
+
+    opts.append((('-X', '--exclude'),
+                 {'action': 'append', 'default': [], 'metavar': 'GLOB',
+                  'help': 'With -d, skip matching modules and directories'
+                  }
+                 ))
+
+    opts.append((('--symlinks'),
+                 {'default': 'skip', 'choices': ['skip', 'follow'],
+                  'help': 'With -d, skip or follow symlinks (skip)'
+                  }
+                 ))
+
+    opts.append((('--one-file-system'),
+                 {'action': 'store_true',
+                  'help': 'With -d -r, stay on same file system'
+                  }
+                 ))
+
+    opts.append((('-j', '--jobs'),
+                 {'default': None, 'type': int,
+                  'help': f'Parallel jobs, 0 = all cpus ({defaults.jobs}, '
+                          'all cpus with --verify / --audit)'
+                  }
+                 ))
+
+    opts.append((('-s', '--sign-file'),
+                 {'action': 'store_true',
+                  'help': 'Use kernel sign-file instead of in process signing'
+                  }
+                 ))
+
+    opts.append((('-ss', '--stream-size'),
+                 {'default': stream_size, 'type': int,
+                  'help': f'Stream modules this size (MiB) or larger '
+                          f'({stream_size})'
+                  }
+                 ))
+
+    opts.append((('-bs', '--bufsize'),
+                 {'default': bufsize, 'type': int,
+                  'help': f'Streaming buffer size in KiB ({bufsize})'
+                  }
+                 ))
+
+    opts.append((('-l', '--level'),
+                 {'default': None, 'type': int,
+                  'help': 'Compression level (zstd, xz preset or gzip). '
+                          'Default keeps original where known'
+                  }
+                 ))
+
+    opts.append((('-t', '--threads'),
+                 {'default': threads, 'type': int,
+                  'help': 'Compression threads per module (zstd, xz). '
+                          f'{threads} = cpus / jobs. xz modules are only '
+                          'split into blocks (as xz -T) when given'
+                  }
+                 ))
+
+    opts.append((('-f', '--force'),
+                 {'action': 'store_true',
+                  'help': 'Re-sign modules already signed with current key'
+                  }
+                 ))
+
+    opts.append((('-nm', '--no-manifest'),
+                 {'action': 'store_true',
+                  'help': 'Do not use or update the signing manifest'
+                  }
+                 ))
+
+    opts.append((('-rm', '--rebuild-manifest'),
+                 {'action': 'store_true',
+                  'help': 'Check every module and drop stale manifest entries'
+                  }
+                 ))
+
+    opts.append((('-vm', '--verify-manifest'),
+                 {'action': 'store_true',
+                  'help': 'Verify manifest entries against files and exit'
+                  }
+                 ))
+
+    opts.append((('--serve'),
+                 {'action': 'store_true',
+                  'help': 'Run as signing daemon on unix socket'
+                  }
+                 ))
+
+    opts.append((('-nd', '--no-daemon'),
+                 {'action': 'store_true',
+                  'help': 'Sign here even if signing daemon is running'
+                  }
+                 ))
+
+    opts.append((('--report'),
+                 {'default': '', 'metavar': 'FILE',
+                  'help': 'Write json lines report (per module + summary)'
+                  }
+                 ))
+
+    opts.append((('--json'),
+                 {'action': 'store_true',
+                  'help': 'Write report to stdout instead of usual output'
+                  }
+                 ))
+
+    opts.append((('-v', '--verb'),
+                 {'action': 'store_true',
+                  'help': 'Also show time and memory used by sign-file'
+                  }
+                 ))
+
+    opts.append((('--verify'),
+                 {'action': 'store_true',
+                  'help': 'Verify module signatures against our keys'
+                  }
+                 ))
+
+    opts.append((('--audit'),
+                 {'default': '', 'metavar': 'DIR',
+                  'help': 'Verify all modules under DIR '
+                          '(e.g. /usr/lib/modules)'
+                  }
+                 ))
+
+    opts.append((('-K', '--kernel'),
+                 {'action': 'append', 'default': [], 'metavar': 'KVER',
+                  'help': 'Sign for this kernel using its keys (repeatable)'
+                  }
+                 ))
+
+    opts.append((('--all-kernels'),
+                 {'action': 'store_true',
+                  'help': 'Sign for all installed kernels with keys'
+                  }
+                 ))
+
+    opts.append((('--kernel-root'),
+                 {'default': defaults.kernel_root, 'metavar': 'DIR',
+                  'help': f'Where kernels are ({defaults.kernel_root})'
+                  }
+                 ))
+
+    opts.append(('modules',
+                 {'nargs': '*', 'default': [],
+                  'help': 'Module(s) to sign'
+                  }
+                 ))
+
+    return opts
@@ -5,7 +5,7 @@ Handles key generation.
 """
 from ._genkeys_base import GenKeysBase
 from .update_config import update_configs
-from .make_keys import make_new_keys
+from .make_keys import (fill_pool, index_keys, make_new_keys)
 from .refresh_needed import refresh_needed
 
 
@@ -25,13 +25,33 @@ class GenKeys(GenKeysBase):
 
     def make_new_keys(self) -> bool:
         """
-        Set up before we use openssl to create_new_keys()
+        Make new keys (or take from key pool) and make them current
         """
-        # pylint: disable=
+        if not make_new_keys(self):
+            self.okay = False
+
         if self.verb:
-            print('Making new keys ')
+            for line in self.prog_usage.lines():
+                print(line)
+        return self.okay
 
-        if not make_new_keys(self):
+    def fill_key_pool(self) -> bool:
+        """
+        Make keys ahead of time until fill_pool are ready
+        """
+        if not fill_pool(self, self.fill_pool):
+            self.okay = False
+
+        if self.verb:
+            for line in self.prog_usage.lines():
+                print(line)
+        return self.okay
+
+    def index_keys(self) -> bool:
+        """
+        Update key index and prune old keys if asked
+        """
+        if not index_keys(self):
             self.okay = False
         return self.okay
 
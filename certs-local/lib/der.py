@@ -0,0 +1,155 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Minimal ASN.1 DER encoding and decoding.
+
+Just enough to build the PKCS#7 (CMS) signed data used for
+kernel module signatures and to pick apart existing signatures
+and certificates.
+"""
+
+TAG_INTEGER = 0x02
+TAG_OCTET_STRING = 0x04
+TAG_NULL = 0x05
+TAG_OID = 0x06
+TAG_SEQUENCE = 0x30
+TAG_SET = 0x31
+TAG_CONTEXT_0 = 0xa0
+TAG_CONTEXT_3 = 0xa3
+
+
+def der_tlv(tag: int, content: bytes) -> bytes:
+    """
+    Encode tag, length and value.
+    """
+    size = len(content)
+    if size < 0x80:
+        length = bytes([size])
+    else:
+        nbytes = (size.bit_length() + 7) // 8
+        length = bytes([0x80 | nbytes]) + size.to_bytes(nbytes, 'big')
+    return bytes([tag]) + length + content
+
+
+def der_seq(*items: bytes) -> bytes:
+    """
+    SEQUENCE of already encoded items.
+    """
+    return der_tlv(TAG_SEQUENCE, b''.join(items))
+
+
+def der_set(*items: bytes) -> bytes:
+    """
+    SET OF already encoded items - sorted as DER requires.
+    """
+    return der_tlv(TAG_SET, b''.join(sorted(items)))
+
+
+def der_explicit(num: int, content: bytes) -> bytes:
+    """
+    Context specific constructed (explicit) tag [num].
+    """
+    return der_tlv(0xa0 | num, content)
+
+
+def der_int(value: int) -> bytes:
+    """
+    INTEGER
+    """
+    nbytes = value.bit_length() // 8 + 1
+    return der_tlv(TAG_INTEGER, value.to_bytes(nbytes, 'big', signed=True))
+
+
+def der_null() -> bytes:
+    """
+    NULL
+    """
+    return der_tlv(TAG_NULL, b'')
+
+
+def der_octets(value: bytes) -> bytes:
+    """
+    OCTET STRING
+    """
+    return der_tlv(TAG_OCTET_STRING, value)
+
+
+def der_oid(dotted: str) -> bytes:
+    """
+    OBJECT IDENTIFIER from dotted string. e.g. '1.2.840.113549.1.7.2'
+    """
+    arcs = [int(arc) for arc in dotted.split('.')]
+    values = [arcs[0] * 40 + arcs[1]] + arcs[2:]
+
+    content = b''
+    for value in values:
+        chunk = [value & 0x7f]
+        value >>= 7
+        while value:
+            chunk.append(0x80 | (value & 0x7f))
+            value >>= 7
+        content += bytes(reversed(chunk))
+    return der_tlv(TAG_OID, content)
+
+
+def der_read(data: bytes, pos: int = 0) -> tuple[int, int, int]:
+    """
+    Read one tag, length and value starting at pos.
+
+    Only single byte tags and definite lengths are handled,
+    which is all DER uses here.
+
+    Returns:
+        tuple[tag: int, start: int, end: int]:
+        data[start:end] is the content.
+        tag is -1 if data is not valid.
+    """
+    bad = (-1, 0, 0)
+    size = len(data)
+    if pos + 2 > size:
+        return bad
+
+    tag = data[pos]
+    length = data[pos + 1]
+    start = pos + 2
+    if length & 0x80:
+        nbytes = length & 0x7f
+        if nbytes == 0 or nbytes > 4 or start + nbytes > size:
+            return bad
+        length = int.from_bytes(data[start:start + nbytes], 'big')
+        start += nbytes
+
+    end = start + length
+    if end > size:
+        return bad
+    return (tag, start, end)
+
+
+def der_items(data: bytes) -> list[tuple[int, bytes]]:
+    """
+    Split content of a constructed item (e.g. SEQUENCE) into its parts.
+
+    Returns:
+        list[tuple[tag: int, tlv: bytes]]:
+        tlv is the complete encoding of each part.
+        Empty list if data is not valid.
+    """
+    items: list[tuple[int, bytes]] = []
+    pos = 0
+    while pos < len(data):
+        (tag, _start, end) = der_read(data, pos)
+        if tag < 0:
+            return []
+        items.append((tag, data[pos:end]))
+        pos = end
+    return items
+
+
+def der_content(tlv: bytes) -> bytes:
+    """
+    Content (value) of a single encoded item.
+    """
+    (tag, start, end) = der_read(tlv)
+    if tag < 0:
+        return b''
+    return tlv[start:end]
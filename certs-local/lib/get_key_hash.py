@@ -1,13 +1,20 @@
-# SPDX-License-Identifier: MIT
+# SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
 """
  Extract kernel config signing key / hash
+
+ Results are kept in KconfigCache, keyed by file fingerprint, so
+ unchanged configs are not read here. Configs that are read are
+ kept (see kernel_config) for update_config to use.
 """
+import os
 
-from .utils import open_file
+from .kconfig_cache import KconfigCache
+from .kernel_config import (TRUSTED_KEYS_NAME, KernelConfig)
 
 
-def get_key_hash_types(kconfig_list: list[str]
+def get_key_hash_types(kconfig_list: list[str], cache_path: str = '',
+                       kconfigs: dict[str, KernelConfig] | None = None
                        ) -> tuple[bool, str, str]:
     """
     Read kernel config to determine:
@@ -19,6 +26,13 @@ def get_key_hash_types(kconfig_list: list[str]
         kconfig_list (list[str]):
         List of kernel config files.
 
+        cache_path (str):
+        Cache file of signing fields (see kconfig_cache).
+        Empty to read every config.
+
+        kconfigs (dict[str, KernelConfig] | None):
+        Configs read are added here (by absolute path) for reuse.
+
     Returns:
         tuple[okay: bool, key_type: str, hash_type: str]:
         Okay is True when key and hash types are found.
@@ -33,9 +47,10 @@ def get_key_hash_types(kconfig_list: list[str]
     all_okay = True
     key_type = ''
     hash_type = ''
+    cache = KconfigCache(cache_path)
 
     for kconfig in kconfig_list:
-        (okay, ktype, htype) = _parse_config_file(kconfig)
+        (okay, ktype, htype) = _cached_config_file(cache, kconfig, kconfigs)
 
         if not okay:
             print(f'Failed to open: {kconfig}')
@@ -62,136 +77,36 @@ def get_key_hash_types(kconfig_list: list[str]
     if not (key_type and hash_type):
         all_okay = False
 
+    cache.save()
     return (all_okay, key_type, hash_type)
 
 
-def _parse_config_file(kconfig: str) -> tuple[bool, str, str]:
+def _cached_config_file(cache: KconfigCache, kconfig: str,
+                        kconfigs: dict[str, KernelConfig] | None
+                        ) -> tuple[bool, str, str]:
     """
-    Read one kernel config to determine:
-
-     - module signing key type
-     - module hash type
-
-    Args:
-        kconfig (str):
-        A kernel config files.
-
-    Returns:
-        tuple[okay: bool, key_type: str, hash_type: str]:
-        Okay is True when key and hash types are found.
-
+    Signing fields of one config - from cache if config unchanged.
     """
-    all_okay = True
-
-    key_type = ''
-    hash_type = ''
-
-    fobj = open_file(kconfig, 'r')
-    if fobj:
-        conf_lines = fobj.readlines()
-        fobj.close()
-    else:
+    try:
+        stat = os.stat(kconfig)
+    except OSError as err:
+        print(f'Failed to open: {kconfig} {err}')
+        return (False, '', '')
+
+    entry = cache.get(kconfig, stat)
+    if entry:
+        return (True, entry.key_type, entry.hash_type)
+
+    kconf = KernelConfig(kconfig)
+    if not kconf.okay or not kconf.stat:
         print(f'Failed to open: {kconfig}')
-        all_okay = False
-        return (False, key_type, hash_type)
-
-    #
-    # Find the hash and key type lines
-    #
-    num_to_find = 2
-    count = 0
-    for config_line in conf_lines:
-
-        (okay, ktype, htype) = _parse_one(config_line)
-        if not okay:
-            all_okay = False
-            print(f'Error in {kconfig}: {config_line}')
-            continue
-
-        if ktype:
-            count += 1
-            if not key_type:
-                key_type = ktype
-            elif ktype != key_type:
-                err = 'key_types must be same across configs'
-                print(f'{err}: {key_type} vs {ktype}')
-
-        if htype:
-            count += 1
-            if not hash_type:
-                hash_type = htype
-            elif ktype != hash_type:
-                err = 'hash_types must be same across configs'
-                print(f'{err}: {hash_type} vs {htype}')
-
-        if count >= num_to_find:
-            # all done for this config file
-            break
-
-    if count < num_to_find:
-        print(f' Failed to find kernel sign key or hash type: {kconfig}')
-        all_okay = False
+        return (False, '', '')
 
-    return (all_okay, key_type, hash_type)
-
-
-def _parse_one(line: str) -> tuple[bool, str, str]:
-    """
-    Parse one config line for key / hash type
-    """
-
-    key_type = ''
-    hash_type = ''
-
-    all_okay = True
-
-    (okay, key_type) = _config_to_key_type(line)
-    if not okay:
-        all_okay = False
-
-    (okay, hash_type) = _config_to_hash_type(line)
-    if not okay:
-        all_okay = False
+    if kconfigs is not None:
+        kconfigs[kconf.path] = kconf
 
-    return (all_okay, key_type, hash_type)
-
-
-def _config_to_key_type(config_line: str) -> tuple[bool, str]:
-    """
-    Identify key type from kernel config row
-    with "CONFIG_MODULE_SIG_KEY_TYPE_"
-    """
-    ktype = ''
-    if not config_line.startswith('CONFIG_MODULE_SIG_KEY_TYPE_'):
-        return (True, ktype)
-
-    csplit = config_line.split('=')
-    name = csplit[0]
-    if name.endswith('RSA'):
-        ktype = 'rsa'
-
-    elif name.endswith('ECDSA'):
-        ktype = 'ec'
-
-    else:
-        print(f'Unknown kernel config {config_line}')
-        return (False, ktype)
-
-    return (True, ktype)
-
-
-def _config_to_hash_type(config_line: str) -> tuple[bool, str]:
-    """
-    Identify hash type from kernel config row
-    with "CONFIG_MODULE_SIG_HASH"
-    """
-    hash_type = ''
-    if not config_line.startswith('CONFIG_MODULE_SIG_HASH'):
-        return (True, hash_type)
-
-    csplit = config_line.split('=')
-    hash_type = csplit[1]
-    hash_type = hash_type.strip().strip('"')
-    if not hash_type:
-        return (False, hash_type)
-    return (True, hash_type)
+    (okay, key_type, hash_type) = kconf.key_hash_types()
+    if okay:
+        cache.put(kconfig, kconf.stat, key_type, hash_type,
+                  kconf.get(TRUSTED_KEYS_NAME) or '')
+    return (okay, key_type, hash_type)
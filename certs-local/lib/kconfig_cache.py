@@ -0,0 +1,110 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Cache of the module signing fields of kernel configs.
+
+Stored as json in the certs-local directory:
+
+    certs-local/kconfig-cache.json
+
+    {"version": 1,
+     "configs": {"/path/config": {"ino": .., "size": .., "mtime_ns": ..,
+                                  "key_type": "ec", "hash_type": "sha512",
+                                  "trusted_keys": "\"/path/key.pem\""}}}
+
+An entry is used only while the stat fingerprint (inode, size, mtime)
+of the config is unchanged, so the config is not opened at all - not
+to find key / hash types, nor by update_config when trusted_keys
+(value of CONFIG_SYSTEM_TRUSTED_KEYS) already is the current key.
+Only configs where key and hash types were found are cached.
+The cache is written (temp file + rename) only when changed.
+"""
+from dataclasses import dataclass
+import os
+
+from .utils import (load_json_entries, save_json_entries)
+
+KCONFIG_CACHE_NAME = 'kconfig-cache.json'
+_VERSION = 1
+
+
+@dataclass
+class KconfigEntry:
+    """
+    Signing fields of one kernel config.
+    """
+    ino: int = 0
+    size: int = 0
+    mtime_ns: int = 0
+    key_type: str = ''
+    hash_type: str = ''
+    trusted_keys: str = ''
+
+    def same_file(self, stat: os.stat_result) -> bool:
+        """
+        True if stat fingerprint is unchanged.
+        """
+        return (self.ino == stat.st_ino and self.size == stat.st_size
+                and self.mtime_ns == stat.st_mtime_ns)
+
+
+class KconfigCache:
+    """
+    Kernel config signing fields keyed by file fingerprint.
+    Public methods: get(), put(), save()
+
+    Args:
+        path (str):
+        Cache file - empty for no cache (get() always misses).
+    """
+    def __init__(self, path: str = ''):
+        self.path: str = path
+        self.entries: dict[str, KconfigEntry] = {}
+        self.changed: bool = False
+        if path:
+            self._read()
+
+    def _read(self):
+        """
+        Load cache - missing or bad file gives empty cache.
+        """
+        self.entries = load_json_entries(self.path, _VERSION, 'configs',
+                                         KconfigEntry)
+
+    def get(self, kconfig: str, stat: os.stat_result
+            ) -> KconfigEntry | None:
+        """
+        Cached entry of kconfig if file unchanged - else None.
+        """
+        entry = self.entries.get(os.path.abspath(kconfig))
+        if entry and entry.same_file(stat):
+            return entry
+        return None
+
+    def put(self, kconfig: str, stat: os.stat_result,
+            key_type: str, hash_type: str, trusted_keys: str):
+        """
+        Remember signing fields of kconfig.
+        """
+        # pylint: disable=too-many-arguments, too-many-positional-arguments
+        entry = KconfigEntry(ino=stat.st_ino, size=stat.st_size,
+                             mtime_ns=stat.st_mtime_ns,
+                             key_type=key_type, hash_type=hash_type,
+                             trusted_keys=trusted_keys)
+        kconfig = os.path.abspath(kconfig)
+        if self.entries.get(kconfig) != entry:
+            self.entries[kconfig] = entry
+            self.changed = True
+
+    def save(self) -> bool:
+        """
+        Write cache if changed (temp file + rename).
+        """
+        if not (self.path and self.changed):
+            return True
+
+        if not save_json_entries(self.path, _VERSION, 'configs',
+                                 self.entries):
+            return False
+        self.changed = False
+        return True
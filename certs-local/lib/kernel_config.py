@@ -0,0 +1,229 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Kernel config (.config) read once and shared.
+
+The file is read in one pass into its lines plus an index of
+CONFIG_xxx name -> line number. Queries (key and hash type) and
+edits (CONFIG_SYSTEM_TRUSTED_KEYS) use the index and edits are made
+to the lines in place. save() writes the file (temp file + rename)
+only if something changed. stage() and commit() are the two halves
+of save() so several configs can be written before any is renamed.
+
+genkeys keeps one KernelConfig per config path (GenKeysBase.kconfigs)
+so each config file is read at most once per run.
+"""
+import os
+import uuid
+
+from .utils import (open_file, remove_file)
+
+KEY_TYPE_PREFIX = 'CONFIG_MODULE_SIG_KEY_TYPE_'
+HASH_NAME = 'CONFIG_MODULE_SIG_HASH'
+TRUSTED_KEYS_NAME = 'CONFIG_SYSTEM_TRUSTED_KEYS'
+
+
+class KernelConfig:
+    """
+    One kernel config file.
+    Public methods: get(), set(), key_hash_types(), save(),
+                    stage(), commit(), discard()
+
+    Args:
+        path (str):
+        Kernel config file.
+    """
+    def __init__(self, path: str):
+        self.path: str = os.path.abspath(path)
+        self.okay: bool = False
+        self.changed: bool = False
+        self.stat: os.stat_result | None = None
+        self.lines: list[str] = []
+        self.index: dict[str, int] = {}
+        self._temp: str = ''
+        self._read()
+
+    def _read(self):
+        """
+        Read config and index its CONFIG_xxx=value lines.
+        """
+        fobj = open_file(self.path, 'r')
+        if not fobj:
+            return
+        try:
+            self.stat = os.fstat(fobj.fileno())
+            self.lines = fobj.readlines()
+        except (OSError, ValueError) as err:
+            print(f'Failed to read: {self.path} {err}')
+            fobj.close()
+            return
+        fobj.close()
+
+        for (num, line) in enumerate(self.lines):
+            if line.startswith('CONFIG_'):
+                name = line.split('=', 1)[0]
+                self.index.setdefault(name, num)
+        self.okay = True
+
+    def get(self, name: str) -> str | None:
+        """
+        Value of name (right of '=', without newline) - None if not set.
+        """
+        num = self.index.get(name)
+        if num is None:
+            return None
+        return self.lines[num].split('=', 1)[1].rstrip('\n')
+
+    def set(self, name: str, value: str) -> bool:
+        """
+        Set name=value - line is replaced in place or added at end.
+
+        Returns:
+            bool:
+            True if config changed.
+        """
+        if self.get(name) == value:
+            return False
+
+        line = f'{name}={value}\n'
+        num = self.index.get(name)
+        if num is None:
+            if self.lines and not self.lines[-1].endswith('\n'):
+                self.lines[-1] += '\n'
+            self.index[name] = len(self.lines)
+            self.lines.append(line)
+        else:
+            self.lines[num] = line
+        self.changed = True
+        return True
+
+    def key_hash_types(self) -> tuple[bool, str, str]:
+        """
+        Module signing key and hash types.
+
+        Returns:
+            tuple[okay: bool, key_type: str, hash_type: str]:
+            Okay is True when key and hash types are found.
+        """
+        all_okay = True
+        key_type = ''
+        hash_type = ''
+
+        for (name, num) in self.index.items():
+            if not name.startswith(KEY_TYPE_PREFIX):
+                continue
+            (okay, key_type) = _config_to_key_type(self.lines[num])
+            if not okay:
+                all_okay = False
+                print(f'Error in {self.path}: {self.lines[num]}')
+            if key_type:
+                break
+
+        value = self.get(HASH_NAME)
+        if value is not None:
+            hash_type = value.strip().strip('"')
+            if not hash_type:
+                all_okay = False
+                print(f'Error in {self.path}: {HASH_NAME}={value}')
+
+        if not (key_type and hash_type):
+            print(f' Failed to find kernel sign key or hash type: {self.path}')
+            all_okay = False
+
+        return (all_okay, key_type, hash_type)
+
+    def save(self, verb: bool = False) -> bool:
+        """
+        Write the updated config if changed.
+         - stage() then commit()
+        """
+        if not self.changed:
+            return True
+
+        if verb:
+            print(f'Updating config: {self.path}')
+        return self.stage() and self.commit()
+
+    def stage(self) -> bool:
+        """
+        Write changed config to temp file in same dir (avoids rename
+        across file systems), with same mode, and fsync it.
+        See commit() / discard(). Nothing to do if unchanged.
+        """
+        if not self.changed or self._temp:
+            return True
+
+        path_temp = os.path.join(os.path.dirname(self.path),
+                                 str(uuid.uuid4()))
+        fobj = open_file(path_temp, 'w')
+        if not fobj:
+            print(f'Failed to write: {path_temp}')
+            return False
+
+        try:
+            fobj.write(''.join(self.lines))
+            fobj.flush()
+            if self.stat:
+                os.fchmod(fobj.fileno(), self.stat.st_mode & 0o7777)
+            os.fsync(fobj.fileno())
+            fobj.close()
+
+        except OSError as err:
+            print(f'Failed to write: {self.path} {err}')
+            fobj.close()
+            remove_file(path_temp)
+            return False
+
+        self._temp = path_temp
+        return True
+
+    def commit(self) -> bool:
+        """
+        Rename staged temp file over the config.
+        """
+        if not self._temp:
+            return True
+        try:
+            os.rename(self._temp, self.path)
+
+        except OSError as err:
+            print(f'Failed to write: {self.path} {err}')
+            self.discard()
+            return False
+
+        self._temp = ''
+        self.changed = False
+        self.stat = os.stat(self.path)
+        return True
+
+    def discard(self):
+        """
+        Remove staged temp file (config left as is).
+        """
+        if self._temp:
+            remove_file(self._temp)
+            self._temp = ''
+
+
+def _config_to_key_type(config_line: str) -> tuple[bool, str]:
+    """
+    Identify key type from kernel config row
+    with "CONFIG_MODULE_SIG_KEY_TYPE_"
+    """
+    ktype = ''
+    if not config_line.startswith(KEY_TYPE_PREFIX):
+        return (True, ktype)
+
+    csplit = config_line.split('=')
+    name = csplit[0]
+    if name.endswith('RSA'):
+        ktype = 'rsa'
+
+    elif name.endswith('ECDSA'):
+        ktype = 'ec'
+
+    else:
+        print(f'Unknown kernel config {config_line}')
+        return (False, ktype)
+
+    return (True, ktype)
@@ -0,0 +1,160 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Sign modules for several kernels in one run.
+
+Each installed kernel has its own keys:
+
+    <kernel_root>/<kver>/build/certs-local/current/
+
+A signer (and manifest) is made for each kernel asked for and every
+module is routed to the signer of the kernel it was built for - the
+release in its vermagic (see mod_info). All modules share one worker
+pool, whichever kernel they belong to.
+
+Modules built for a kernel not asked for (or without keys)
+are reported as problems and left alone.
+"""
+from typing import (TYPE_CHECKING, Iterable, Iterator)
+import os
+import sys
+
+from .mod_find import (FindOpts, find_modules)
+from .sign_manifest import SignManifest
+from .sign_pool import (SignResult, map_modules, open_tool, sign_tool)
+from .signer_class import (KernelModSigner, ToolOpts)
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+KERNEL_ROOT = '/usr/lib/modules'
+
+
+def kernel_signer_path(kernel_root: str, kver: str) -> str:
+    """
+    Where sign_module.py lives for kernel kver.
+    """
+    return os.path.join(kernel_root, kver, 'build', 'certs-local',
+                        'sign_module.py')
+
+
+def installed_kernels(kernel_root: str = KERNEL_ROOT) -> list[str]:
+    """
+    Kernels under kernel_root with signing keys.
+    """
+    kvers: list[str] = []
+    try:
+        names = sorted(os.listdir(kernel_root))
+    except OSError as err:
+        print(f'Error reading {kernel_root}: {err}', file=sys.stderr)
+        return kvers
+
+    for kver in names:
+        cert_dir = os.path.dirname(kernel_signer_path(kernel_root, kver))
+        if os.path.exists(os.path.join(cert_dir, 'current')):
+            kvers.append(kver)
+    return kvers
+
+
+class KernelSigners:
+    """
+    Signers for several kernels.
+    Public methods: sign_one(), sign_modules(), save(), modules()
+
+    Args:
+        kernel_root (str):
+        Directory holding one directory per kernel (/usr/lib/modules).
+
+        kvers (list[str]):
+        Kernel releases to sign for.
+
+        native (bool):
+        Use in process signing when possible.
+
+        manifest (bool):
+        Use each kernel's signing manifest.
+
+        rebuild (bool):
+        Rebuild manifests (see SignManifest).
+    """
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    def __init__(self, kernel_root: str, kvers: list[str],
+                 native: bool = True, manifest: bool = True,
+                 rebuild: bool = False):
+        self.kernel_root: str = kernel_root
+        self.signers: dict[str, KernelModSigner] = {}
+        self.manifests: dict[str, SignManifest] = {}
+
+        for kver in kvers:
+            myname = kernel_signer_path(kernel_root, kver)
+            signer = KernelModSigner(myname, native=native)
+            if not signer.initialized:
+                print(f'Kernel {kver}: no signing keys - skipped',
+                      file=sys.stderr)
+                continue
+
+            self.signers[kver] = signer
+            if manifest and signer.signer_id:
+                self.manifests[kver] = SignManifest(
+                        signer.manifest, signer.signer_id.key_id(),
+                        rebuild=rebuild)
+
+    def sign_one(self, mod_path: str, opts: ToolOpts | None = None
+                 ) -> SignResult:
+        """
+        Sign one module with the keys of the kernel it was built for.
+        """
+        #
+        # Any signer will do to read the module
+        #
+        signer = next(iter(self.signers.values()))
+        (result, mod_tool, start) = open_tool(signer, mod_path, opts,
+                                              self.manifests.values())
+        if not mod_tool:
+            return result
+
+        kver = mod_tool.kernel_version()
+        if kver not in self.signers:
+            result.msg = mod_tool.msg or \
+                    f'No signing keys for kernel {kver or "(no vermagic)"}'
+            return result
+
+        mod_tool.signer = self.signers[kver]
+        return sign_tool(mod_tool, result, self.manifests.get(kver), start)
+
+    def sign_modules(self, modules: Iterable[str], jobs: int = 1,
+                     opts: ToolOpts | None = None,
+                     pool: 'Executor | None' = None) -> list[SignResult]:
+        """
+        Sign modules for all kernels using one pool of up to jobs workers.
+
+        Returns:
+            list[SignResult]:
+            One result per module in same order as modules.
+        """
+        if not self.signers:
+            return []
+
+        def _sign(mod: str) -> SignResult:
+            return self.sign_one(mod, opts)
+
+        return map_modules(_sign, modules, jobs, pool)
+
+    def modules(self, find_opts: FindOpts | None = None) -> Iterator[str]:
+        """
+        Modules in the updates/ directory (dkms) of each kernel.
+        """
+        find_opts = find_opts if find_opts else FindOpts(recursive=True)
+        for kver in self.signers:
+            updates = os.path.join(self.kernel_root, kver, 'updates')
+            if os.path.isdir(updates):
+                yield from find_modules(updates, find_opts)
+
+    def save(self) -> bool:
+        """
+        Save all manifests.
+        """
+        okay = True
+        for manifest in self.manifests.values():
+            okay = manifest.save() and okay
+        return okay
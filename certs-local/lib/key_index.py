@@ -0,0 +1,237 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Key history index - which key directory holds which key.
+
+Stored as json in the certs-local directory:
+
+    certs-local/key-index.json
+
+    {"version": 1,
+     "keys": {"20250101-1200": {"skid": hex, "issuer_serial": hex,
+                                "created": epoch secs, "khash": "sha512",
+                                "ktype": "ec"}, ...}}
+
+skid (subject key identifier) and issuer_serial (DER issuer and
+serial number) are what a module signature names its signer by
+(see signer_id), so finding the key of a signature is a dictionary
+lookup. created is when the key became current - this is what the
+--refresh period is measured from.
+
+genkeys.py adds each new key when it becomes current and, if asked,
+prunes old keys. The index is written to a temp file and renamed,
+so readers always see a complete index. Key directories not in the
+index (e.g. made by an older version) are added by genkeys.py,
+parsing each certificate once.
+"""
+from dataclasses import dataclass
+import os
+import re
+import shutil
+import time
+
+from .signer_id import (SignerId, cert_signer_id)
+from .utils import (load_json_entries, open_file, save_json_entries)
+
+INDEX_NAME = 'key-index.json'
+_VERSION = 1
+_KEY_DIR = re.compile(r'\d{8}-\d{4}$')
+
+
+@dataclass
+class KeyEntry:
+    """
+    One key directory.
+    """
+    skid: str = ''
+    issuer_serial: str = ''
+    created: float = 0.0
+    khash: str = ''
+    ktype: str = ''
+
+
+def _read_value(path: str) -> str:
+    """
+    Contents of small text file (khash, ktype) - empty if missing.
+    """
+    value = ''
+    fobj = open_file(path, 'r')
+    if fobj:
+        value = fobj.read().strip()
+        fobj.close()
+    return value
+
+
+def current_key_name(cert_dir: str) -> str:
+    """
+    Name of key directory current points to - empty if none.
+    """
+    try:
+        return os.path.basename(os.readlink(os.path.join(cert_dir,
+                                                         'current')))
+    except OSError:
+        return ''
+
+
+class KeyIndex:
+    """
+    Index of key directories.
+    Public methods: current(), find(), add(), rebuild(), prune(), save()
+
+    Args:
+        cert_dir (str):
+        The certs-local directory.
+    """
+    def __init__(self, cert_dir: str):
+        self.cert_dir: str = cert_dir
+        self.path: str = os.path.join(cert_dir, INDEX_NAME)
+        self.entries: dict[str, KeyEntry] = {}
+        self._by_id: dict[str, str] = {}
+        self._read()
+
+    def _read(self):
+        """
+        Load index - missing or bad file gives empty index.
+        """
+        entries = load_json_entries(self.path, _VERSION, 'keys', KeyEntry)
+        for (name, entry) in entries.items():
+            self._set(name, entry)
+
+    def _set(self, name: str, entry: KeyEntry):
+        """
+        Add or replace entry along with its lookup ids.
+        """
+        self.entries[name] = entry
+        for ident in (entry.skid, entry.issuer_serial):
+            if ident:
+                self._by_id[ident] = name
+
+    def current(self) -> tuple[str, KeyEntry | None]:
+        """
+        Current key directory name and its entry (None if not indexed).
+        """
+        name = current_key_name(self.cert_dir)
+        return (name, self.entries.get(name))
+
+    def find(self, signer_id: SignerId) -> str:
+        """
+        Key directory holding key of signer_id - empty if not ours.
+        """
+        for ident in (signer_id.skid.hex(), signer_id.issuer_serial.hex()):
+            name = self._by_id.get(ident) if ident else None
+            if name:
+                return name
+        return ''
+
+    def add(self, name: str, created: float | None = None) -> bool:
+        """
+        Add key directory - certificate is parsed for its ids.
+
+        Args:
+            name (str):
+            Key directory (in cert_dir).
+
+            created (float | None):
+            When key became current (epoch secs). Defaults to now.
+        """
+        kdir = os.path.join(self.cert_dir, name)
+        signer_id = cert_signer_id(os.path.join(kdir, 'signing_crt.crt'))
+        if not signer_id:
+            return False
+
+        entry = KeyEntry(skid=signer_id.skid.hex(),
+                         issuer_serial=signer_id.issuer_serial.hex(),
+                         created=time.time() if created is None else created,
+                         khash=_read_value(os.path.join(kdir, 'khash')),
+                         ktype=_read_value(os.path.join(kdir, 'ktype')))
+        self._set(name, entry)
+        return True
+
+    def rebuild(self) -> int:
+        """
+        Add any key directories not yet in index.
+
+        created is taken from the signing key file time, which is what
+        was used before the index existed.
+
+        Returns:
+            int:
+            Number of entries added.
+        """
+        try:
+            names = sorted(entry.name for entry in os.scandir(self.cert_dir)
+                           if _KEY_DIR.match(entry.name) and entry.is_dir(
+                               follow_symlinks=False))
+        except OSError as err:
+            print(f'Error reading {self.cert_dir}: {err}')
+            return 0
+
+        added = 0
+        for name in names:
+            if name in self.entries:
+                continue
+            kfile = os.path.join(self.cert_dir, name, 'signing_key.pem')
+            created = os.path.getmtime(kfile) if os.path.exists(kfile) \
+                else 0.0
+            if self.add(name, created):
+                added += 1
+        return added
+
+    def prune(self, keep: int = 0, max_age: float = 0.0) -> list[str]:
+        """
+        Remove old key directories (never the current one).
+
+        Args:
+            keep (int):
+            Keep at most this many keys besides current - 0 for no limit.
+
+            max_age (float):
+            Remove keys that stopped being current more than this
+            many secs ago - 0 for no limit.
+
+        Returns:
+            list[str]:
+            Names of key directories removed.
+        """
+        (current, entry) = self.current()
+        old = sorted((name for name in self.entries if name != current),
+                     key=lambda name: self.entries[name].created,
+                     reverse=True)
+
+        #
+        # A key stopped being current when the next one was created
+        #
+        now = time.time()
+        retired: dict[str, float] = {}
+        later = entry.created if entry else now
+        for name in old:
+            retired[name] = later
+            later = self.entries[name].created
+
+        remove = old[keep:] if keep > 0 else []
+        if max_age > 0:
+            remove += [name for name in old if name not in remove
+                       and now - retired[name] > max_age]
+
+        removed: list[str] = []
+        for name in remove:
+            kdir = os.path.join(self.cert_dir, name)
+            try:
+                if os.path.isdir(kdir):
+                    shutil.rmtree(kdir)
+            except OSError as err:
+                print(f'Failed to remove {kdir}: {err}')
+                continue
+            del self.entries[name]
+            removed.append(name)
+
+        self._by_id = {}
+        for (name, entry) in list(self.entries.items()):
+            self._set(name, entry)
+        return removed
+
+    def save(self) -> bool:
+        """
+        Write index (temp file + rename).
+        """
+        return save_json_entries(self.path, _VERSION, 'keys', self.entries)
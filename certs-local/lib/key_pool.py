@@ -0,0 +1,148 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Key pool - key directories made ahead of time.
+
+    certs-local/pool/<id>/      ready keys (same files as a key dir)
+    certs-local/pool/.new-<id>/ being made
+
+make_keys.fill_pool() (genkeys.py --fill-pool N) makes keys when
+there is time to spare, e.g. from a timer or in the background after
+a kernel build.
+A pooled directory is only renamed into place once complete, so a
+partly made one is never used.
+
+When keys are due to be refreshed, make_new_keys() takes one whose
+khash and ktype match and renames it to the new date-time key
+directory - rotation is then a rename and a symlink swap rather
+than generating a key.
+
+Pooled keys whose khash or ktype no longer match the kernel config
+are removed the next time the pool is filled.
+"""
+import os
+import shutil
+import time
+import uuid
+
+from ._genkeys_base import GenKeysBase
+from .utils import open_file
+
+POOL_DIR = 'pool'
+_NEW_PREFIX = '.new-'
+
+# unfinished key dirs older than this (secs) are from interrupted runs
+_NEW_MAX_AGE = 3600
+
+
+def _read_key_types(kdir: str) -> tuple[str, str]:
+    """
+    khash and ktype of key dir - empty if missing.
+    """
+    types: list[str] = []
+    for name in ('khash', 'ktype'):
+        value = ''
+        fobj = open_file(os.path.join(kdir, name), 'r')
+        if fobj:
+            value = fobj.read().strip()
+            fobj.close()
+        types.append(value)
+    return (types[0], types[1])
+
+
+def _pooled(pool: str) -> list[str]:
+    """
+    Ready key dirs in pool - oldest first.
+    """
+    try:
+        entries = [entry for entry in os.scandir(pool)
+                   if entry.is_dir(follow_symlinks=False)
+                   and not entry.name.startswith(_NEW_PREFIX)]
+    except OSError:
+        return []
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    return [entry.path for entry in entries]
+
+
+def pool_count(genkeys: GenKeysBase) -> int:
+    """
+    Number of ready pooled keys matching genkeys khash and ktype.
+    """
+    pool = os.path.join(genkeys.cert_dir, POOL_DIR)
+    return sum(1 for kdir in _pooled(pool)
+               if _read_key_types(kdir) == (genkeys.khash, genkeys.ktype))
+
+
+def prune_pool(genkeys: GenKeysBase):
+    """
+    Remove leftovers of interrupted runs and keys no longer wanted
+    (khash or ktype differs).
+    """
+    pool = os.path.join(genkeys.cert_dir, POOL_DIR)
+    os.makedirs(pool, mode=0o700, exist_ok=True)
+    too_old = time.time() - _NEW_MAX_AGE
+    for entry in os.scandir(pool):
+        if entry.name.startswith(_NEW_PREFIX):
+            remove = entry.stat().st_mtime < too_old
+        else:
+            remove = entry.is_dir(follow_symlinks=False) and \
+                _read_key_types(entry.path) != (genkeys.khash, genkeys.ktype)
+        if remove:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def new_pool_dir(genkeys: GenKeysBase) -> str:
+    """
+    Make empty directory for keys being made - see add_to_pool().
+    """
+    name = _NEW_PREFIX + str(uuid.uuid4())
+    kdir_new = os.path.join(genkeys.cert_dir, POOL_DIR, name)
+    os.makedirs(kdir_new, mode=0o700)
+    return kdir_new
+
+
+def add_to_pool(kdir_new: str) -> bool:
+    """
+    Keys in kdir_new (from new_pool_dir()) are complete - make them
+    available.
+    """
+    pool = os.path.dirname(kdir_new)
+    name = os.path.basename(kdir_new).removeprefix(_NEW_PREFIX)
+    try:
+        os.rename(kdir_new, os.path.join(pool, name))
+
+    except OSError as err:
+        print(f'Failed adding keys to pool: {err}')
+        shutil.rmtree(kdir_new, ignore_errors=True)
+        return False
+    return True
+
+
+def take_from_pool(genkeys: GenKeysBase, kdir: str) -> bool:
+    """
+    Move a ready pooled key dir to kdir.
+
+    Returns:
+        bool:
+        False if pool has no matching keys.
+    """
+    pool = os.path.join(genkeys.cert_dir, POOL_DIR)
+    for pooled in _pooled(pool):
+        if _read_key_types(pooled) != (genkeys.khash, genkeys.ktype):
+            continue
+        try:
+            os.rename(pooled, kdir)
+
+        except OSError:
+            # e.g. taken by a concurrent run - try next one
+            continue
+
+        #
+        # Key age (for --refresh) counts from when it is used
+        #
+        kfile = os.path.join(kdir, 'signing_key.pem')
+        if os.path.exists(kfile):
+            os.utime(kfile)
+        os.chmod(kdir, 0o755)
+        return True
+    return False
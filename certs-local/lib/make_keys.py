@@ -9,7 +9,12 @@ import stat
 import uuid
 
 from ._genkeys_base import GenKeysBase
-from .run_prog_local import run_prog
+from .key_index import KeyIndex
+from .key_pool import (add_to_pool, new_pool_dir, pool_count, prune_pool,
+                       take_from_pool)
+from .prog_usage import ProgUsage
+from .refresh_needed import period_delta
+from .run_prog_local import (run_many_results, run_prog_result)
 from .utils import open_file
 from .utils import date_time_now
 
@@ -26,11 +31,13 @@ class KeyInfo:
     ktype: str
 
 
-def _create_new_keys(keyinfo: KeyInfo, verb: bool) -> bool:
+def _create_new_keys(keyinfo: KeyInfo, verb: bool, usage: ProgUsage
+                     ) -> bool:
     """
-    Make the actual keys - rsa or ec using openssl
+    Make the actual keys - rsa or ec using openssl.
+    Resource use of each openssl run is added to usage.
     """
-    # pylint: disable=R0913
+    # pylint: disable=R0913, R0914
     okay = True
 
     kvalid = keyinfo.kvalid
@@ -51,55 +58,75 @@ def _create_new_keys(keyinfo: KeyInfo, verb: bool) -> bool:
         cmd = cmd + ' -newkey ec -pkeyopt ec_paramgen_curve:secp384r1'
 
     pargs = cmd.split()
-    (retc, _stdout, stderr) = run_prog(pargs)
-    if retc != 0:
+    prog = run_prog_result(pargs)
+    usage.add(prog.usage() | {'prog': 'openssl req'})
+    if prog.retc != 0:
         print('Error making new key')
-        if verb and stderr:
-            print(stderr)
+        if verb and prog.stderr:
+            print(prog.stderr)
         return not okay
 
     os.chmod(kkey, stat.S_IREAD | stat.S_IWRITE)
 
-    # extract private key
-    cmd = f'/usr/bin/openssl pkey -in {kkey} -out {kprv}'
-    pargs = cmd.split()
-    (retc, _stdout, stderr) = run_prog(pargs)
-    if retc != 0:
-        print('Error making prv key')
-        if verb and stderr:
-            print(stderr)
-        return not okay
-
-    # Extract certificate (public) part
-    cmd = f'/usr/bin/openssl x509 -outform der -in {kkey} -out {kcrt}'
-    pargs = cmd.split()
-    (retc, _stdout, stderr) = run_prog(pargs)
-    if retc != 0:
-        print('Error making crt')
-        if verb and stderr:
-            print(stderr)
-        return not okay
+    #
+    # Extract private key and certificate (public) part.
+    # Both only read kkey so run them together.
+    #
+    openssl = '/usr/bin/openssl'
+    pargs_list = [
+            f'{openssl} pkey -in {kkey} -out {kprv}'.split(),
+            f'{openssl} x509 -outform der -in {kkey} -out {kcrt}'.split(),
+            ]
+    what = ['prv key', 'crt']
+    for (name, prog) in zip(what, run_many_results(pargs_list)):
+        usage.add(prog.usage() | {'prog': f'openssl {prog.pargs[1]}'})
+        if prog.retc != 0:
+            print(f'Error making {name}')
+            if verb and prog.stderr:
+                print(prog.stderr)
+            okay = False
     return okay
 
 
 def make_new_keys(genkeys: GenKeysBase):
     """
-    Set up before we use openssl to create_new_keys()
+    Make new keys and make them current.
+
+    A ready key directory is taken from the key pool (key_pool) if
+    there is one, otherwise keys are made now - see make_key_dir().
+    Key directory is named by date-time and added to the key index.
+    """
+    now = date_time_now()
+    now_str = now.strftime('%Y%m%d-%H%M')
+    kdir = os.path.join(genkeys.cert_dir, now_str)
+
+    if not os.path.exists(kdir) and take_from_pool(genkeys, kdir):
+        if genkeys.verb:
+            print('Using keys from key pool')
+    else:
+        if genkeys.verb:
+            print('Making new keys ')
+
+        os.makedirs(kdir, exist_ok=True)
+        if not make_key_dir(genkeys, kdir):
+            return False
+
+    if not set_current(genkeys.cert_dir, kdir):
+        return False
+    return index_keys(genkeys, now_str)
+
+
+def make_key_dir(genkeys: GenKeysBase, kdir: str) -> bool:
+    """
+    Make keys in kdir - in process (native_keygen) or, if that is not
+    possible or --openssl given, using openssl - _create_new_keys()
     Output:
         - signing_crt.crt - DER format Certificate
         - signing_prv.pem - private key (pem format)
         - signing_key.pem - privkey + cert in pem format
+        - khash, ktype
     """
     # pylint: disable=R0914
-    if genkeys.verb:
-        print('Making new keys ')
-
-    now = date_time_now()
-    now_str = now.strftime('%Y%m%d-%H%M')
-
-    kdir = os.path.join(genkeys.cert_dir, now_str)
-    os.makedirs(kdir, exist_ok=True)
-
     kvalid = '36500'
     kx509 = os.path.join(genkeys.cert_dir, 'x509.oot.genkey')
     kbasename = 'signing'
@@ -112,7 +139,19 @@ def make_new_keys(genkeys: GenKeysBase):
 
     keyinfo = KeyInfo(kvalid, kx509, kprv, kkey, kcrt, khash, ktype)
 
-    if not _create_new_keys(keyinfo, genkeys.verb):
+    #
+    # In process if we can, otherwise openssl
+    #
+    made = False
+    if not genkeys.openssl:
+        # pylint: disable=import-outside-toplevel
+        from .native_keygen import make_keys_native
+        made = make_keys_native(keyinfo)
+        if made and genkeys.verb:
+            print('Keys made in process')
+
+    if not made and not _create_new_keys(keyinfo, genkeys.verb,
+                                         genkeys.prog_usage):
         return False
 
     khash_file = os.path.join(kdir, 'khash')
@@ -139,19 +178,86 @@ def make_new_keys(genkeys: GenKeysBase):
         print(f'Failed to write: {ktype_file}')
         okay = False
 
-    #
-    # update current link to new kdir
-    # since the 'current' link and the actual keydir are in same dir we use
-    # relative for link - safest in case certs-local is moved
-    #
-    if okay:
-        link_temp = str(uuid.uuid4())
-        link_temp = os.path.join(genkeys.cert_dir, link_temp)
+    return okay
 
-        kdir_rel = os.path.basename(kdir)
-        cur_link = os.path.join(genkeys.cert_dir, 'current')
 
+def fill_pool(genkeys: GenKeysBase, count: int) -> bool:
+    """
+    Make keys ahead of time until key pool holds count ready
+    key dirs with current khash and ktype - see key_pool.
+
+    Returns:
+        bool:
+        False if any keys could not be made.
+    """
+    prune_pool(genkeys)
+    need = count - pool_count(genkeys)
+    for _num in range(need):
+        kdir_new = new_pool_dir(genkeys)
+        if not (make_key_dir(genkeys, kdir_new) and add_to_pool(kdir_new)):
+            return False
+
+    if genkeys.verb:
+        print(f'Key pool: {pool_count(genkeys)} ready ({max(need, 0)} made)')
+    return True
+
+
+def index_keys(genkeys: GenKeysBase, new_key: str = '') -> bool:
+    """
+    Bring key index up to date and prune old keys (--prune-keep,
+    --prune-age) - see key_index. Only key directories not yet
+    indexed have their certificate read.
+
+    Args:
+        new_key (str):
+        Key directory just made current - indexed as created now.
+    """
+    index = KeyIndex(genkeys.cert_dir)
+    changed = index.rebuild() > 0
+
+    if new_key:
+        changed = index.add(new_key) or changed
+
+    max_age = 0.0
+    if genkeys.prune_age:
+        delta = period_delta(genkeys.prune_age)
+        if not delta:
+            print(f'Failed to parse prune age: {genkeys.prune_age}')
+            return False
+        max_age = delta.total_seconds()
+
+    if genkeys.prune_keep > 0 or max_age > 0:
+        removed = index.prune(genkeys.prune_keep, max_age)
+        if removed and genkeys.verb:
+            print(f'Removed old keys: {" ".join(removed)}')
+        changed = changed or bool(removed)
+
+    if genkeys.verb:
+        print(f'Key index: {len(index.entries)} keys')
+
+    if changed:
+        return index.save()
+    return True
+
+
+def set_current(cert_dir: str, kdir: str) -> bool:
+    """
+    Update current link to kdir
+
+    Since the 'current' link and the actual keydir are in same dir we use
+    relative for link - safest in case certs-local is moved
+    """
+    link_temp = str(uuid.uuid4())
+    link_temp = os.path.join(cert_dir, link_temp)
+
+    kdir_rel = os.path.basename(kdir)
+    cur_link = os.path.join(cert_dir, 'current')
+
+    try:
         os.symlink(kdir_rel, link_temp)
         os.rename(link_temp, cur_link)
 
-    return okay
+    except OSError as err:
+        print(f'Failed to update {cur_link}: {err}')
+        return False
+    return True
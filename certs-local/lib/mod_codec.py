@@ -0,0 +1,525 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Module (re)compression.
+
+After signing, modules are recompressed the same way they were
+originally compressed where this can be determined from the
+frame / stream header:
+
+  zstd:  checksum and content size flags.
+         Level is not stored - default level unless given.
+
+  xz:    integrity check type and filter chain (e.g. lzma2 dict size).
+         Preset defaults to 6 (same as xz) unless given.
+
+  gzip:  level from the XFL header byte (9, 1 or default 6).
+         mtime kept.
+
+Threads:
+  zstd uses its own worker threads.
+
+  xz is made multi-threaded the same way 'xz -T' does it: input
+  is split into blocks which are compressed independently in parallel
+  and put together into a single xz stream. Each block is compressed
+  as its own xz stream by the lzma module. Its block is then lifted
+  out and added to the one output stream. This way lzma computes each
+  block's integrity check and we only need to write the stream header,
+  index and footer.
+
+  gzip compresses single threaded.
+
+Codec modules (zstandard, lzma, gzip) are imported on first use,
+so only those for the formats actually seen get loaded.
+"""
+# pylint: disable=too-many-instance-attributes, import-outside-toplevel
+from typing import (IO, TYPE_CHECKING, Any)
+from dataclasses import (dataclass, field)
+import io
+import struct
+import zlib
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+HEAD_SIZE = 4096
+
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+_XZ_MAGIC = b'\xfd7zXZ\x00'
+_XZ_FOOTER_MAGIC = b'YZ'
+_GZIP_MAGIC = b'\x1f\x8b'
+ELF_MAGIC = b'\x7fELF'
+
+_XZ_FILTER_LZMA2 = 0x21
+_XZ_FILTER_DELTA = 0x03
+_XZ_FILTERS_BCJ = (0x04, 0x05, 0x06, 0x07, 0x08, 0x09, 0x0a)
+_XZ_CHECK_CRC64 = 0x04
+
+
+@dataclass
+class CodecParams:
+    """
+    Compression parameters.
+
+    fext is one of '.zst', '.xz', '.gz' (or '.ko' for none).
+    level None means codec default (or detected level).
+    threads is the number of compression threads.
+    """
+    fext: str
+    level: int | None = None
+    threads: int = 1
+
+    # zstd
+    checksum: bool = True
+    content_size: bool = True
+
+    # xz
+    check: int = _XZ_CHECK_CRC64
+    filters: list[dict[str, Any]] = field(default_factory=list)
+
+    # gzip
+    mtime: int | None = None
+
+
+def sniff_format(head: bytes) -> str:
+    """
+    Compression format from the leading magic bytes.
+
+    Returns:
+        str:
+        '.zst', '.xz', '.gz', '.ko' (uncompressed ELF)
+        or empty if none of these.
+    """
+    if head.startswith(_ZSTD_MAGIC):
+        return '.zst'
+    if head.startswith(_XZ_MAGIC):
+        return '.xz'
+    if head.startswith(_GZIP_MAGIC):
+        return '.gz'
+    if head.startswith(ELF_MAGIC):
+        return '.ko'
+    return ''
+
+
+def detect_params(fext: str, head: bytes) -> CodecParams:
+    """
+    Compression parameters used to create head.
+
+    Args:
+        fext (str):
+        Compression type (file extension).
+
+        head (bytes):
+        Start of compressed file - HEAD_SIZE bytes is plenty.
+
+    Returns:
+        CodecParams:
+        Parameters found - defaults for anything not found.
+    """
+    params = CodecParams(fext)
+    match fext:
+        case '.zst':
+            _detect_zstd(head, params)
+        case '.xz':
+            _detect_xz(head, params)
+        case '.gz':
+            _detect_gzip(head, params)
+    return params
+
+
+def _detect_zstd(head: bytes, params: CodecParams):
+    """
+    zstd frame header descriptor:
+        bits 7-6 content size flag, bit 5 single segment,
+        bit 2 checksum flag
+    """
+    if len(head) < 5 or not head.startswith(_ZSTD_MAGIC):
+        return
+    descriptor = head[4]
+    fcs_flag = descriptor >> 6
+    single_segment = bool(descriptor & 0x20)
+    params.checksum = bool(descriptor & 0x04)
+    params.content_size = bool(fcs_flag or single_segment)
+
+
+def _detect_xz(head: bytes, params: CodecParams):
+    """
+    xz stream header: magic(6) flags(2) crc32(4)
+    followed by first block header which has the filter chain.
+    """
+    if len(head) < 13 or not head.startswith(_XZ_MAGIC):
+        return
+    params.check = head[7] & 0x0f
+
+    hdr_size = (head[12] + 1) * 4
+    block_hdr = head[12:12 + hdr_size]
+    if len(block_hdr) < hdr_size:
+        return
+
+    block_flags = block_hdr[1]
+    num_filters = (block_flags & 0x03) + 1
+    pos = 2
+    if block_flags & 0x40:
+        (_size, pos) = _varint_decode(block_hdr, pos)
+    if block_flags & 0x80:
+        (_size, pos) = _varint_decode(block_hdr, pos)
+
+    filters: list[dict[str, Any]] = []
+    for _count in range(num_filters):
+        (filter_id, pos) = _varint_decode(block_hdr, pos)
+        (props_size, pos) = _varint_decode(block_hdr, pos)
+        props = block_hdr[pos:pos + props_size]
+        pos += props_size
+
+        xz_filter = _xz_filter(filter_id, props)
+        if not xz_filter:
+            return
+        filters.append(xz_filter)
+
+    params.filters = filters
+
+
+def _xz_filter(filter_id: int, props: bytes) -> dict[str, Any] | None:
+    """
+    lzma module filter spec from xz filter flags.
+    None if not one we know.
+    """
+    if filter_id == _XZ_FILTER_LZMA2 and len(props) == 1:
+        bits = props[0] & 0x3f
+        if bits > 40:
+            return None
+        if bits == 40:
+            dict_size = 0xffffffff
+        else:
+            dict_size = (2 | (bits & 1)) << (bits // 2 + 11)
+        return {'id': _XZ_FILTER_LZMA2, 'dict_size': dict_size}
+
+    if filter_id in _XZ_FILTERS_BCJ and not props:
+        return {'id': filter_id}
+
+    if filter_id == _XZ_FILTER_DELTA and len(props) == 1:
+        return {'id': _XZ_FILTER_DELTA, 'dist': props[0] + 1}
+
+    return None
+
+
+def _detect_gzip(head: bytes, params: CodecParams):
+    """
+    gzip header: id(2) cm flg mtime(4) xfl os
+    xfl is 2 for max compression (9) and 4 for fastest (1).
+    """
+    if len(head) < 10 or not head.startswith(_GZIP_MAGIC):
+        return
+    params.mtime = struct.unpack_from('<I', head, 4)[0]
+    match head[8]:
+        case 2:
+            params.level = 9
+        case 4:
+            params.level = 1
+        case _:
+            params.level = 6
+
+
+def _varint_decode(data: bytes, pos: int) -> tuple[int, int]:
+    """
+    xz variable length integer.
+    Returns (value, next position)
+    """
+    value = 0
+    shift = 0
+    while pos < len(data):
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return (value, pos)
+
+
+def _varint_encode(value: int) -> bytes:
+    """
+    xz variable length integer.
+    """
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _xz_filters(params: CodecParams) -> list[dict[str, Any]]:
+    """
+    Filter chain to use - applying preset (level) to lzma2.
+    """
+    preset = params.level if params.level is not None else 6
+    if not params.filters:
+        return [{'id': _XZ_FILTER_LZMA2, 'preset': preset}]
+
+    filters = []
+    for xz_filter in params.filters:
+        xz_filter = dict(xz_filter)
+        if xz_filter['id'] == _XZ_FILTER_LZMA2:
+            xz_filter['preset'] = preset
+        filters.append(xz_filter)
+    return filters
+
+
+def codec_errors(fext: str) -> tuple[type[Exception], ...]:
+    """
+    Exceptions (besides OSError and EOFError) codec may raise on bad data.
+    """
+    match fext:
+        case '.zst':
+            import zstandard
+            return (zstandard.ZstdError,)
+        case '.xz':
+            import lzma
+            return (lzma.LZMAError,)
+        case '.gz':
+            return (zlib.error,)
+    return ()
+
+
+def decompress(data: bytes, fext: str) -> bytes:
+    """
+    Decompress whole module.
+    """
+    match fext:
+        case '.zst':
+            import zstandard
+            # decompressobj handles frames without content size
+            dctx = zstandard.ZstdDecompressor()
+            dobj = dctx.decompressobj(read_across_frames=True)
+            return dobj.decompress(data)
+        case '.xz':
+            import lzma
+            return lzma.decompress(data)
+        case '.gz':
+            import gzip
+            return gzip.decompress(data)
+    return data
+
+
+def decompress_reader(fobj: IO, fext: str) -> Any:
+    """
+    File like object returning decompressed data from fobj
+    """
+    match fext:
+        case '.zst':
+            import zstandard
+            dctx = zstandard.ZstdDecompressor()
+            return dctx.stream_reader(fobj, read_across_frames=True,
+                                      closefd=False)
+        case '.xz':
+            import lzma
+            return lzma.LZMAFile(fobj, 'rb')
+        case '.gz':
+            import gzip
+            return gzip.GzipFile(fileobj=fobj, mode='rb')
+    return fobj
+
+
+def _zstd_compressor(params: CodecParams,
+                     content_size: bool = True) -> Any:
+    """
+    zstd compressor per params
+    """
+    import zstandard
+    kwargs: dict[str, Any] = {
+            'write_checksum': params.checksum,
+            'write_content_size': params.content_size and content_size,
+            'threads': params.threads if params.threads > 1 else 0,
+            }
+    if params.level is not None:
+        kwargs['level'] = params.level
+    return zstandard.ZstdCompressor(**kwargs)
+
+
+def compress(data: bytes, params: CodecParams) -> bytes:
+    """
+    Compress data per params.
+    """
+    match params.fext:
+        case '.zst':
+            return _zstd_compressor(params).compress(data)
+
+        case '.xz':
+            import lzma
+            filters = _xz_filters(params)
+            if params.threads > 1:
+                return _xz_compress_mt(data, params.check, filters,
+                                       params.threads)
+            return lzma.compress(data, check=params.check, filters=filters)
+
+        case '.gz':
+            import gzip
+            level = params.level if params.level is not None else 6
+            return gzip.compress(data, compresslevel=level,
+                                 mtime=params.mtime)
+    return data
+
+
+def compress_writer(fobj: IO, params: CodecParams) -> Any:
+    """
+    File like object compressing data written to it into fobj
+    """
+    match params.fext:
+        case '.zst':
+            cctx = _zstd_compressor(params, content_size=False)
+            return cctx.stream_writer(fobj, closefd=False)
+
+        case '.xz':
+            import lzma
+            filters = _xz_filters(params)
+            if params.threads > 1:
+                return XzBlockWriter(fobj, params.check, filters,
+                                     params.threads)
+            return lzma.LZMAFile(fobj, 'wb', check=params.check,
+                                 filters=filters)
+
+        case '.gz':
+            import gzip
+            level = params.level if params.level is not None else 6
+            return gzip.GzipFile(filename='', fileobj=fobj, mode='wb',
+                                 compresslevel=level, mtime=params.mtime)
+    return fobj
+
+
+def _xz_compress_mt(data: bytes, check: int, filters: list[dict[str, Any]],
+                    threads: int) -> bytes:
+    """
+    Multi-threaded xz compression (in memory).
+    """
+    out = io.BytesIO()
+    writer = XzBlockWriter(out, check, filters, threads)
+    writer.write(data)
+    writer.close()
+    return out.getvalue()
+
+
+class XzBlockWriter:
+    """
+    Write a single xz stream made of independently compressed
+    blocks, compressed in parallel.
+
+    At most threads blocks are in flight, so memory is bounded by
+    roughly 2 x threads x block_size.
+    Public methods: write(), close(), abort()
+    """
+    def __init__(self, fobj: Any, check: int,
+                 filters: list[dict[str, Any]], threads: int):
+        self.fobj = fobj
+        self.check: int = check
+        self.filters: list[dict[str, Any]] = filters
+        self.threads: int = max(threads, 1)
+
+        #
+        # Same default block size as xz: 3 x dict size (>= 1 MiB)
+        #
+        dict_size = 8 * 1024 * 1024
+        for xz_filter in filters:
+            if xz_filter['id'] == _XZ_FILTER_LZMA2:
+                dict_size = xz_filter.get('dict_size', dict_size)
+        self.block_size: int = max(3 * dict_size, 1024 * 1024)
+
+        self._buf = bytearray()
+        self._pending: list['Future'] = []
+        self._records: list[tuple[int, int]] = []
+        from concurrent.futures import ThreadPoolExecutor
+        self._pool = ThreadPoolExecutor(max_workers=self.threads)
+
+        flags = bytes([0, check])
+        self.fobj.write(_XZ_MAGIC + flags + _crc32(flags))
+
+    def write(self, data: bytes | memoryview) -> int:
+        """
+        Add data.
+        """
+        self._buf += data
+        while len(self._buf) >= self.block_size:
+            block = bytes(self._buf[:self.block_size])
+            del self._buf[:self.block_size]
+            self._submit(block)
+        return len(data)
+
+    def close(self):
+        """
+        Flush remaining data and write index and footer
+        """
+        if self._buf:
+            self._submit(bytes(self._buf))
+            self._buf = bytearray()
+
+        while self._pending:
+            self._write_block(self._pending.pop(0).result())
+        self._pool.shutdown()
+
+        index = bytearray(b'\x00')
+        index += _varint_encode(len(self._records))
+        for (unpadded, uncompressed) in self._records:
+            index += _varint_encode(unpadded)
+            index += _varint_encode(uncompressed)
+        index += bytes(-len(index) % 4)
+        index += _crc32(bytes(index))
+        self.fobj.write(bytes(index))
+
+        backward = struct.pack('<I', len(index) // 4 - 1)
+        backward += bytes([0, self.check])
+        self.fobj.write(_crc32(backward) + backward + _XZ_FOOTER_MAGIC)
+
+    def abort(self):
+        """
+        Stop without writing anything more - pending blocks dropped
+        """
+        self._buf = bytearray()
+        self._pending = []
+        self._pool.shutdown(cancel_futures=True)
+
+    def _submit(self, block: bytes):
+        """
+        Compress block in pool - keeping output in order.
+        """
+        if len(self._pending) >= self.threads:
+            self._write_block(self._pending.pop(0).result())
+        future = self._pool.submit(_xz_block, block, self.check, self.filters)
+        self._pending.append(future)
+
+    def _write_block(self, result: tuple[bytes, int, int]):
+        """
+        Write one compressed block.
+        """
+        (block, unpadded, uncompressed) = result
+        self.fobj.write(block)
+        self._records.append((unpadded, uncompressed))
+
+
+def _xz_block(data: bytes, check: int,
+              filters: list[dict[str, Any]]) -> tuple[bytes, int, int]:
+    """
+    Compress data into one xz block.
+
+    lzma makes a complete stream with one block. Lift out the block
+    and its index record (unpadded size, uncompressed size).
+    """
+    import lzma
+    stream = lzma.compress(data, format=lzma.FORMAT_XZ, check=check,
+                           filters=filters)
+    footer = stream[-12:]
+    index_size = (struct.unpack_from('<I', footer, 4)[0] + 1) * 4
+    index_start = len(stream) - 12 - index_size
+
+    block = stream[12:index_start]
+    index = stream[index_start:]
+    (_num, pos) = _varint_decode(index, 1)
+    (unpadded, pos) = _varint_decode(index, pos)
+    (uncompressed, pos) = _varint_decode(index, pos)
+    return (block, unpadded, uncompressed)
+
+
+def _crc32(data: bytes) -> bytes:
+    """
+    crc32 as 4 little endian bytes
+    """
+    return struct.pack('<I', zlib.crc32(data))
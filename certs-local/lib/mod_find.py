@@ -0,0 +1,207 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Find kernel modules in a directory (tree).
+
+Modules are yielded as they are found, so signing can start while
+a large tree (e.g. /usr/lib/modules/<kver>/updates) is still being
+scanned. Recursive scans read several directories at a time using
+a few threads - scandir releases the interpreter lock.
+
+Order is the order found, which is not fixed for recursive scans.
+
+Filters (fnmatch style globs) are matched against the path relative
+to the top directory and against the file name:
+    include: only modules matching at least one (default all).
+    exclude: skip matching modules and directories.
+
+Symlinks:
+    skip:   ignore symlinked files and directories (default).
+    follow: follow them. Modules are given by their real path so
+            signing replaces the file, not the link. Each directory
+            and module is visited only once.
+
+one_fs:
+    Do not descend into directories on other file systems.
+"""
+# pylint: disable=import-outside-toplevel
+from typing import (Iterator)
+from dataclasses import (dataclass, field)
+from fnmatch import fnmatch
+import os
+import queue
+import sys
+
+MODULE_EXTS = ('.ko', '.ko.zst', '.ko.xz', '.ko.gz')
+_SCAN_THREADS = 4
+
+
+@dataclass
+class FindOpts:
+    """
+    How to look for modules - see module doc.
+    """
+    recursive: bool = False
+    include: list[str] = field(default_factory=list)
+    exclude: list[str] = field(default_factory=list)
+    follow_symlinks: bool = False
+    one_fs: bool = False
+
+
+def _matches(rel_path: str, globs: list[str]) -> bool:
+    """
+    True if relative path or its file name matches any glob
+    """
+    name = os.path.basename(rel_path)
+    for glob in globs:
+        if fnmatch(rel_path, glob) or fnmatch(name, glob):
+            return True
+    return False
+
+
+#
+# Results of scanning one directory.
+#   ('mod', path, (dev, ino))
+#   ('dir', path, (dev, ino))
+#   ('done', dir, None)
+#
+type _Found = tuple[str, str, tuple[int, int] | None]
+
+
+def _scan_dir(top: str, path: str, opts: FindOpts, top_dev: int,
+              found: 'queue.SimpleQueue[_Found]'):
+    """
+    Read one directory - reporting modules and sub directories.
+    """
+    try:
+        with os.scandir(path) as scan:
+            for entry in scan:
+                _check_entry(top, entry, opts, top_dev, found)
+    except OSError as err:
+        print(f'Error scanning directory {path}: {err}', file=sys.stderr)
+    found.put(('done', path, None))
+
+
+def _entry_kind(entry: os.DirEntry, follow: bool) -> str:
+    """
+    'dir', 'mod' or '' for anything else.
+    """
+    try:
+        if entry.is_symlink() and not follow:
+            return ''
+        if entry.is_dir(follow_symlinks=follow):
+            return 'dir'
+        if entry.name.endswith(MODULE_EXTS) \
+                and entry.is_file(follow_symlinks=follow):
+            return 'mod'
+    except OSError:
+        pass
+    return ''
+
+
+def _entry_stat(entry: os.DirEntry, follow: bool) -> os.stat_result | None:
+    """
+    stat of entry or None on error.
+    """
+    try:
+        return entry.stat(follow_symlinks=follow)
+    except OSError:
+        return None
+
+
+def _check_entry(top: str, entry: os.DirEntry, opts: FindOpts, top_dev: int,
+                 found: 'queue.SimpleQueue[_Found]'):
+    """
+    Report entry if it's a module or a directory to scan.
+    """
+    follow = opts.follow_symlinks
+    kind = _entry_kind(entry, follow)
+    if not kind or (kind == 'dir' and not opts.recursive):
+        return
+
+    rel_path = os.path.relpath(entry.path, top)
+    if opts.exclude and _matches(rel_path, opts.exclude):
+        return
+
+    if kind == 'mod' and opts.include and not _matches(rel_path, opts.include):
+        return
+
+    #
+    # (dev, ino) is needed to spot loops and duplicates when following
+    # symlinks and to spot other file systems.
+    #
+    ident = None
+    if follow or (kind == 'dir' and opts.one_fs):
+        stat = _entry_stat(entry, follow)
+        if not stat:
+            return
+        if kind == 'dir' and opts.one_fs and stat.st_dev != top_dev:
+            return
+        ident = (stat.st_dev, stat.st_ino)
+
+    path = entry.path
+    if kind == 'mod' and follow and entry.is_symlink():
+        path = os.path.realpath(path)
+    found.put((kind, path, ident))
+
+
+def find_modules(mdir: str, opts: FindOpts | None = None) -> Iterator[str]:
+    """
+    Modules in mdir (and below if recursive).
+
+    Args:
+        mdir (str):
+        Directory to search. Should exist.
+
+        opts (FindOpts | None):
+        How to search.
+
+    Yields:
+        str:
+        Path of each module found.
+    """
+    opts = opts if opts else FindOpts()
+    top = os.path.abspath(mdir)
+    try:
+        top_stat = os.stat(top)
+    except OSError as err:
+        print(f'Error scanning directory {top}: {err}', file=sys.stderr)
+        return
+
+    #
+    # Recursive scans read directories in a few threads, while only
+    # this (consumer) side decides what to scan next and what has been
+    # seen - so no locking is needed.
+    #
+    found: 'queue.SimpleQueue[_Found]' = queue.SimpleQueue()
+    seen: set[tuple[int, int]] = {(top_stat.st_dev, top_stat.st_ino)}
+    pool = None
+    if opts.recursive:
+        from concurrent.futures import ThreadPoolExecutor
+        pool = ThreadPoolExecutor(max_workers=_SCAN_THREADS)
+        pool.submit(_scan_dir, top, top, opts, top_stat.st_dev, found)
+    else:
+        _scan_dir(top, top, opts, top_stat.st_dev, found)
+
+    try:
+        pending = 1
+        while pending:
+            (kind, path, ident) = found.get()
+            if ident:
+                if ident in seen:
+                    continue
+                seen.add(ident)
+
+            match kind:
+                case 'mod':
+                    yield path
+                case 'dir':
+                    if pool:
+                        pending += 1
+                        pool.submit(_scan_dir, top, path, opts,
+                                    top_stat.st_dev, found)
+                case 'done':
+                    pending -= 1
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
@@ -0,0 +1,67 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Module information (.modinfo).
+
+The .modinfo section holds NUL terminated key=value strings, among
+them vermagic - the kernel release a module was built for followed
+by build options:
+
+    vermagic=6.14.7-stable-1 SMP preempt mod_unload
+
+This is found by looking for the 'vermagic=' string rather than by
+parsing the ELF section table, so the same search works on a
+decompressed stream of a large module without holding it all in
+memory. Symbols such as __UNIQUE_ID_vermagic123 have no '='.
+"""
+from typing import IO
+
+from .mod_codec import decompress_reader
+
+_VERMAGIC = b'vermagic='
+_VERMAGIC_MAX = 256
+
+
+def vermagic(data: bytes | memoryview) -> str:
+    """
+    vermagic string of (uncompressed) module.
+
+    Returns:
+        str:
+        Empty if not found.
+    """
+    data = bytes(data) if isinstance(data, memoryview) else data
+    start = data.find(_VERMAGIC)
+    if start < 0:
+        return ''
+    start += len(_VERMAGIC)
+    end = data.find(b'\0', start, start + _VERMAGIC_MAX)
+    if end < 0:
+        return ''
+    return data[start:end].decode('utf-8', 'replace')
+
+
+def kernel_release(magic: str) -> str:
+    """
+    Kernel release from vermagic string e.g. 6.14.7-stable-1
+    """
+    parts = magic.split()
+    return parts[0] if parts else ''
+
+
+def stream_vermagic(fobj: IO, fext: str, bufsize: int) -> str:
+    """
+    vermagic string from (compressed) module file object.
+
+    Reads only as far as needed, keeping chunk overlap in case
+    the string spans two chunks.
+    """
+    reader = decompress_reader(fobj, fext)
+    prev = b''
+    while chunk := reader.read(bufsize):
+        window = prev + chunk
+        magic = vermagic(window)
+        if magic:
+            return magic
+        prev = window[-(_VERMAGIC_MAX + len(_VERMAGIC)):]
+    return ''
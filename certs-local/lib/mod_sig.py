@@ -0,0 +1,109 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Appended module signature layout.
+
+A signed module is:
+
+    [module][signature][struct module_signature][magic]
+
+struct module_signature (12 bytes):
+    u8 algo, u8 hash, u8 id_type, u8 signer_len, u8 key_id_len,
+    u8 pad[3], be32 sig_len
+
+magic is the 28 byte string "~Module signature appended~\\n"
+
+For PKCS#7 signatures (the only kind the kernel now accepts)
+id_type is PKEY_ID_PKCS7 and everything except sig_len is zero.
+Same check the kernel does in mod_check_sig().
+"""
+import struct
+
+MODULE_SIG_MAGIC = b'~Module signature appended~\n'
+MODULE_SIG_STRUCT = struct.Struct('>BBBBB3sI')
+MODULE_SIG_TRAILER_LEN = MODULE_SIG_STRUCT.size + len(MODULE_SIG_MAGIC)
+PKEY_ID_PKCS7 = 2
+
+
+def sig_trailer(size: int) -> bytes:
+    """
+    struct module_signature followed by magic string.
+
+    Args:
+        size (int):
+        Length of the PKCS#7 signature it follows.
+    """
+    sig_info = MODULE_SIG_STRUCT.pack(0, 0, PKEY_ID_PKCS7, 0, 0,
+                                      b'\0\0\0', size)
+    return sig_info + MODULE_SIG_MAGIC
+
+
+def sig_len(data: bytes | memoryview) -> int:
+    """
+    Length of appended signature.
+
+    Returns:
+        int:
+        -1 if data has no valid appended signature, otherwise the
+        number of bytes of signature (excluding the trailer).
+    """
+    size = len(data)
+    if size < MODULE_SIG_TRAILER_LEN:
+        return -1
+
+    if data[size - len(MODULE_SIG_MAGIC):] != MODULE_SIG_MAGIC:
+        return -1
+
+    start = size - MODULE_SIG_TRAILER_LEN
+    (algo, khash, id_type, signer_len, key_id_len, pad, slen) = \
+        MODULE_SIG_STRUCT.unpack_from(data, start)
+
+    if id_type != PKEY_ID_PKCS7:
+        return -1
+
+    if algo or khash or signer_len or key_id_len or any(pad):
+        return -1
+
+    if slen == 0 or slen > start:
+        return -1
+
+    return slen
+
+
+def unsigned_len(data: bytes | memoryview) -> int:
+    """
+    Length of module without any appended signature(s).
+    """
+    size = len(data)
+    while True:
+        slen = sig_len(data[:size])
+        if slen < 0:
+            return size
+        size -= slen + MODULE_SIG_TRAILER_LEN
+
+
+def is_signed(data: bytes | memoryview) -> bool:
+    """
+    True if data ends with a valid appended signature.
+    """
+    return sig_len(data) >= 0
+
+
+def strip_sig(data: bytes) -> memoryview:
+    """
+    Remove appended signature(s).
+    Returns a view of the unsigned module - no copy is made.
+    """
+    view = memoryview(data)
+    return view[:unsigned_len(view)]
+
+
+def sig_bytes(data: bytes | memoryview) -> bytes:
+    """
+    The (last) appended PKCS#7 signature or empty if not signed.
+    """
+    slen = sig_len(data)
+    if slen < 0:
+        return b''
+    end = len(data) - MODULE_SIG_TRAILER_LEN
+    return bytes(data[end - slen:end])
@@ -0,0 +1,59 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+What was done to one module and where the time went.
+
+Stage times (secs) are recorded by ModuleTool as it works:
+    sniff:      read start of file to find format
+    check:      read existing signature to see if key is current
+    read:       read module file
+    decompress: decompress module
+    strip:      find and remove existing signature
+    sign:       sign module (in process or sign-file)
+    compress:   recompress signed module
+    write:      write temp file
+    rename:     rename temp file over module
+    stream:     streamed modules: everything from read to rename
+
+Only stages actually done are present.
+
+progs holds the resource use of each external program run
+(ProgResult.usage()) - i.e. sign-file.
+"""
+# pylint: disable=too-many-instance-attributes
+from typing import (Any, Iterator)
+from contextlib import contextmanager
+from dataclasses import (dataclass, field)
+import time
+
+
+@dataclass
+class ModuleStats:
+    """
+    Stage timings and sizes for one module.
+
+    codec is the format found ('.ko' for uncompressed).
+    signer is 'native' or 'sign-file'.
+    sign_rc is the sign-file exit status (None if not run).
+    """
+    codec: str = ''
+    bytes_in: int = 0
+    bytes_out: int = 0
+    stripped: bool = False
+    streamed: bool = False
+    signer: str = ''
+    sign_rc: int | None = None
+    stages: dict[str, float] = field(default_factory=dict)
+    progs: list[dict[str, Any]] = field(default_factory=list)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time the with block - added to any earlier time for name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            secs = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + secs
@@ -0,0 +1,229 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Streaming module signing for large modules.
+
+Module is read, decompressed, hashed, recompressed and written in
+chunks so memory use is bounded by the buffer size rather than
+the size of the module:
+
+  read -> decompress -> [hold back tail] -> hash + compress -> write
+
+Any existing signature sits at the very end of the module. The last
+SIG_HOLD bytes are therefore held back until the end of the input is
+reached, at which point any signature is cut off using the trailer.
+The signature is then made from the digest and appended.
+
+Needs the in process signer as signing uses the incrementally
+computed digest.
+"""
+from typing import (TYPE_CHECKING, Any)
+import os
+import uuid
+
+from .mod_codec import (ELF_MAGIC, CodecParams, codec_errors,
+                        compress_writer, decompress_reader)
+from .mod_sig import (sig_trailer, unsigned_len)
+from .mod_stats import ModuleStats
+from .utils import (open_file, remove_file)
+
+if TYPE_CHECKING:
+    from .native_signer import NativeSigner
+
+#
+# Largest signature (plus trailer) that can be stripped.
+# Module signatures are typically well under 1k.
+#
+SIG_HOLD = 64 * 1024
+
+
+def read_tail(fext: str, mod_path: str, bufsize: int) -> bytes | None:
+    """
+    Last SIG_HOLD bytes of the (decompressed) module.
+
+    Uncompressed modules are read from the end. Compressed ones
+    have to be decompressed, but nothing is kept except the tail.
+
+    Returns:
+        bytes | None:
+        None if module could not be read.
+    """
+    fobj = open_file(mod_path, 'rb')
+    if not fobj:
+        return None
+
+    tail = bytearray()
+    errors = (OSError, EOFError) + codec_errors(fext)
+    try:
+        if fext == '.ko':
+            fobj.seek(0, os.SEEK_END)
+            fobj.seek(max(fobj.tell() - SIG_HOLD, 0))
+            tail += fobj.read()
+        else:
+            with decompress_reader(fobj, fext) as reader:
+                while chunk := reader.read(bufsize):
+                    tail += chunk
+                    if len(tail) > SIG_HOLD + bufsize:
+                        del tail[:-SIG_HOLD]
+
+    except errors:
+        return None
+
+    finally:
+        fobj.close()
+
+    return bytes(tail[-SIG_HOLD:])
+
+
+class _HashWriter:
+    """
+    Pass writes on to fobj, adding them to hasher.
+    """
+    def __init__(self, fobj: Any, hasher: Any):
+        self.fobj = fobj
+        self.hasher = hasher
+
+    def write(self, data: bytes | memoryview) -> int:
+        """
+        Hash and write data.
+        """
+        self.hasher.update(data)
+        return self.fobj.write(data)
+
+    def flush(self):
+        """
+        Flush fobj.
+        """
+        self.fobj.flush()
+
+
+def _copy_unsigned(reader: Any, writer: Any, hasher: Any, bufsize: int,
+                   first: bytes) -> bool:
+    """
+    Copy decompressed data, starting with first chunk already read,
+    from reader to writer (and hasher) dropping any existing
+    signature at the end.
+
+    Returns:
+        bool:
+        True if a signature was dropped.
+    """
+    tail = bytearray(first)
+    while chunk := reader.read(bufsize):
+        tail += chunk
+        if len(tail) > SIG_HOLD + bufsize:
+            emit = len(tail) - SIG_HOLD
+            with memoryview(tail) as view:
+                hasher.update(view[:emit])
+                writer.write(view[:emit])
+            del tail[:emit]
+
+    with memoryview(tail) as view:
+        keep = unsigned_len(view)
+        with view[:keep] as unsigned:
+            hasher.update(unsigned)
+            writer.write(unsigned)
+    return keep < len(tail)
+
+
+def sign_stream(native: 'NativeSigner', mod_path: str, codec: CodecParams,
+                bufsize: int, stats: ModuleStats | None = None,
+                out_hash: Any = None) -> tuple[bool, str]:
+    """
+    Sign module using bounded memory.
+
+    Args:
+        native (NativeSigner):
+        In process signer.
+
+        mod_path (str):
+        Module to sign (replaced).
+
+        codec (CodecParams):
+        Compression type and parameters.
+
+        bufsize (int):
+        Size of each read.
+
+        stats (ModuleStats | None):
+        stripped is set if an existing signature was removed.
+
+        out_hash (Any):
+        If given (hashlib object) updated with the bytes written,
+        i.e. the new module file.
+
+    Returns:
+        tuple[okay: bool, msg: str]:
+        msg describes any problem.
+    """
+    # pylint: disable=too-many-locals, too-many-arguments
+    # pylint: disable=too-many-positional-arguments
+    path_temp = os.path.join(os.path.dirname(mod_path), str(uuid.uuid4()))
+
+    fob_in = open_file(mod_path, 'rb')
+    if not fob_in:
+        return (False, 'Failed to read module')
+
+    fob_out = open_file(path_temp, 'wb')
+    if not fob_out:
+        fob_in.close()
+        return (False, 'Failed to write module')
+
+    #
+    # ValueError: e.g. signing failure in cryptography
+    #
+    errors = (OSError, EOFError, ValueError) + codec_errors(codec.fext)
+    done = False
+    out: Any = _HashWriter(fob_out, out_hash) if out_hash else fob_out
+    writer: Any = out
+    try:
+        reader = decompress_reader(fob_in, codec.fext)
+        first = reader.read(bufsize)
+        if not first.startswith(ELF_MAGIC):
+            raise EOFError('Not an ELF module')
+
+        writer = compress_writer(out, codec)
+        hasher = native.new_hash()
+        stripped = _copy_unsigned(reader, writer, hasher, bufsize, first)
+        if stats:
+            stats.stripped = stripped
+
+        sig = native.signature_from_digest(hasher.finalize())
+        writer.write(sig)
+        writer.write(sig_trailer(len(sig)))
+
+        if writer is not out:
+            writer.close()
+        if reader is not fob_in:
+            reader.close()
+        fob_out.close()
+        os.rename(path_temp, mod_path)
+        done = True
+
+    except errors as err:
+        return (False, f'Streaming failed: {err}')
+
+    finally:
+        if not done and writer is not out:
+            _abort_writer(writer, errors)
+        fob_out.close()
+        fob_in.close()
+        if not done:
+            remove_file(path_temp)
+
+    return (True, '')
+
+
+def _abort_writer(writer: Any, errors: tuple):
+    """
+    Release compress writer after a failure - output is discarded.
+    XzBlockWriter stops its thread pool, others are closed.
+    """
+    abort = getattr(writer, 'abort', None)
+    try:
+        if abort:
+            abort()
+        else:
+            writer.close()
+    except errors:
+        pass
@@ -0,0 +1,358 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Verify module signatures in process.
+
+Each module is read (and decompressed), the appended signature
+trailer and PKCS#7 blob parsed, and the signature checked against
+the key that signed it - the current key or any earlier key still
+in certs-local/<date>/. This is the same check the kernel does
+when loading the module.
+
+Result status:
+    valid:    signed by current key
+    stale:    signed by an earlier key of ours
+    unsigned: no appended signature
+    unknown:  signed by a key that is not ours
+    invalid:  signed by one of our keys but signature does not
+              match module (corrupted or modified)
+    error:    module could not be read or signature not parsed
+
+Modules are checked in parallel using a thread pool - reading,
+decompression and hashing, most of the work, are done outside
+of the python interpreter lock.
+
+Requires python cryptography module.
+"""
+# pylint: disable=import-outside-toplevel
+from typing import (Any, Iterable)
+from dataclasses import dataclass
+import hashlib
+import os
+import sys
+import threading
+
+from .der import (TAG_CONTEXT_0, TAG_OCTET_STRING, TAG_OID, TAG_SET,
+                  der_content, der_items, der_oid)
+from .key_index import KeyIndex
+from .mod_codec import (ELF_MAGIC, codec_errors, decompress, sniff_format)
+from .mod_sig import (MODULE_SIG_TRAILER_LEN, sig_len)
+from .native_signer import hash_algo
+from .signer_id import (HASH_OIDS, SignerId, cert_signer_id, signer_info,
+                        sig_signer_id)
+from .utils import open_file
+
+try:
+    from cryptography import x509
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives.asymmetric import (ec, rsa, padding)
+    from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+    HAVE_CRYPTO = True
+
+except ImportError:
+    HAVE_CRYPTO = False
+
+VERIFY_STATUS = ('valid', 'stale', 'unsigned', 'unknown', 'invalid', 'error')
+
+_OID_MESSAGE_DIGEST = der_oid('1.2.840.113549.1.9.4')
+_DIGEST_KHASH = {der_oid(oids[0]): khash
+                 for (khash, oids) in HASH_OIDS.items()}
+
+
+@dataclass
+class KeyCert:
+    """
+    One of our signing certificates.
+
+    name is the key directory (e.g. 20250101-1200).
+    """
+    name: str
+    crt_path: str
+    current: bool
+    signer_id: SignerId
+    public_key: Any
+
+
+@dataclass
+class VerifyResult:
+    """ Outcome of verifying one module """
+    mod_path: str
+    status: str = 'error'
+    key: str = ''
+    msg: str = ''
+
+
+def load_keys(cert_dir: str) -> list[KeyCert]:
+    """
+    Certificates of every key directory in cert_dir - current first.
+
+    Args:
+        cert_dir (str):
+        The certs-local directory.
+    """
+    current = os.path.realpath(os.path.join(cert_dir, 'current'))
+    keys: list[KeyCert] = []
+    try:
+        entries = sorted(os.scandir(cert_dir), key=lambda entry: entry.name,
+                         reverse=True)
+    except OSError as err:
+        print(f'Error reading {cert_dir}: {err}', file=sys.stderr)
+        return keys
+
+    for entry in entries:
+        if entry.is_symlink() or not entry.is_dir():
+            continue
+        crt_path = os.path.join(entry.path, 'signing_crt.crt')
+        key = _load_cert(entry.name, crt_path,
+                         os.path.realpath(entry.path) == current)
+        if key:
+            keys.append(key)
+
+    keys.sort(key=lambda key: not key.current)
+    return keys
+
+
+def _load_cert(name: str, crt_path: str, current: bool) -> KeyCert | None:
+    """
+    Read certificate - None if missing or not usable.
+    """
+    if not os.path.exists(crt_path):
+        return None
+
+    signer_id = cert_signer_id(crt_path)
+    fobj = open_file(crt_path, 'rb')
+    if not (signer_id and fobj):
+        return None
+    crt_data = fobj.read()
+    fobj.close()
+
+    try:
+        if crt_data.startswith(b'-----'):
+            cert = x509.load_pem_x509_certificate(crt_data)
+        else:
+            cert = x509.load_der_x509_certificate(crt_data)
+        public_key = cert.public_key()
+    except ValueError as err:
+        print(f'Failed loading {crt_path}: {err}', file=sys.stderr)
+        return None
+
+    return KeyCert(name, crt_path, current, signer_id, public_key)
+
+
+def _read_module(mod_path: str) -> tuple[bytes | None, str]:
+    """
+    Uncompressed module.
+
+    Returns:
+        tuple[data: bytes | None, msg: str]
+    """
+    fobj = open_file(mod_path, 'rb')
+    if not fobj:
+        return (None, 'Failed to read module')
+    raw_data = fobj.read()
+    fobj.close()
+
+    fmt = sniff_format(raw_data[:8])
+    if not fmt:
+        return (None, 'Not a kernel module (unknown format)')
+
+    try:
+        data = decompress(raw_data, fmt)
+    except (OSError, EOFError) + codec_errors(fmt) as err:
+        return (None, f'Failed to decompress: {err}')
+
+    if not data.startswith(ELF_MAGIC):
+        return (None, 'Not an ELF module')
+    return (data, '')
+
+
+def _signed_attrs_okay(attrs: bytes, digest: bytes) -> bool:
+    """
+    Signed attributes must hold the module digest (messageDigest).
+    """
+    for (_tag, attr) in der_items(der_content(attrs)):
+        parts = der_items(der_content(attr))
+        if len(parts) == 2 and parts[0] == (TAG_OID, _OID_MESSAGE_DIGEST):
+            values = der_items(der_content(parts[1][1]))
+            return bool(values) and values[0][0] == TAG_OCTET_STRING \
+                and der_content(values[0][1]) == digest
+    return False
+
+
+def _check_signature(key: KeyCert, sig: bytes, sig_id: SignerId,
+                     content: memoryview) -> str:
+    """
+    Verify PKCS#7 signature of content with key.
+
+    Returns:
+        str:
+        Empty if good, otherwise what's wrong.
+    """
+    info = signer_info(sig)
+    khash = _DIGEST_KHASH.get(sig_id.digest_oid, '')
+    if not khash:
+        return 'Unsupported digest algorithm'
+
+    # [0] signedAttrs (optional) then signatureAlgorithm, signature
+    rest = info[3:]
+    attrs = b''
+    if rest and rest[0][0] == TAG_CONTEXT_0:
+        attrs = rest[0][1]
+        rest = rest[1:]
+    if len(rest) < 2 or rest[1][0] != TAG_OCTET_STRING:
+        return 'Bad signature format'
+    sig_value = der_content(rest[1][1])
+
+    digest = hashlib.new(khash.replace('-', '_'), content).digest()
+    algo = hash_algo(khash)
+    signed: bytes = digest
+    if attrs:
+        #
+        # Signature is then over the attributes (as a SET)
+        #
+        if not _signed_attrs_okay(attrs, digest):
+            return 'Module digest mismatch'
+        signed = hashlib.new(khash.replace('-', '_'),
+                             bytes([TAG_SET]) + attrs[1:]).digest()
+
+    prehashed = Prehashed(algo)
+    try:
+        if isinstance(key.public_key, rsa.RSAPublicKey):
+            key.public_key.verify(sig_value, signed, padding.PKCS1v15(),
+                                  prehashed)
+        elif isinstance(key.public_key, ec.EllipticCurvePublicKey):
+            key.public_key.verify(sig_value, signed, ec.ECDSA(prehashed))
+        else:
+            return 'Unsupported key type'
+    except (InvalidSignature, ValueError):
+        return 'Signature does not match module'
+    return ''
+
+
+class ModuleVerifier:
+    """
+    Checks module signatures against our keys.
+    Public methods: verify(), verify_modules()
+
+    With a key index (see key_index) the key of each signature is
+    looked up there and only certificates actually needed are loaded.
+    Without one, or for a signer not in it, all certificates are
+    loaded (once) and searched.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, cert_dir: str):
+        self.okay: bool = False
+        self.msg: str = ''
+        self.cert_dir: str = cert_dir
+        self.keys: list[KeyCert] = []
+
+        self._index = KeyIndex(cert_dir)
+        self._loaded: dict[str, KeyCert | None] = {}
+        self._all_loaded: bool = False
+        self._lock = threading.Lock()
+
+        if not HAVE_CRYPTO:
+            self.msg = 'python cryptography module not available'
+            return
+
+        (self._current, entry) = self._index.current()
+        if entry:
+            self.okay = True
+            return
+
+        self._load_all()
+        if not self.keys:
+            self.msg = f'No signing certificates found in {cert_dir}'
+            return
+        self.okay = True
+
+    def _load_all(self):
+        """
+        Load every certificate in cert_dir.
+        """
+        with self._lock:
+            if not self._all_loaded:
+                self.keys = load_keys(self.cert_dir)
+                self._all_loaded = True
+
+    def _load_key(self, name: str) -> KeyCert | None:
+        """
+        Certificate of indexed key directory name - loaded once.
+        """
+        with self._lock:
+            if name not in self._loaded:
+                crt_path = os.path.join(self.cert_dir, name,
+                                        'signing_crt.crt')
+                self._loaded[name] = _load_cert(name, crt_path,
+                                                name == self._current)
+            return self._loaded[name]
+
+    def _find_key(self, sig_id: SignerId) -> KeyCert | None:
+        """
+        Our key that made signature (ignoring hash).
+        """
+        name = self._index.find(sig_id)
+        if name:
+            key = self._load_key(name)
+            if key:
+                return key
+
+        self._load_all()
+        for key in self.keys:
+            if key.signer_id.matches(SignerId(sig_id.issuer_serial,
+                                              sig_id.skid)):
+                return key
+        return None
+
+    def verify(self, mod_path: str) -> VerifyResult:
+        """
+        Verify signature of one module.
+        """
+        result = VerifyResult(mod_path)
+        (data, result.msg) = _read_module(mod_path)
+        if data is None:
+            return result
+
+        slen = sig_len(data)
+        if slen < 0:
+            result.status = 'unsigned'
+            return result
+
+        end = len(data) - MODULE_SIG_TRAILER_LEN
+        sig = data[end - slen:end]
+        content = memoryview(data)[:end - slen]
+
+        sig_id = sig_signer_id(sig)
+        if not sig_id:
+            result.msg = 'Failed to parse signature'
+            return result
+
+        key = self._find_key(sig_id)
+        if not key:
+            result.status = 'unknown'
+            return result
+
+        result.key = key.name
+        result.msg = _check_signature(key, sig, sig_id, content)
+        if result.msg:
+            result.status = 'invalid'
+        else:
+            result.status = 'valid' if key.current else 'stale'
+        return result
+
+    def verify_modules(self, modules: Iterable[str], jobs: int = 1
+                       ) -> list[VerifyResult]:
+        """
+        Verify modules using up to jobs threads.
+
+        Returns:
+            list[VerifyResult]:
+            One result per module in same order as modules.
+        """
+        if jobs <= 1:
+            return [self.verify(mod) for mod in modules]
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(self.verify, modules))
+        return results
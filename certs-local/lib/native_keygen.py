@@ -0,0 +1,244 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+In process key generation.
+
+Makes the same key and self signed certificate as:
+
+    openssl req -new -nodes -utf8 -<khash> -days <kvalid> -batch -x509
+                -config x509.oot.genkey [-newkey ec ... secp384r1]
+
+followed by 'openssl pkey' and 'openssl x509 -outform der', in one
+process and without writing and re-reading files in between.
+
+Subject and extensions are taken from x509.oot.genkey. Only what
+that file uses is understood: default_bits, the distinguished name
+and basicConstraints, keyUsage, extendedKeyUsage,
+subjectKeyIdentifier=hash and authorityKeyIdentifier=keyid.
+Anything else and make_keys_native() returns False so caller can
+fall back to openssl.
+
+Requires python cryptography module.
+"""
+from typing import (TYPE_CHECKING, Any)
+from datetime import (datetime, timedelta, timezone)
+import os
+
+from .native_signer import hash_algo
+from .utils import (open_file, write_file_atomic)
+
+try:
+    from cryptography import x509
+    from cryptography.x509.oid import (ExtendedKeyUsageOID, NameOID)
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import (ec, rsa)
+    HAVE_CRYPTO = True
+
+except ImportError:
+    HAVE_CRYPTO = False
+
+if TYPE_CHECKING:
+    from .make_keys import KeyInfo
+
+# openssl keyUsage names -> cryptography KeyUsage args
+_KEY_USAGE = {'digitalSignature': 'digital_signature',
+              'nonRepudiation': 'content_commitment',
+              'keyEncipherment': 'key_encipherment',
+              'dataEncipherment': 'data_encipherment',
+              'keyAgreement': 'key_agreement',
+              'keyCertSign': 'key_cert_sign',
+              'cRLSign': 'crl_sign',
+              'encipherOnly': 'encipher_only',
+              'decipherOnly': 'decipher_only'}
+
+
+def read_genkey(path: str) -> dict[str, dict[str, str]]:
+    """
+    Read openssl config file (x509.oot.genkey).
+
+    Returns:
+        dict[str, dict[str, str]]:
+        section -> {name: value}. Empty if not readable.
+    """
+    conf: dict[str, dict[str, str]] = {}
+    fobj = open_file(path, 'r')
+    if not fobj:
+        return conf
+    lines = fobj.readlines()
+    fobj.close()
+
+    section = conf.setdefault('', {})
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            section = conf.setdefault(line[1:-1].strip(), {})
+        elif '=' in line:
+            (name, value) = line.split('=', 1)
+            section[name.strip()] = value.strip()
+    return conf
+
+
+def _subject(fields: dict[str, str]) -> Any:
+    """
+    x509 Name from distinguished name section - None if not understood.
+    """
+    oids = {'CN': NameOID.COMMON_NAME,
+            'commonName': NameOID.COMMON_NAME,
+            'O': NameOID.ORGANIZATION_NAME,
+            'OU': NameOID.ORGANIZATIONAL_UNIT_NAME,
+            'C': NameOID.COUNTRY_NAME,
+            'ST': NameOID.STATE_OR_PROVINCE_NAME,
+            'L': NameOID.LOCALITY_NAME,
+            'emailAddress': NameOID.EMAIL_ADDRESS}
+    attrs = []
+    for (name, value) in fields.items():
+        if name not in oids:
+            return None
+        attrs.append(x509.NameAttribute(oids[name], value))
+    return x509.Name(attrs) if attrs else None
+
+
+def _extensions(exts: dict[str, str], public_key: Any
+                ) -> list[tuple[Any, bool]] | None:
+    """
+    Extensions (value, critical) - None if any not understood.
+    """
+    ski = x509.SubjectKeyIdentifier.from_public_key(public_key)
+    eku_oids = {'codeSigning': ExtendedKeyUsageOID.CODE_SIGNING}
+    result: list[tuple[Any, bool]] = []
+    for (name, value) in exts.items():
+        items = [item.strip() for item in value.split(',')]
+        critical = items[0] == 'critical'
+        if critical:
+            items = items[1:]
+
+        ext: Any = None
+
+        match name:
+            case 'basicConstraints' if items == ['CA:FALSE']:
+                ext = x509.BasicConstraints(ca=False, path_length=None)
+
+            case 'keyUsage':
+                if not set(items) <= set(_KEY_USAGE):
+                    return None
+                ext = x509.KeyUsage(**{arg: name in items
+                                       for (name, arg) in _KEY_USAGE.items()})
+
+            case 'extendedKeyUsage':
+                if not set(items) <= set(eku_oids):
+                    return None
+                ext = x509.ExtendedKeyUsage([eku_oids[item]
+                                             for item in items])
+
+            case 'subjectKeyIdentifier' if items == ['hash']:
+                ext = ski
+
+            case 'authorityKeyIdentifier' if items == ['keyid']:
+                # self signed - authority is us
+                ext = x509.AuthorityKeyIdentifier \
+                    .from_issuer_subject_key_identifier(ski)
+
+            case _:
+                return None
+        result.append((ext, critical))
+    return result
+
+
+def make_keys_native(keyinfo: 'KeyInfo') -> bool:
+    """
+    Make key and certificate files in process.
+
+    Args:
+        keyinfo (KeyInfo):
+        What to make and where (see make_keys).
+
+    Returns:
+        bool:
+        False if not made - python cryptography not available,
+        x509.oot.genkey uses something not supported, bad key size or
+        days or failed writing.
+    """
+    if not HAVE_CRYPTO or keyinfo.ktype not in ('ec', 'rsa'):
+        return False
+
+    algo = hash_algo(keyinfo.khash)
+    conf = read_genkey(keyinfo.kx509)
+    req = conf.get('req', {})
+    subject = _subject(conf.get(req.get('distinguished_name', ''), {}))
+    if not (algo and subject):
+        return False
+
+    made = _key_cert(keyinfo, req, conf, subject, algo)
+    if not made:
+        return False
+    (key, cert) = made
+    return _write_keys(keyinfo, key, cert)
+
+
+def _key_cert(keyinfo: 'KeyInfo', req: dict[str, str],
+              conf: dict[str, dict[str, str]], subject: Any, algo: Any
+              ) -> tuple[Any, Any] | None:
+    """
+    New key and its self signed certificate - None if not made.
+    Bad key size or days (e.g. not a number) are reported.
+    """
+    try:
+        days = int(keyinfo.kvalid)
+        if keyinfo.ktype == 'ec':
+            key: Any = ec.generate_private_key(ec.SECP384R1())
+        else:
+            bits = int(req.get('default_bits', 2048))
+            key = rsa.generate_private_key(65537, bits)
+
+        exts = _extensions(conf.get(req.get('x509_extensions', ''), {}),
+                           key.public_key())
+        if exts is None:
+            return None
+        cert = _self_signed(key, subject, exts, days, algo)
+
+    except (ValueError, OverflowError) as err:
+        print(f'Native key generation failed, using openssl: {err}')
+        return None
+    return (key, cert)
+
+
+def _self_signed(key: Any, subject: Any, exts: list[tuple[Any, bool]],
+                 days: int, algo: Any) -> Any:
+    """
+    Self signed certificate valid from now for days.
+    """
+    now = datetime.now(timezone.utc)
+    builder = x509.CertificateBuilder() \
+        .subject_name(subject) \
+        .issuer_name(subject) \
+        .public_key(key.public_key()) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now) \
+        .not_valid_after(now + timedelta(days=days))
+    for (ext, critical) in exts:
+        builder = builder.add_extension(ext, critical=critical)
+    return builder.sign(key, algo)
+
+
+def _write_keys(keyinfo: 'KeyInfo', key: Any, cert: Any) -> bool:
+    """
+    Write key + cert (pem), private key (pem) and cert (der) files.
+    """
+    prv_pem = key.private_bytes(serialization.Encoding.PEM,
+                                serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption())
+    crt_pem = cert.public_bytes(serialization.Encoding.PEM)
+    crt_der = cert.public_bytes(serialization.Encoding.DER)
+
+    #
+    # Private keys are never visible to others - umask while writing
+    #
+    old_umask = os.umask(0o077)
+    try:
+        okay = (write_file_atomic(keyinfo.kkey, prv_pem + crt_pem)
+                and write_file_atomic(keyinfo.kprv, prv_pem))
+    finally:
+        os.umask(old_umask)
+    return okay and write_file_atomic(keyinfo.kcrt, crt_der)
@@ -0,0 +1,190 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+In process kernel module signing.
+
+Builds the same signature as the kernel scripts/sign-file tool:
+
+    [module][PKCS#7 signature][struct module_signature][magic]
+
+See mod_sig for the trailer layout.
+
+The PKCS#7 (CMS) signature is detached, has no certificates
+and no signed attributes - the signature is computed directly
+over the module digest. This matches sign-file flags:
+    CMS_NOCERTS | CMS_BINARY | CMS_DETACHED | CMS_NOATTR | CMS_NOSMIMECAP
+
+Requires python cryptography module. If not available, or key/hash
+not supported, callers fall back to using sign-file.
+"""
+from typing import (Any)
+
+from .der import (der_seq, der_set, der_explicit, der_int, der_null,
+                  der_octets, der_oid)
+from .mod_sig import sig_trailer
+from .signer_id import HASH_OIDS
+from .utils import open_file
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import (ec, rsa, padding)
+    from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+    HAVE_CRYPTO = True
+
+except ImportError:
+    HAVE_CRYPTO = False
+
+_OID_DATA = '1.2.840.113549.1.7.1'
+_OID_SIGNED_DATA = '1.2.840.113549.1.7.2'
+_OID_RSA = '1.2.840.113549.1.1.1'
+
+
+def hash_algo(khash: str) -> Any:
+    """
+    cryptography hash object for kernel hash name
+    """
+    algos: dict[str, Any] = {
+            'sha1': hashes.SHA1,
+            'sha224': hashes.SHA224,
+            'sha256': hashes.SHA256,
+            'sha384': hashes.SHA384,
+            'sha512': hashes.SHA512,
+            'sha3-256': hashes.SHA3_256,
+            'sha3-384': hashes.SHA3_384,
+            'sha3-512': hashes.SHA3_512,
+            }
+    algo = algos.get(khash)
+    if not algo:
+        return None
+    return algo()
+
+
+def _read_bytes(path: str) -> bytes:
+    """
+    Read file contents
+    """
+    data = b''
+    fobj = open_file(path, 'rb')
+    if fobj:
+        data = fobj.read()
+        fobj.close()
+    return data
+
+
+class NativeSigner:
+    """
+    Signs kernel modules in process.
+
+    Key and certificate are loaded once and re-used
+    for every module.
+    Public methods: sign(), signature(), new_hash(),
+                    signature_from_digest()
+    """
+    def __init__(self, key_path: str, crt_path: str, khash: str):
+        self.okay: bool = False
+        self.msg: str = ''
+        self.khash: str = khash
+
+        self._key: Any = None
+        self._hash: Any = None
+        self._signer_info_head: bytes = b''
+        self._digest_algo: bytes = b''
+
+        if not HAVE_CRYPTO:
+            self.msg = 'python cryptography module not available'
+            return
+
+        if khash not in HASH_OIDS:
+            self.msg = f'Unsupported hash: {khash}'
+            return
+        self._hash = hash_algo(khash)
+
+        #
+        # load key and cert
+        #
+        key_data = _read_bytes(key_path)
+        crt_data = _read_bytes(crt_path)
+        if not (key_data and crt_data):
+            self.msg = 'Failed to read key or certificate'
+            return
+
+        try:
+            self._key = serialization.load_pem_private_key(key_data, None)
+            if crt_data.startswith(b'-----'):
+                cert = x509.load_pem_x509_certificate(crt_data)
+            else:
+                cert = x509.load_der_x509_certificate(crt_data)
+
+        except (ValueError, TypeError) as err:
+            self.msg = f'Failed loading key: {err}'
+            return
+
+        #
+        # Everything except the signature value is the same for every
+        # module - build it once.
+        #
+        (hash_oid, ecdsa_oid) = HASH_OIDS[khash]
+        if isinstance(self._key, rsa.RSAPrivateKey):
+            sig_algo = der_seq(der_oid(_OID_RSA), der_null())
+
+        elif isinstance(self._key, ec.EllipticCurvePrivateKey):
+            sig_algo = der_seq(der_oid(ecdsa_oid))
+
+        else:
+            self.msg = 'Unsupported key type'
+            return
+
+        issuer = cert.issuer.public_bytes()
+        issuer_serial = der_seq(issuer, der_int(cert.serial_number))
+        self._digest_algo = der_seq(der_oid(hash_oid))
+        self._signer_info_head = (der_int(1) + issuer_serial
+                                  + self._digest_algo + sig_algo)
+        self.okay = True
+
+    def _sign_digest(self, digest: bytes) -> bytes:
+        """
+        Sign pre-computed digest
+        """
+        prehashed = Prehashed(self._hash)
+        if isinstance(self._key, rsa.RSAPrivateKey):
+            return self._key.sign(digest, padding.PKCS1v15(), prehashed)
+        return self._key.sign(digest, ec.ECDSA(prehashed))
+
+    def new_hash(self) -> Any:
+        """
+        Hash object for incremental digest of module data.
+        Use update() for each chunk and finalize() for the digest.
+        """
+        return hashes.Hash(self._hash)
+
+    def signature(self, data: bytes | memoryview) -> bytes:
+        """
+        Detached PKCS#7 signature (DER) for data
+        """
+        hasher = self.new_hash()
+        hasher.update(data)
+        return self.signature_from_digest(hasher.finalize())
+
+    def signature_from_digest(self, digest: bytes) -> bytes:
+        """
+        Detached PKCS#7 signature (DER) given digest of module data
+        """
+        sig_value = self._sign_digest(digest)
+
+        signer_info = der_seq(self._signer_info_head, der_octets(sig_value))
+        signed_data = der_seq(der_int(1),
+                              der_set(self._digest_algo),
+                              der_seq(der_oid(_OID_DATA)),
+                              der_set(signer_info))
+        content_info = der_seq(der_oid(_OID_SIGNED_DATA),
+                               der_explicit(0, signed_data))
+        return content_info
+
+    def sign(self, data: bytes | memoryview) -> bytes:
+        """
+        Returns signed module: data + signature + trailer
+        """
+        sig = self.signature(data)
+        return b''.join((data, sig, sig_trailer(len(sig))))
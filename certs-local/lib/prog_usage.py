@@ -0,0 +1,67 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Resource use of external programs totalled per program.
+
+Fed with ProgResult.usage() records:
+
+    {"prog": str, "wall": secs, "utime": secs, "stime": secs,
+     "maxrss": KiB | None, "timed_out": bool}
+
+maxrss is None when not known (see ProgResult) - the total
+max_rss is then the largest known value or None if none known.
+"""
+from typing import Any
+
+
+class ProgUsage:
+    """
+    Totals per program name.
+    Public methods: add(), summary(), lines()
+    """
+    def __init__(self):
+        self.progs: dict[str, dict[str, Any]] = {}
+
+    def add(self, usage: dict[str, Any]):
+        """
+        Add the usage of one program run.
+        """
+        total = self.progs.setdefault(usage['prog'], {
+                'count': 0, 'wall': 0.0, 'utime': 0.0, 'stime': 0.0,
+                'max_wall': 0.0, 'max_rss': None, 'timed_out': 0})
+        total['count'] += 1
+        total['wall'] += usage['wall']
+        total['utime'] += usage['utime']
+        total['stime'] += usage['stime']
+        total['max_wall'] = max(total['max_wall'], usage['wall'])
+        if usage['maxrss'] is not None:
+            total['max_rss'] = max(total['max_rss'] or 0, usage['maxrss'])
+        if usage['timed_out']:
+            total['timed_out'] += 1
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """
+        Totals - secs rounded to microsecs.
+        """
+        return {prog: {key: round(val, 6) if isinstance(val, float) else val
+                       for (key, val) in total.items()}
+                for (prog, total) in self.progs.items()}
+
+    def lines(self) -> list[str]:
+        """
+        One line of text per program - most wall time first.
+        """
+        lines: list[str] = []
+        for (prog, total) in sorted(self.progs.items(),
+                                    key=lambda item: -item[1]['wall']):
+            rss = total['max_rss']
+            rss_str = f'{rss / 1024:.1f} MiB' if rss is not None \
+                else 'not above ours'
+            line = f'{prog}: {total["count"]} runs, wall {total["wall"]:.3f}s'
+            line += f' (max {total["max_wall"]:.3f}s),'
+            line += f' user {total["utime"]:.3f}s, sys {total["stime"]:.3f}s,'
+            line += f' max rss {rss_str}'
+            if total['timed_out']:
+                line += f', {total["timed_out"]} timed out'
+            lines.append(line)
+        return lines
@@ -8,9 +8,13 @@ import datetime
 import re
 
 from ._genkeys_base import GenKeysBase
+from .key_index import KeyIndex
 from .utils import date_time_now
 from .utils import open_file
 
+_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days',
+          'w': 'weeks'}
+
 
 def _read_current_khash(cert_dir: str) -> str:
     """
@@ -26,6 +30,27 @@ def _read_current_khash(cert_dir: str) -> str:
     return khash
 
 
+def period_delta(period: str) -> datetime.timedelta | None:
+    """
+    Time period string (e.g. 7d, 24h, 2weeks) as timedelta.
+    Units may be abbreviated: secs, mins, hours, days or weeks.
+
+    Returns:
+        datetime.timedelta | None:
+        None if not understood.
+    """
+    parse = re.findall(r'(\d+)(\w+)', period)
+    if not parse:
+        return None
+    (freq_str, units) = parse[0]
+    freq = int(freq_str)
+
+    unit = _UNITS.get(units[0])
+    if not unit:
+        return None
+    return datetime.timedelta(**{unit: freq})
+
+
 def refresh_needed(genkeys: GenKeysBase):
     """
     check if key refresh is needed
@@ -33,6 +58,9 @@ def refresh_needed(genkeys: GenKeysBase):
      - if hash type has changed - need to refresh to be consistent
      Returns:
         True if need refresh
+
+    Hash and age of current key come from the key index, or if
+    current key is not indexed from the files in the key directory.
     """
     #
     # no refresh time or always refresh
@@ -43,45 +71,32 @@ def refresh_needed(genkeys: GenKeysBase):
     if genkeys.refresh.lower() == 'always':
         return True
 
+    (_name, entry) = KeyIndex(genkeys.cert_dir).current()
+
     #
     # kernel hash type mismatch to current hash
     # i.e. check genkeys.khash vs current/khash
     #
-    khash_current = _read_current_khash(genkeys.cert_dir)
+    if entry:
+        khash_current = entry.khash
+    else:
+        khash_current = _read_current_khash(genkeys.cert_dir)
     if not khash_current or khash_current != genkeys.khash:
         print('Current hash doesnt match kernel config - updating')
         return True
     #
     # Has clock expired - get the refresh time
     #
-    parse = re.findall(r'(\d+)(\w+)', genkeys.refresh)[0]
-    if parse and len(parse) > 1:
-        freq = int(parse[0])
-        units = parse[1]
-    else:
+    delta = period_delta(genkeys.refresh)
+    if not delta:
         print('Failed to parse refresh string')
         return True
 
-    kfile = os.path.join(genkeys.cert_dir, 'current', 'signing_key.pem')
-
-    if os.path.exists(kfile):
-        mod_time = os.path.getmtime(kfile)
-        curr_dt = datetime.datetime.fromtimestamp(mod_time)
-
-        match units[0]:
-            case 's':
-                timedelta_opts = {'seconds': freq}
-            case 'm':
-                timedelta_opts = {'minutes': freq}
-            case 'h':
-                timedelta_opts = {'hours': freq}
-            case 'd':
-                timedelta_opts = {'days': freq}
-            case 'w':
-                timedelta_opts = {'weeks': freq}
-
-        next_dt = curr_dt + datetime.timedelta(**timedelta_opts)
-        now = date_time_now()
-        if next_dt > now:
-            return False
-    return True
+    if entry:
+        created = entry.created
+    else:
+        kfile = os.path.join(genkeys.cert_dir, 'current', 'signing_key.pem')
+        created = os.path.getmtime(kfile) if os.path.exists(kfile) else 0.0
+
+    next_dt = datetime.datetime.fromtimestamp(created) + delta
+    return next_dt <= date_time_now()
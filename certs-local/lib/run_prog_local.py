@@ -1,56 +1,102 @@
-# SPDX-License-Identifier: MIT
+# SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
 """
 External program execution
+
+Uses pyconcurrent module if available, otherwise our own copy.
+Which one is decided on first use, so nothing is imported
+until a program is actually run.
+
+run_many(), run_prog_result() and run_many_results() always
+use our copy.
 """
 # pylint: disable=too-many-arguments, too-many-positional-arguments
+# pylint: disable=import-outside-toplevel
+from typing import (TYPE_CHECKING, Any, Callable)
+import functools
 import subprocess
 
+if TYPE_CHECKING:
+    from .run_prog_copy import ProgResult
+
+
+@functools.cache
+def _run_prog_impl() -> Callable[..., Any]:
+    """
+    pyconcurrent.run_prog or fallback to run_prog_copy
+    """
+    try:
+        import pyconcurrent
+        return pyconcurrent.run_prog
+
+    except ImportError:
+        from .run_prog_copy import run_prog as run_prog_copy
+        return run_prog_copy
+
+
+def run_prog(
+        pargs: list[str],
+        input_str: str | None = None,
+        stdout: int = subprocess.PIPE,
+        stderr: int = subprocess.PIPE,
+        env: dict[str, str] | None = None,
+        test: bool = False,
+        verb: bool = False
+        ) -> tuple[int, str, str]:
+    """
+    Run external program using subprocess - via pyconcurrent module
+    if available.
+    """
+    return _run_prog_impl()(
+            pargs,
+            input_str,
+            stdout=stdout,
+            stderr=stderr,
+            env=env,
+            test=test,
+            verb=verb)
+
+
+def run_many(
+        pargs_list: list[list[str]],
+        limit: int = 0,
+        input_str: str | None = None,
+        env: dict[str, str] | None = None,
+        ) -> list[tuple[int, str, str]]:
+    """
+    Run several external programs concurrently - see run_prog_copy.
+    """
+    from .run_prog_copy import run_many as run_many_copy
+    return run_many_copy(pargs_list, limit, input_str, env)
+
+
+def run_prog_result(
+        pargs: list[str],
+        input_str: str | None = None,
+        stdout: int = subprocess.PIPE,
+        stderr: int = subprocess.PIPE,
+        env: dict[str, str] | None = None,
+        timeout: float | None = None
+        ) -> 'ProgResult':
+    """
+    Run external program and collect its resource use
+    - see run_prog_copy.
+    """
+    from .run_prog_copy import run_prog_result as run_prog_result_copy
+    return run_prog_result_copy(pargs, input_str, stdout=stdout,
+                                stderr=stderr, env=env, timeout=timeout)
+
 
-try:
-    import pyconcurrent
-
-    def run_prog(
-            pargs: list[str],
-            input_str: str | None = None,
-            stdout: int = subprocess.PIPE,
-            stderr: int = subprocess.PIPE,
-            env: dict[str, str] | None = None,
-            test: bool = False,
-            verb: bool = False
-            ) -> tuple[int, str, str]:
-        """
-        Run external program using subprocess - via pyconcurrent module..
-        """
-        return pyconcurrent.run_prog(
-                pargs,
-                input_str,
-                stdout=stdout,
-                stderr=stderr,
-                env=env,
-                test=test,
-                verb=verb)
-
-except ImportError:
-    from .run_prog_copy import run_prog as run_prog_copy
-
-    def run_prog(
-                pargs: list[str],
-                input_str: str | None = None,
-                stdout: int = subprocess.PIPE,
-                stderr: int = subprocess.PIPE,
-                env: dict[str, str] | None = None,
-                test: bool = False,
-                verb: bool = False
-                ) -> tuple[int, str, str]:
-        """
-        Run external program using subprocess - via pyconcurrent module..
-        """
-        return run_prog_copy(
-                pargs,
-                input_str,
-                stdout=stdout,
-                stderr=stderr,
-                env=env,
-                test=test,
-                verb=verb)
+def run_many_results(
+        pargs_list: list[list[str]],
+        limit: int = 0,
+        input_str: str | None = None,
+        env: dict[str, str] | None = None,
+        timeout: float | None = None,
+        ) -> list['ProgResult']:
+    """
+    Run several external programs concurrently, with resource use
+    - see run_prog_copy.
+    """
+    from .run_prog_copy import run_many_results as run_many_results_copy
+    return run_many_results_copy(pargs_list, limit, input_str, env, timeout)
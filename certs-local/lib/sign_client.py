@@ -0,0 +1,81 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Signing daemon client - see sign_daemon for the protocol.
+
+Kept apart from the daemon so that handing modules to a running
+daemon loads as little as possible.
+
+daemon_sign() returns None whenever the daemon can't be used
+(not running, stale socket, died or hung mid request etc), so caller
+can simply sign the modules itself.
+"""
+from dataclasses import asdict
+import json
+import os
+import socket
+
+from .sign_pool import SignResult
+from .signer_class import ToolOpts
+
+SOCKET_NAME = 'sign_module.sock'
+_CONNECT_TIMEOUT = 5
+
+# reply must arrive within this many secs per module - a hung daemon
+# then looks like no daemon and caller signs the modules itself
+_MODULE_TIMEOUT = 60
+
+
+def socket_path(myname: str) -> str:
+    """
+    Daemon socket for the sign_module.py at myname.
+    """
+    my_dir = os.path.dirname(os.path.realpath(myname))
+    return os.path.join(my_dir, SOCKET_NAME)
+
+
+def daemon_sign(path: str, modules: list[str],
+                opts: ToolOpts) -> list[SignResult] | None:
+    """
+    Ask the daemon to sign modules.
+
+    Args:
+        path (str):
+        Daemon socket.
+
+        modules (list[str]):
+        Modules to sign - sent as absolute paths.
+
+        opts (ToolOpts):
+        Settings for this request.
+
+    Returns:
+        list[SignResult] | None:
+        None if the daemon is not available.
+    """
+    if not os.path.exists(path):
+        return None
+
+    request = {'modules': [os.path.abspath(mod) for mod in modules],
+               'opts': asdict(opts)}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(_CONNECT_TIMEOUT)
+            sock.connect(path)
+            sock.settimeout(_CONNECT_TIMEOUT
+                            + _MODULE_TIMEOUT * max(len(modules), 1))
+            sock.sendall(json.dumps(request).encode() + b'\n')
+            with sock.makefile('rb') as fobj:
+                reply = json.loads(fobj.readline())
+        results = [SignResult(**item) for item in reply['results']]
+
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+
+    if len(results) != len(modules):
+        return None
+
+    # report paths as given
+    for (result, mod) in zip(results, modules):
+        result.mod_path = mod
+    return results
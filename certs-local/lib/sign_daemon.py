@@ -0,0 +1,219 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Signing daemon.
+
+sign_module.py --serve keeps the signer (keys loaded), codecs and a
+worker pool ready and accepts signing requests on a unix socket
+beside the current key directory:
+
+    certs-local/sign_module.sock
+
+Each request is one line of json sent by the client:
+
+    {"modules": [path, ...], "opts": {ToolOpts fields}}
+
+and answered by one line of json:
+
+    {"results": [{SignResult fields}, ...]}
+
+Only clients with the same uid as the daemon (or root) are served
+(SO_PEERCRED). The socket itself is only accessible by the owner.
+
+Keys are reloaded if current/ changes (e.g. after genkeys refresh).
+
+The client side is in sign_client.
+"""
+from dataclasses import (asdict, fields)
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import signal
+import socket
+import socketserver
+import struct
+import threading
+
+from .sign_client import socket_path
+from .sign_manifest import SignManifest
+from .sign_pool import (SignResult, sign_modules)
+from .signer_class import (KernelModSigner, ToolOpts)
+
+
+def _key_state(signer: KernelModSigner) -> tuple:
+    """
+    Identifies the key files in use - changes when current/ does.
+    """
+    state: list = []
+    for path in (signer.key, signer.crt):
+        try:
+            stat = os.stat(path)
+            state.append((os.path.realpath(path), stat.st_ino,
+                          stat.st_mtime_ns))
+        except OSError:
+            state.append(None)
+    return tuple(state)
+
+
+def _tool_opts(opts: dict) -> ToolOpts:
+    """
+    ToolOpts from request ignoring anything unknown.
+    """
+    known = {field.name for field in fields(ToolOpts)}
+    return ToolOpts(**{key: val for (key, val) in opts.items()
+                       if key in known})
+
+
+class _SignServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Unix socket server sharing one signer and worker pool.
+    """
+    daemon_threads = True
+
+    def __init__(self, path: str, myname: str, native: bool, jobs: int):
+        self.myname: str = myname
+        self.native: bool = native
+        self.jobs: int = jobs
+        self.pool = ThreadPoolExecutor(max_workers=max(jobs, 1))
+        self.signer: KernelModSigner = self._load_signer()
+        self.key_state: tuple = _key_state(self.signer)
+        self.signer_lock = threading.Lock()
+        super().__init__(path, _SignHandler)
+
+    def _load_signer(self) -> KernelModSigner:
+        """
+        Signer with keys loaded now rather than on first request.
+        """
+        signer = KernelModSigner(self.myname, native=self.native)
+        if signer.native:
+            print(f'Signing in process using {signer.khash}')
+        return signer
+
+    def get_signer(self) -> KernelModSigner:
+        """
+        Signer using the current keys.
+        """
+        with self.signer_lock:
+            state = _key_state(self.signer)
+            if state != self.key_state:
+                print('Keys changed - reloading')
+                self.signer = self._load_signer()
+                self.key_state = _key_state(self.signer)
+            return self.signer
+
+    def sign(self, modules: list[str], opts: ToolOpts) -> list[SignResult]:
+        """
+        Sign modules and update manifest.
+        """
+        signer = self.get_signer()
+        if not signer.initialized:
+            return [SignResult(mod, msg='Signer not initialized')
+                    for mod in modules]
+
+        manifest: SignManifest | None = None
+        if signer.signer_id:
+            manifest = SignManifest(signer.manifest,
+                                    signer.signer_id.key_id())
+
+        results = sign_modules(signer, modules, self.jobs, opts, manifest,
+                               pool=self.pool)
+        if manifest:
+            manifest.save()
+        return results
+
+
+class _SignHandler(socketserver.StreamRequestHandler):
+    """
+    One client connection: one request and its reply.
+    """
+    server: _SignServer
+
+    def handle(self):
+        if not _peer_allowed(self.request):
+            return
+
+        try:
+            request = json.loads(self.rfile.readline())
+            modules = [str(mod) for mod in request.get('modules', [])]
+            opts = _tool_opts(request.get('opts', {}))
+
+        except (ValueError, TypeError, AttributeError):
+            return
+
+        results = self.server.sign(modules, opts)
+        reply = {'results': [asdict(result) for result in results]}
+        self.wfile.write(json.dumps(reply).encode() + b'\n')
+
+
+def _peer_allowed(sock: socket.socket) -> bool:
+    """
+    Only serve our own uid or root.
+    """
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                            struct.calcsize('3i'))
+    (_pid, uid, _gid) = struct.unpack('3i', creds)
+    return uid in (0, os.getuid())
+
+
+def _daemon_running(path: str) -> bool:
+    """
+    True if something is accepting connections on path.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+            return True
+        except OSError:
+            return False
+
+
+def serve(myname: str, native: bool = True, jobs: int = 1) -> bool:
+    """
+    Run signing daemon until terminated (SIGTERM / SIGINT).
+
+    Args:
+        myname (str):
+        Path of sign_module.py - locates keys and socket.
+
+        native (bool):
+        Use in process signing when possible.
+
+        jobs (int):
+        Number of modules signed at same time.
+    """
+    path = socket_path(myname)
+    if os.path.exists(path):
+        if _daemon_running(path):
+            print(f'Daemon already running: {path}')
+            return False
+        os.unlink(path)
+
+    old_umask = os.umask(0o077)
+    try:
+        server = _SignServer(path, myname, native, jobs)
+    except OSError as err:
+        print(f'Failed to create socket {path}: {err}')
+        return False
+    finally:
+        os.umask(old_umask)
+
+    if not server.signer.initialized:
+        server.server_close()
+        os.unlink(path)
+        return False
+
+    def _stop(_signum, _frame):
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    print(f'Serving on {path}')
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.pool.shutdown()
+        if os.path.exists(path):
+            os.unlink(path)
+    return True
@@ -0,0 +1,248 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Signing manifest - remembers which modules are already signed.
+
+Stored as json beside the current key directory:
+
+    certs-local/sign-manifest.json
+
+Each module path records the stat fingerprint of the file
+(inode, size, mtime) after it was signed, a sha256 of its content
+and the id of the key used. If the fingerprint and key id still
+match the module is skipped without opening it.
+
+Updates are collected in memory and written once by save().
+Several sign_module runs may save at the same time: the manifest
+is re-read under an exclusive lock (flock on a separate lock file),
+merged with our changes and replaced using temp file + rename.
+Readers never need the lock.
+"""
+# pylint: disable=too-many-instance-attributes, import-outside-toplevel
+from dataclasses import dataclass
+import fcntl
+import hashlib
+import os
+import sys
+import threading
+
+from .utils import (load_json_entries, open_file, save_json_entries)
+
+MANIFEST_NAME = 'sign-manifest.json'
+_VERSION = 1
+
+
+@dataclass
+class ManifestEntry:
+    """
+    What we know about one signed module.
+    """
+    ino: int = 0
+    size: int = 0
+    mtime_ns: int = 0
+    sha256: str = ''
+    key_id: str = ''
+
+    def same_file(self, stat: os.stat_result) -> bool:
+        """
+        True if stat fingerprint is unchanged.
+        """
+        return (self.ino == stat.st_ino and self.size == stat.st_size
+                and self.mtime_ns == stat.st_mtime_ns)
+
+
+def file_sha256(path: str) -> str:
+    """
+    Hex sha256 of file contents or empty on error.
+    """
+    fobj = open_file(path, 'rb')
+    if not fobj:
+        return ''
+    hasher = hashlib.sha256()
+    try:
+        while chunk := fobj.read(1024 * 1024):
+            hasher.update(chunk)
+        digest = hasher.hexdigest()
+    except OSError:
+        digest = ''
+    fobj.close()
+    return digest
+
+
+def _read_entries(path: str) -> dict[str, ManifestEntry]:
+    """
+    Load manifest file. Missing or bad file gives empty manifest.
+    """
+    return load_json_entries(path, _VERSION, 'modules', ManifestEntry)
+
+
+class SignManifest:
+    """
+    Manifest of signed modules.
+
+    Public methods: is_current(), add(), remove(), save(), verify()
+
+    Args:
+        path (str):
+        Manifest file.
+
+        key_id (str):
+        Id of current signing key.
+
+        rebuild (bool):
+        Ignore existing entries when checking modules and on save
+        drop any entry whose file has changed or is gone.
+    """
+    def __init__(self, path: str, key_id: str, rebuild: bool = False):
+        self.path: str = path
+        self.key_id: str = key_id
+        self.rebuild: bool = rebuild
+        self.entries: dict[str, ManifestEntry] = _read_entries(path)
+
+        self._lock = threading.Lock()
+        self._added: dict[str, ManifestEntry] = {}
+        self._removed: set[str] = set()
+
+    def is_current(self, mod_path: str) -> bool:
+        """
+        True if module is unchanged since signed with current key.
+        Uses stat only - the module is not opened.
+        """
+        if self.rebuild:
+            return False
+
+        entry = self.entries.get(os.path.abspath(mod_path))
+        if not entry or entry.key_id != self.key_id:
+            return False
+
+        try:
+            stat = os.stat(mod_path)
+        except OSError:
+            return False
+        return entry.same_file(stat)
+
+    def add(self, mod_path: str, sha256: str = '') -> bool:
+        """
+        Record module (just) signed with current key.
+        Thread safe.
+
+        Args:
+            mod_path (str):
+            Module file.
+
+            sha256 (str):
+            Hex sha256 of module content if known (e.g. of the bytes
+            just written) - else module is read to get it.
+        """
+        mod_path = os.path.abspath(mod_path)
+        try:
+            stat = os.stat(mod_path)
+        except OSError:
+            return False
+
+        digest = sha256 if sha256 else file_sha256(mod_path)
+        if not digest:
+            return False
+
+        entry = ManifestEntry(ino=stat.st_ino, size=stat.st_size,
+                              mtime_ns=stat.st_mtime_ns, sha256=digest,
+                              key_id=self.key_id)
+        with self._lock:
+            self._added[mod_path] = entry
+            self._removed.discard(mod_path)
+        return True
+
+    def remove(self, mod_path: str):
+        """
+        Forget module. Thread safe.
+        """
+        mod_path = os.path.abspath(mod_path)
+        with self._lock:
+            self._added.pop(mod_path, None)
+            self._removed.add(mod_path)
+
+    def verify(self, jobs: int = 1) -> list[str]:
+        """
+        Check every entry against its file (stat and content hash).
+        Bad entries are removed - use save() to write the result.
+
+        Returns:
+            list[str]:
+            Modules whose entry no longer matches.
+        """
+        def _check(item: tuple[str, ManifestEntry]) -> str:
+            (mod_path, entry) = item
+            try:
+                stat = os.stat(mod_path)
+            except OSError:
+                return mod_path
+            if not entry.same_file(stat):
+                return mod_path
+            if file_sha256(mod_path) != entry.sha256:
+                return mod_path
+            return ''
+
+        from concurrent.futures import ThreadPoolExecutor
+        items = list(self.entries.items())
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+            bad = [path for path in pool.map(_check, items) if path]
+
+        for mod_path in bad:
+            self.remove(mod_path)
+        return bad
+
+    def save(self) -> bool:
+        """
+        Merge our changes into the manifest file.
+        """
+        if not (self._added or self._removed or self.rebuild):
+            return True
+
+        lock_path = self.path + '.lock'
+        lock = open_file(lock_path, 'a')
+        if not lock:
+            return False
+
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            # someone else may have saved since we loaded
+            entries = _read_entries(self.path)
+            for mod_path in self._removed:
+                entries.pop(mod_path, None)
+            entries.update(self._added)
+
+            if self.rebuild:
+                entries = {path: entry for (path, entry) in entries.items()
+                           if _unchanged(path, entry)}
+
+            okay = self._write(entries)
+            if okay:
+                self.entries = entries
+                self._added = {}
+                self._removed = set()
+
+        except OSError as err:
+            print(f'Failed to update manifest: {err}', file=sys.stderr)
+            okay = False
+
+        finally:
+            lock.close()
+        return okay
+
+    def _write(self, entries: dict[str, ManifestEntry]) -> bool:
+        """
+        Write manifest (temp file + rename).
+        """
+        return save_json_entries(self.path, _VERSION, 'modules', entries)
+
+
+def _unchanged(mod_path: str, entry: ManifestEntry) -> bool:
+    """
+    True if file still matches the stat fingerprint.
+    """
+    try:
+        stat = os.stat(mod_path)
+    except OSError:
+        return False
+    return entry.same_file(stat)
@@ -0,0 +1,191 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Sign a list of modules using a pool of workers.
+
+Each module is handled by its own ModuleTool.
+Work is spread over a thread pool - the heavy lifting
+(compression and the sign-file subprocess) happens outside
+of the python interpreter lock so threads are sufficient.
+
+Results are returned in the same order as the modules were given.
+Modules may come from a generator (e.g. find_modules) - work starts
+as soon as the first module is given.
+
+With a manifest, modules it knows are unchanged are skipped without
+being opened and every module signed (or found to be already signed)
+is added to it. The caller saves the manifest.
+"""
+# pylint: disable=import-outside-toplevel
+from typing import (TYPE_CHECKING, Any, Callable, Iterable)
+from dataclasses import (asdict, dataclass, field)
+import hashlib
+import time
+
+from .sign_manifest import SignManifest
+from .signer_class import (KernelModSigner, ModuleTool, ToolOpts)
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+
+@dataclass
+class SignResult:
+    """
+    Outcome of signing one module.
+
+    secs is the time taken and stats the ModuleStats fields
+    (empty if the module was not opened).
+    """
+    mod_path: str
+    okay: bool = False
+    found: bool = True
+    skipped: bool = False
+    msg: str = ''
+    secs: float = 0.0
+    stats: dict[str, Any] = field(default_factory=dict)
+
+
+def sign_one(signer: KernelModSigner, mod_path: str,
+             opts: ToolOpts | None = None,
+             manifest: SignManifest | None = None) -> SignResult:
+    """
+    Sign one module.
+    """
+    manifests = [manifest] if manifest else []
+    (result, mod_tool, start) = open_tool(signer, mod_path, opts, manifests)
+    if not mod_tool:
+        return result
+    return sign_tool(mod_tool, result, manifest, start)
+
+
+def open_tool(signer: KernelModSigner, mod_path: str,
+              opts: ToolOpts | None,
+              manifests: Iterable[SignManifest]
+              ) -> tuple[SignResult, ModuleTool | None, float]:
+    """
+    Start on one module: skip it if any manifest says it is current,
+    else make its ModuleTool.
+
+    Returns:
+        tuple[result: SignResult, mod_tool: ModuleTool | None,
+              start: float]:
+        mod_tool is None when done (skipped or bad path) and result
+        is then final. Otherwise sign with sign_tool(), passing start.
+    """
+    start = time.perf_counter()
+    result = SignResult(mod_path)
+    force = opts.force if opts else False
+
+    if not force and any(manifest.is_current(mod_path)
+                         for manifest in manifests):
+        result.okay = True
+        result.skipped = True
+        result.secs = time.perf_counter() - start
+        return (result, None, start)
+
+    mod_tool = ModuleTool(signer, mod_path, opts)
+    if not mod_tool.path_ok:
+        result.found = False
+        result.msg = mod_tool.msg
+        return (result, None, start)
+
+    return (result, mod_tool, start)
+
+
+def sign_tool(mod_tool: ModuleTool, result: SignResult,
+              manifest: SignManifest | None, start: float) -> SignResult:
+    """
+    Sign module of mod_tool (using its signer) and fill in result.
+
+    Args:
+        mod_tool (ModuleTool):
+        Tool for the module - path already checked.
+
+        result (SignResult):
+        Updated with the outcome.
+
+        manifest (SignManifest | None):
+        Updated with the outcome if given.
+
+        start (float):
+        perf_counter() when work on the module began.
+    """
+    if manifest:
+        mod_tool.out_hash = hashlib.sha256()
+
+    result.okay = mod_tool.sign()
+    result.skipped = mod_tool.skipped
+    result.msg = mod_tool.msg
+    result.stats = asdict(mod_tool.stats)
+
+    if manifest:
+        if result.okay:
+            # skipped modules were not written - manifest reads them
+            digest = '' if mod_tool.skipped else \
+                mod_tool.out_hash.hexdigest()
+            manifest.add(mod_tool.mod_path, digest)
+        else:
+            manifest.remove(mod_tool.mod_path)
+    result.secs = time.perf_counter() - start
+    return result
+
+
+def sign_modules(signer: KernelModSigner, modules: Iterable[str],
+                 jobs: int = 1,
+                 opts: ToolOpts | None = None,
+                 manifest: SignManifest | None = None,
+                 pool: 'Executor | None' = None) -> list[SignResult]:
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    """
+    Sign modules using up to jobs parallel workers.
+
+    Args:
+        signer (KernelModSigner):
+        Signer with keys.
+
+        modules (Iterable[str]):
+        Modules to sign.
+
+        jobs (int):
+        Max number of modules to sign at same time.
+
+        opts (ToolOpts | None):
+        ModuleTool settings.
+
+        manifest (SignManifest | None):
+        Known signed modules - updated but not saved.
+
+        pool (Executor | None):
+        Use this (long lived) pool rather than making one.
+
+    Returns:
+        list[SignResult]:
+        One result per module in same order as modules.
+    """
+    def _sign(mod: str) -> SignResult:
+        return sign_one(signer, mod, opts, manifest)
+
+    return map_modules(_sign, modules, jobs, pool)
+
+
+def map_modules(func: Callable[[str], SignResult], modules: Iterable[str],
+                jobs: int = 1, pool: 'Executor | None' = None
+                ) -> list[SignResult]:
+    """
+    func for each module using pool, or up to jobs parallel workers.
+
+    Returns:
+        list[SignResult]:
+        One result per module in same order as modules.
+    """
+    if pool:
+        return list(pool.map(func, modules))
+
+    if jobs <= 1:
+        return [func(mod) for mod in modules]
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=jobs) as new_pool:
+        results = list(new_pool.map(func, modules))
+    return results
@@ -0,0 +1,175 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Signing run report.
+
+One json record per line - one for each module, in module order:
+
+    {"module": path, "okay": bool, "skipped": bool, "found": bool,
+     "msg": str, "secs": float, "codec": ".zst", "bytes_in": int,
+     "bytes_out": int, "stripped": bool, "streamed": bool,
+     "signer": "native" | "sign-file", "sign_rc": int | null,
+     "stages": {stage: secs, ...},
+     "progs": [{"prog": str, "wall": secs, "utime": secs,
+                "stime": secs, "maxrss": KiB | null,
+                "timed_out": bool}, ...]}
+
+followed by a summary record:
+
+    {"summary": {"host": str, "time": str, "elapsed": float,
+                 "modules": int, "signed": int, "skipped": int,
+                 "failed": int, "not_found": int,
+                 "bytes_in": int, "bytes_out": int,
+                 "codecs": {codec: count, ...},
+                 "hot_stage": stage,
+                 "stages": {stage: {"total": secs, "mean": secs,
+                                    "max": secs, "count": int,
+                                    "share": fraction}, ...},
+                 "progs": {prog: {"count": int, "wall": secs,
+                                  "utime": secs, "stime": secs,
+                                  "max_wall": secs, "max_rss": KiB | null,
+                                  "timed_out": int}, ...}}}
+
+Stages are described in mod_stats. share is the fraction of the
+summed stage times - the stage with most is the hot_stage.
+progs is the resource use of external programs (sign-file) - see
+prog_usage.
+Records from many hosts can simply be concatenated and filtered
+on "summary".
+"""
+from typing import (Any, IO)
+import json
+import socket
+import sys
+import time
+
+from .prog_usage import ProgUsage
+from .sign_pool import SignResult
+from .utils import open_file
+
+
+def module_record(result: SignResult) -> dict[str, Any]:
+    """
+    Report record for one module.
+    """
+    record: dict[str, Any] = {
+            'module': result.mod_path,
+            'okay': result.okay,
+            'skipped': result.skipped,
+            'found': result.found,
+            'msg': result.msg,
+            'secs': round(result.secs, 6),
+            }
+    record.update(result.stats)
+    if 'stages' in record:
+        record['stages'] = {name: round(secs, 6)
+                            for (name, secs) in record['stages'].items()}
+    return record
+
+
+def summary_record(results: list[SignResult], elapsed: float
+                   ) -> dict[str, Any]:
+    """
+    Totals over all modules.
+    """
+    num_skipped = sum(1 for result in results if result.skipped)
+    num_okay = sum(1 for result in results if result.okay)
+    summary: dict[str, Any] = {
+            'host': socket.gethostname(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'elapsed': round(elapsed, 6),
+            'modules': len(results),
+            'signed': num_okay - num_skipped,
+            'skipped': num_skipped,
+            'failed': sum(1 for result in results
+                          if result.found and not result.okay),
+            'not_found': sum(1 for result in results if not result.found),
+            'bytes_in': 0,
+            'bytes_out': 0,
+            'codecs': {},
+            'hot_stage': '',
+            'stages': {},
+            'progs': {},
+            }
+
+    stage_times: dict[str, list[float]] = {}
+    for result in results:
+        stats = result.stats
+        if not stats:
+            continue
+        summary['bytes_in'] += stats.get('bytes_in', 0)
+        summary['bytes_out'] += stats.get('bytes_out', 0)
+        codec = stats.get('codec')
+        if codec:
+            summary['codecs'][codec] = summary['codecs'].get(codec, 0) + 1
+        for (name, secs) in stats.get('stages', {}).items():
+            stage_times.setdefault(name, []).append(secs)
+
+    all_secs = sum(sum(times) for times in stage_times.values())
+    for (name, times) in stage_times.items():
+        total = sum(times)
+        summary['stages'][name] = {
+                'total': round(total, 6),
+                'mean': round(total / len(times), 6),
+                'max': round(max(times), 6),
+                'count': len(times),
+                'share': round(total / all_secs, 4) if all_secs else 0.0,
+                }
+    if stage_times:
+        summary['hot_stage'] = max(stage_times,
+                                   key=lambda name: sum(stage_times[name]))
+    summary['progs'] = prog_usage(results).summary()
+    return {'summary': summary}
+
+
+def prog_usage(results: list[SignResult]) -> ProgUsage:
+    """
+    External program resource use over all modules.
+    """
+    usage = ProgUsage()
+    for result in results:
+        for prog in result.stats.get('progs', []):
+            usage.add(prog)
+    return usage
+
+
+def write_report(path: str, results: list[SignResult], elapsed: float
+                 ) -> bool:
+    """
+    Write json lines report.
+
+    Args:
+        path (str):
+        Report file - replaced if exists. '-' for stdout.
+
+        results (list[SignResult]):
+        Results of signing run.
+
+        elapsed (float):
+        Wall time of whole run (secs).
+
+    Returns:
+        bool:
+        False if report could not be written.
+    """
+    fobj: IO | None = sys.stdout
+    if path != '-':
+        fobj = open_file(path, 'w')
+    if not fobj:
+        return False
+
+    try:
+        for result in results:
+            fobj.write(json.dumps(module_record(result)) + '\n')
+        fobj.write(json.dumps(summary_record(results, elapsed)) + '\n')
+        fobj.flush()
+        okay = True
+
+    except OSError as err:
+        print(f'Failed to write report {path}: {err}', file=sys.stderr)
+        okay = False
+
+    finally:
+        if fobj is not sys.stdout:
+            fobj.close()
+    return okay
@@ -13,10 +13,12 @@ Handle signing of one kernel module.
 Modules can be uncompressed (.ko) or
 compressed with zstd (.zst), xz (.xz) or gzip (.gz)
 Modules may also be already signed in which case the
-signature is removed before re-signing.
+signature is removed before re-signing. Modules already signed
+with the current key are left alone unless forced (see signer_id).
 
 Note:
-  stripping removes all debug info including signature.
+  An existing signature is removed by parsing the appended
+  signature trailer (see mod_sig). Debug info is left intact.
 
 Note:
   get_kernel_signer()
@@ -36,29 +38,46 @@ Note:
         khash
 
 Note:
-  We use file extension to determine if/how compressed.
-  We do not use magic bytes
-  We work in memory rather than filesystem - each module
-  is small emough its not a problem
+  The compression format is found from the leading magic bytes
+  (zstd, xz, gzip or ELF for uncompressed) using a small read before
+  anything else is done. Files that are none of these are rejected.
+  A module is always rewritten in the format it is actually in, even
+  if its name says otherwise. File extension only selects which files
+  are considered modules.
+  We work in memory rather than filesystem - most modules
+  are small enough its not a problem. Large ones are streamed.
 
 Note:
   While it may be fine to leave existing sig and sign the
   (already previously) signed module - we choose to remove it.
-  Maybe simpler and cleaner not to bother - not clear if this
-  may cause problem for kernel sig check or not. So we strip it out.
-  This also removes any debug symbols so it has a differen
-  downside if the module had any debug info.
+  The kernel only checks the last appended signature, so
+  leaving old ones would just be dead weight.
 """
 # pylint: disable=too-few-public-methods, too-many-instance-attributes
+# pylint: disable=import-outside-toplevel
+from typing import (TYPE_CHECKING, Any)
+from dataclasses import dataclass
 import os
+import sys
+import threading
 
-import uuid
-import lzma
-import gzip
-import zstandard
+from .mod_codec import (ELF_MAGIC, HEAD_SIZE, CodecParams, codec_errors,
+                        compress, decompress, detect_params, sniff_format)
+from .der import der_oid
+from .mod_info import (kernel_release, stream_vermagic, vermagic)
+from .mod_sig import (is_signed, sig_bytes, strip_sig)
+from .mod_stats import ModuleStats
+from .mod_stream import (read_tail, sign_stream)
+from .run_prog_local import run_prog_result
+from .sign_manifest import MANIFEST_NAME
+from .signer_id import (SignerId, cert_signer_id, digest_oid, sig_signer_id)
+from .utils import (open_file, write_file_atomic)
 
-from .run_prog_local import run_prog
-from .utils import open_file, remove_file
+if TYPE_CHECKING:
+    from .native_signer import NativeSigner
+
+# sign-file taking longer than this (secs) is killed
+SIGN_FILE_TIMEOUT = 300
 
 
 class KernelModSigner:
@@ -66,14 +85,27 @@ class KernelModSigner:
     kernelModISigner class handles key management and signing of kernel modules
     Once instantiated use to sign module(s)
     Public methods: sign_module()
+
+    Modules are signed in process (NativeSigner) when possible, with
+    key and certificate loaded just once. Otherwise, or if native is False,
+    the kernel sign-file tool is used.
+
+    NativeSigner (and python cryptography) is only loaded when first
+    needed - a run where every module is already signed never needs it.
     """
-    def __init__(self, myname):
+    def __init__(self, myname, native: bool = True):
         self.signer: str = ''
         self.key: str = ''
         self.crt: str = ''
         self.khash: str = ''
+        self.manifest: str = ''
+        self.signer_id: SignerId | None = None
         self.initialized: bool = False
 
+        self._native: 'NativeSigner | None' = None
+        self._native_todo: bool = native
+        self._native_lock = threading.Lock()
+
         #
         # extract kernel directory from my own name:
         # this is the full path to calling executable
@@ -91,6 +123,7 @@ class KernelModSigner:
         self.key = os.path.join(my_dir, 'current/signing_key.pem')
         self.crt = os.path.join(my_dir, 'current/signing_crt.crt')
         khash_file = os.path.join(my_dir, 'current/khash')
+        self.manifest = os.path.join(my_dir, MANIFEST_NAME)
 
         #
         # missing khash - temp backward compat only
@@ -109,26 +142,128 @@ class KernelModSigner:
         self.khash = khash
 
         if not os.path.exists(self.key):
-            print('Missing key file: ' + self.key)
+            print('Missing key file: ' + self.key, file=sys.stderr)
             self.key = ''
             if not os.path.exists(self.crt):
                 self.crt = ''
-                print('Missing crt file: ' + self.crt)
+                print('Missing crt file: ' + self.crt, file=sys.stderr)
         else:
             self.initialized = True
 
+        if self.initialized:
+            self.signer_id = cert_signer_id(self.crt)
+            if self.signer_id and digest_oid(khash):
+                self.signer_id.digest_oid = der_oid(digest_oid(khash))
+
+    @property
+    def native(self) -> 'NativeSigner | None':
+        """
+        In process signer - None if not available (use sign-file).
+        Created on first use.
+        """
+        with self._native_lock:
+            if self._native_todo and self.initialized:
+                self._native_todo = False
+                from .native_signer import NativeSigner
+                native_signer = NativeSigner(self.key, self.crt, self.khash)
+                if native_signer.okay:
+                    self._native = native_signer
+            return self._native
+
     #
     # Does actual module signing Using key_info
     #
     def sign_module(self, mod_path):
         """
-        Does the actual signing of a module file
+        Does the actual signing of a module file (in place).
+        Returns 0 on success same as sign-file.
+        """
+        fobj = open_file(mod_path, 'rb')
+        if not fobj:
+            return 1
+        data = fobj.read()
+        fobj.close()
+
+        signed = self.sign_data(data)
+        if signed is None:
+            return 1
+
+        if not write_file_atomic(mod_path, signed):
+            return 1
+        return 0
+
+    def sign_data(self, data: bytes | memoryview,
+                  stats: ModuleStats | None = None) -> bytes | None:
+        """
+        Sign (uncompressed) module data.
+
+        Args:
+            data (bytes | memoryview):
+            Module without any signature.
+
+            stats (ModuleStats | None):
+            If given, the signer used and sign-file exit status
+            and resource use are recorded in it.
+
+        Returns:
+            bytes | None:
+            Signed module or None if signing failed.
+        """
+        native = self.native
+        if stats:
+            stats.signer = 'native' if native else 'sign-file'
+        if native:
+            return native.sign(data)
+        return self._sign_data_sign_file(data, stats)
+
+    def _sign_data_sign_file(self, data: bytes | memoryview,
+                             stats: ModuleStats | None = None
+                             ) -> bytes | None:
+        """
+        Sign using kernel sign-file.
+
+        sign-file only works with files, so module is handed over using
+        anonymous memory files (memfd). sign-file reads the module from
+        one and writes the signed module to the other. These are
+        accessed via /proc/<pid>/fd/ - nothing touches the module's
+        filesystem.
         """
-        pargs = [self.signer, self.khash, self.key, self.crt, mod_path]
-        (retc, _sout, _serr) = run_prog(pargs)
-        if retc != 0:
-            print('Signing failed')
-        return retc
+        signed: bytes | None = None
+        fd_in = os.memfd_create('module', os.MFD_CLOEXEC)
+        fd_out = os.memfd_create('module-signed', os.MFD_CLOEXEC)
+        try:
+            with os.fdopen(fd_in, 'wb', closefd=False) as fobj:
+                fobj.write(data)
+
+            pid = os.getpid()
+            path_in = f'/proc/{pid}/fd/{fd_in}'
+            path_out = f'/proc/{pid}/fd/{fd_out}'
+            pargs = [self.signer, self.khash, self.key, self.crt,
+                     path_in, path_out]
+            prog = run_prog_result(pargs, timeout=SIGN_FILE_TIMEOUT)
+            if prog.timed_out:
+                print(f'sign-file killed after {SIGN_FILE_TIMEOUT} secs',
+                      file=sys.stderr)
+            elif prog.read_error:
+                print(f'Error reading sign-file output: {prog.stderr}',
+                      file=sys.stderr)
+            if stats:
+                stats.sign_rc = prog.retc
+                stats.progs.append(prog.usage())
+
+            if prog.retc == 0:
+                with os.fdopen(fd_out, 'rb', closefd=False) as fobj:
+                    signed = fobj.read()
+
+        except OSError as err:
+            print(f'Error using memfd: {err}', file=sys.stderr)
+            signed = None
+
+        finally:
+            os.close(fd_in)
+            os.close(fd_out)
+
+        return signed
 
 
 # ----------------------------------------------------------------
@@ -138,20 +273,32 @@ class KernelModSigner:
 # remove existing signature
 # Uses KernelModSigner class for key managemen and signing.
 #
-# When checking for sig we minimize the search by looking in
-# last few bytes - say last x bytes
-#                 <- x ->
-#   [0]------[N-x]-------[N-1]
-#
-#  => N-x > x
+# Existing signature is found from the fixed size trailer at
+# the end of the module - see mod_sig.
 #
-def strip_sig(mod_path):
+@dataclass
+class ToolOpts:
     """
-    Strips out signature from module file
+    ModuleTool settings - same for every module.
+
+    Modules of at least stream_size bytes (on disk) are
+    signed using streaming (see mod_stream) in chunks of bufsize.
+    stream_size of 0 streams every module.
+
+    Recompression uses level (None keeps original or codec default)
+    and threads (see mod_codec). With xz_one_block, xz modules are
+    written as a single block (like xz without -T) whatever threads
+    is, keeping the usual block layout.
+
+    Modules already signed with the current key are skipped
+    unless force is set.
     """
-    pargs = ['/usr/bin/strip', '--strip-debug', mod_path]
-    (retc, _output, _errors) = run_prog(pargs)
-    return retc
+    stream_size: int = 32 * 1024 * 1024
+    bufsize: int = 1024 * 1024
+    level: int | None = None
+    threads: int = 1
+    xz_one_block: bool = False
+    force: bool = False
 
 
 class ModuleTool:
@@ -159,18 +306,32 @@ class ModuleTool:
     Class ModuleTool
     Tools to decompress, recompress and check and remove
     any existing signature and sign module file
-    Public methods: read() and sign()
+    Public methods: read(), is_current(), kernel_version() and sign()
+
+    Problems are saved in msg rather than printed, leaving
+    the caller to report them. Time taken by each stage is
+    kept in stats.
     """
-    def __init__(self, signer: KernelModSigner, mod_path: str):
+    def __init__(self, signer: KernelModSigner, mod_path: str,
+                 opts: ToolOpts | None = None):
         self.signer: KernelModSigner = signer
+        self.opts: ToolOpts = opts if opts else ToolOpts()
+        self.msg: str = ''
         self.data: bytes = b''
         self.compress: bool = False
+        self.codec: CodecParams | None = None
         self.signed: bool = False
+        self.skipped: bool = False
         self.mod_path: str = ''
         self.mod_dir: str = ''
         self.fpath: str = ''
         self.fext: str = ''
+        self.fmt: str = ''
         self.path_ok: bool = False
+        self.stats: ModuleStats = ModuleStats()
+
+        # if set (hashlib object) updated with bytes written to module
+        self.out_hash: Any = None
 
         path_exists = os.path.exists(mod_path)
         if path_exists and os.path.isfile(mod_path):
@@ -182,114 +343,222 @@ class ModuleTool:
             if self.fext in known_ext:
                 self.path_ok = True
             else:
-                print('Unkown extension: ' + self.fext)
+                self.msg = 'Unkown extension: ' + self.fext
         else:
-            print('Bad Module file: ' + mod_path)
+            self.msg = 'Bad Module file: ' + mod_path
 
     def is_signed(self):
         """
-        Examone an uncompress module to determine if it is signed
+        Examine an uncompressed module to determine if it is signed
         """
         if self.signed:
             return self.signed
 
-        sign_flag = b'Module signature'
-        chunk = 100
-        size = len(self.data)
-        byte_0 = 0
-        byte_1 = size-1
-        if size - chunk >= chunk:
-            byte_0 = size - chunk
-
-        found = self.data.find(sign_flag, byte_0, byte_1)
-        if found >= 0:
-            self.signed = True
+        self.signed = is_signed(self.data)
         return self.signed
 
+    def is_current(self) -> bool:
+        """
+        True if module is already signed with the current key.
+
+        Only the signer identity is compared - the signature itself
+        is not verified. Uncompressed and large modules only keep
+        the tail in memory, others are read (and kept) in full.
+        """
+        cert_id = self.signer.signer_id
+        if not cert_id or not self._sniff():
+            return False
+
+        if self.fmt == '.ko' or self._is_large():
+            with self.stats.stage('check'):
+                tail = read_tail(self.fmt, self.mod_path, self.opts.bufsize)
+        else:
+            tail = self.read()
+        if not tail:
+            return False
+
+        with self.stats.stage('check'):
+            sig = sig_bytes(tail)
+            sig_id = sig_signer_id(sig) if sig else None
+        return bool(sig_id and cert_id.matches(sig_id))
+
     def read(self):
         """
          Read module and decompress as needed
         """
         if self.data:
             return self.data
-        fobj = open_file(self.mod_path, 'rb')
-        if fobj:
-            raw_data = fobj.read()
-            fobj.close()
-        else:
+        if not self._sniff():
+            return None
+
+        with self.stats.stage('read'):
+            fobj = open_file(self.mod_path, 'rb')
+            if fobj:
+                raw_data = fobj.read()
+                fobj.close()
+            else:
+                return None
+        self.stats.bytes_in = len(raw_data)
+
+        # decompress if needed - format from _sniff()
+        try:
+            with self.stats.stage('decompress'):
+                data = decompress(raw_data, self.fmt)
+        except (OSError, EOFError) + codec_errors(self.fmt) as err:
+            self.msg = f'Failed to decompress: {err}'
+            return None
+
+        if not data.startswith(ELF_MAGIC):
+            self.msg = 'Not an ELF module'
             return None
 
-        # decompress if needed - allowed extensions pre-validated in init()
-        match self.fext:
-            case '.ko':
-                self.data = raw_data
-                self.compress = False
-            case '.zst':
-                dctx = zstandard.ZstdDecompressor()
-                self.data = dctx.decompress(raw_data)
-                self.compress = True
-            case '.xz':
-                self.data = lzma.decompress(raw_data)
-                self.compress = True
-            case  '.gz':
-                self.data = gzip.decompress(raw_data)
-                self.compress = True
+        self.data = data
         return self.data
 
+    def kernel_version(self) -> str:
+        """
+        Kernel release the module was built for (from vermagic)
+        or empty if not found.
+
+        Large modules are scanned without keeping them in memory,
+        others are read (and kept) in full.
+        """
+        if not self._sniff():
+            return ''
+
+        if not self._is_large():
+            data = self.read()
+            return kernel_release(vermagic(data)) if data else ''
+
+        fobj = open_file(self.mod_path, 'rb')
+        if not fobj:
+            return ''
+        try:
+            magic = stream_vermagic(fobj, self.fmt, self.opts.bufsize)
+        except (OSError, EOFError) + codec_errors(self.fmt):
+            magic = ''
+        finally:
+            fobj.close()
+        return kernel_release(magic)
+
     def sign(self):
         """
-         sign temp file, compress if needed  and rename to orig.
+         Sign module, compress if needed and replace original.
+
+         Everything is done in memory - the only write is the
+         final one which replaces the module (temp file + rename).
+         Large modules are streamed to keep memory use bounded.
         """
-        # pylint: disable=R0911
         okay = True
+        if not self.opts.force and self.is_current():
+            self.skipped = True
+            return okay
+
+        # read() reports any failure to sniff the format
+        if self.signer.native and self._is_large() and self._sniff() \
+                and self.codec:
+            return self._sign_stream()
+
         data = self.read()
         if not data:
             return not okay
 
-        ftmp = str(uuid.uuid4())
-        ptmp = os.path.join(self.mod_dir, ftmp)
-        fobj = open_file(ptmp, 'wb')
-        if fobj:
-            fobj.write(data)
-            fobj.close()
-        else:
+        with self.stats.stage('strip'):
+            if self.is_signed():
+                data = strip_sig(data)
+                self.stats.stripped = True
+
+        with self.stats.stage('sign'):
+            signed = self.signer.sign_data(data, self.stats)
+        if signed is None:
+            self.msg = 'Signing failed'
             return not okay
 
-        if self.is_signed():
-            ret = strip_sig(ptmp)
-            if ret != 0:
-                print('Failed to strip temp file')
-                remove_file(ptmp)
-                return not okay
+        mod_data = signed
+        if self.compress and self.codec:
+            with self.stats.stage('compress'):
+                mod_data = compress(signed, self.codec)
+        self.stats.bytes_out = len(mod_data)
+        if self.out_hash:
+            self.out_hash.update(mod_data)
 
-        ret = self.signer.sign_module(ptmp)
-        if ret != 0:
-            remove_file(ptmp)
+        if not write_file_atomic(self.mod_path, mod_data, self.stats.stages):
+            self.msg = 'Failed to write module'
             return not okay
+        return okay
 
-        if self.compress:
-            fobj = open_file(ptmp, 'rb')
-            if fobj:
-                raw_data = fobj.read()
-                fobj.close()
-            else:
-                return not okay
-
-            match self.fext:
-                case '.zst':
-                    cctx = zstandard.ZstdCompressor()
-                    mod_data = cctx.compress(raw_data)
-                case '.xz':
-                    mod_data = lzma.compress(raw_data)
-                case  '.gz':
-                    mod_data = gzip.compress(raw_data)
-            fobj = open_file(ptmp, 'wb')
-            if fobj:
-                fobj.write(mod_data)
-                fobj.close()
-            else:
-                remove_file(ptmp)
-                return not okay
-
-        os.rename(ptmp, self.mod_path)
+    def _sign_stream(self) -> bool:
+        """
+        Sign large module using bounded memory - see mod_stream.
+        """
+        native = self.signer.native
+        if not (native and self.codec):
+            return False
+
+        self.stats.streamed = True
+        self.stats.signer = 'native'
+        self.stats.bytes_in = _file_size(self.mod_path)
+        with self.stats.stage('stream'):
+            (okay, self.msg) = sign_stream(native, self.mod_path,
+                                           self.codec, self.opts.bufsize,
+                                           self.stats, self.out_hash)
+        if okay:
+            self.stats.bytes_out = _file_size(self.mod_path)
         return okay
+
+    def _sniff(self) -> bool:
+        """
+        Find format and compression parameters from start of file.
+        Only a small read - done once.
+        """
+        if self.fmt:
+            return True
+
+        with self.stats.stage('sniff'):
+            fobj = open_file(self.mod_path, 'rb')
+            if not fobj:
+                self.msg = 'Failed to read module'
+                return False
+            head = fobj.read(HEAD_SIZE)
+            fobj.close()
+
+        fmt = sniff_format(head)
+        if not fmt:
+            self.msg = 'Not a kernel module (unknown format)'
+            return False
+
+        self.fmt = fmt
+        self.stats.codec = fmt
+        self.compress = fmt != '.ko'
+        self.codec = self._codec_params(head)
+        return True
+
+    def _codec_params(self, head: bytes) -> CodecParams:
+        """
+        Compression parameters from start of (compressed) module
+        together with any level / threads settings.
+        """
+        params = detect_params(self.fmt, head)
+        if self.opts.level is not None:
+            params.level = self.opts.level
+        params.threads = self.opts.threads
+        if self.fmt == '.xz' and self.opts.xz_one_block:
+            params.threads = 1
+        return params
+
+    def _is_large(self) -> bool:
+        """
+        True if module should be streamed
+        """
+        size = _file_size(self.mod_path)
+        return size > 0 and size >= self.opts.stream_size
+
+
+def _file_size(path: str) -> int:
+    """
+    Size of file or 0 on error.
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
@@ -0,0 +1,216 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2020-present  Gene C <arch@sapience.com>
+"""
+Identify who signed a module.
+
+The PKCS#7 signature appended to a module names its signer in the
+SignerInfo, either by certificate issuer and serial number (what
+sign-file uses by default) or by subject key identifier (sign-file -k).
+Both are compared with the same fields of the signing certificate.
+
+Everything is parsed with the small DER reader in der, so this
+works without python cryptography (e.g. when using sign-file).
+
+ContentInfo layout (RFC 5652):
+
+    SEQUENCE { contentType OID,
+               [0] SignedData SEQUENCE {
+                   version, digestAlgorithms SET, encapContentInfo,
+                   [0] certificates OPTIONAL, [1] crls OPTIONAL,
+                   signerInfos SET { SignerInfo SEQUENCE {
+                       version, sid, digestAlgorithm,
+                       [0] signedAttrs OPTIONAL, signatureAlgorithm,
+                       signature OCTET STRING, ... } } } }
+
+sid is issuerAndSerialNumber SEQUENCE or [0] IMPLICIT subjectKeyIdentifier.
+"""
+from dataclasses import dataclass
+import base64
+import hashlib
+
+from .der import (TAG_CONTEXT_0, TAG_CONTEXT_3, TAG_INTEGER, TAG_OID,
+                  TAG_SEQUENCE, TAG_SET, der_content, der_items, der_oid,
+                  der_seq)
+from .utils import open_file
+
+_OID_SKID = der_oid('2.5.29.14')
+_TAG_SKID = 0x80
+
+#
+# khash -> (digest oid, ecdsa signature oid)
+#
+HASH_OIDS: dict[str, tuple[str, str]] = {
+        'sha1': ('1.3.14.3.2.26', '1.2.840.10045.4.1'),
+        'sha224': ('2.16.840.1.101.3.4.2.4', '1.2.840.10045.4.3.1'),
+        'sha256': ('2.16.840.1.101.3.4.2.1', '1.2.840.10045.4.3.2'),
+        'sha384': ('2.16.840.1.101.3.4.2.2', '1.2.840.10045.4.3.3'),
+        'sha512': ('2.16.840.1.101.3.4.2.3', '1.2.840.10045.4.3.4'),
+        'sha3-256': ('2.16.840.1.101.3.4.2.8', '2.16.840.1.101.3.4.3.10'),
+        'sha3-384': ('2.16.840.1.101.3.4.2.9', '2.16.840.1.101.3.4.3.11'),
+        'sha3-512': ('2.16.840.1.101.3.4.2.10', '2.16.840.1.101.3.4.3.12'),
+        }
+
+
+def digest_oid(khash: str) -> str:
+    """
+    Dotted digest algorithm OID for kernel hash name or empty if unknown.
+    """
+    return HASH_OIDS.get(khash, ('', ''))[0]
+
+
+@dataclass
+class SignerId:
+    """
+    Signer identity.
+
+    issuer_serial is the DER SEQUENCE { issuer, serialNumber }
+    skid is the subject key identifier.
+    digest_oid (DER) is the hash algorithm, if known.
+    """
+    issuer_serial: bytes = b''
+    skid: bytes = b''
+    digest_oid: bytes = b''
+
+    def matches(self, other: 'SignerId') -> bool:
+        """
+        True if both identify the same key (and hash where known).
+        """
+        if self.digest_oid and other.digest_oid \
+                and self.digest_oid != other.digest_oid:
+            return False
+
+        if self.issuer_serial and self.issuer_serial == other.issuer_serial:
+            return True
+        if self.skid and self.skid == other.skid:
+            return True
+        return False
+
+    def key_id(self) -> str:
+        """
+        Short stable id (hex) for this key and hash.
+        """
+        ident = self.issuer_serial + self.skid + self.digest_oid
+        return hashlib.sha256(ident).hexdigest()[:32]
+
+
+def _first(items: list[tuple[int, bytes]], tag: int) -> bytes:
+    """
+    First item with tag (complete encoding) or empty.
+    """
+    for (item_tag, tlv) in items:
+        if item_tag == tag:
+            return tlv
+    return b''
+
+
+def _cert_skid(extensions: bytes) -> bytes:
+    """
+    Subject key identifier from [3] extensions of certificate.
+    """
+    for (_tag, ext) in der_items(der_content(der_content(extensions))):
+        parts = der_items(der_content(ext))
+        if not parts or parts[0][1] != _OID_SKID:
+            continue
+        # extnValue is OCTET STRING wrapping OCTET STRING keyIdentifier
+        return der_content(der_content(parts[-1][1]))
+    return b''
+
+
+def cert_signer_id(crt_path: str) -> SignerId | None:
+    """
+    Signer identity of an X.509 certificate (DER or PEM).
+
+    Returns:
+        SignerId | None:
+        None if certificate can't be read.
+    """
+    fobj = open_file(crt_path, 'rb')
+    if not fobj:
+        return None
+    data = fobj.read()
+    fobj.close()
+
+    if data.startswith(b'-----'):
+        lines = data.decode('ascii', 'ignore').splitlines()
+        body = ''.join(line for line in lines if not line.startswith('-----'))
+        try:
+            # binascii.Error is a ValueError
+            data = base64.b64decode(body)
+        except ValueError:
+            return None
+
+    cert = der_items(der_content(data))
+    if not cert or cert[0][0] != TAG_SEQUENCE:
+        return None
+
+    #
+    # tbsCertificate: [0] version, serial, signature, issuer, ...
+    #
+    tbs = der_items(der_content(cert[0][1]))
+    if tbs and tbs[0][0] == TAG_CONTEXT_0:
+        tbs = tbs[1:]
+    if len(tbs) < 3 or tbs[0][0] != TAG_INTEGER:
+        return None
+
+    signer_id = SignerId()
+    signer_id.issuer_serial = der_seq(tbs[2][1], tbs[0][1])
+    signer_id.skid = _cert_skid(_first(tbs, TAG_CONTEXT_3))
+    return signer_id
+
+
+def signer_info(sig: bytes) -> list[tuple[int, bytes]]:
+    """
+    Fields of the SignerInfo in PKCS#7 module signature.
+
+    Kernel only uses the first signer.
+
+    Returns:
+        list[tuple[tag: int, tlv: bytes]]:
+        Empty if signature can't be parsed.
+    """
+    content_info = der_items(der_content(sig))
+    signed = _first(content_info, TAG_CONTEXT_0)
+    if not signed:
+        return []
+
+    signed_data = der_items(der_content(der_content(signed)))
+    signer_infos = [tlv for (tag, tlv) in signed_data if tag == TAG_SET]
+    if len(signer_infos) < 2:
+        # digestAlgorithms and signerInfos
+        return []
+
+    infos = der_items(der_content(signer_infos[-1]))
+    if not infos:
+        return []
+
+    info = der_items(der_content(infos[0][1]))
+    if len(info) < 3:
+        return []
+    return info
+
+
+def sig_signer_id(sig: bytes) -> SignerId | None:
+    """
+    Signer identity from PKCS#7 module signature.
+
+    Returns:
+        SignerId | None:
+        None if signature can't be parsed.
+    """
+    info = signer_info(sig)
+    if not info:
+        return None
+
+    signer_id = SignerId()
+    (sid_tag, sid) = info[1]
+    if sid_tag == TAG_SEQUENCE:
+        signer_id.issuer_serial = sid
+    elif sid_tag == _TAG_SKID:
+        signer_id.skid = der_content(sid)
+    else:
+        return None
+
+    digest_algo = der_items(der_content(info[2][1]))
+    if digest_algo and digest_algo[0][0] == TAG_OID:
+        signer_id.digest_oid = digest_algo[0][1]
+    return signer_id
@@ -4,79 +4,107 @@
  Update kernel config(s)
 """
 import os
-import uuid
 
 from ._genkeys_base import GenKeysBase
-from .utils import open_file
+from .kconfig_cache import (KCONFIG_CACHE_NAME, KconfigCache)
+from .kernel_config import (TRUSTED_KEYS_NAME, KernelConfig)
 
 
-def _save_config(new_config_rows: list[str], conf_temp: str,
-                 conf: str, verb: bool) -> bool:
+def _stage_one_config(genkeys: GenKeysBase, kconfig_path: str,
+                      signing_key: str, cache: KconfigCache
+                      ) -> KernelConfig | None:
     """
-    Write the udpated config
-     - first update temp then rename
+    Set signing key in one kernel config and stage it if changed.
+     - uses config already read by get_key_hash if there is one
+     - None if cache shows config unchanged and already has
+       signing_key - config is then not read
+     - kconf.okay is False if config could not be read or staged
     """
-    new_config = ''.join(new_config_rows)
-    if verb:
-        print(f'Updating config: {conf}')
-
-    fobj = open_file(conf_temp, 'w')
-    if fobj:
-        fobj.write(new_config)
-        fobj.close()
-        os.rename(conf_temp, conf)
-    else:
-        print(f'Failed to write: {conf_temp}')
-        return False
-    return True
+    kconf = genkeys.kconfigs.get(kconfig_path)
+    if not kconf:
+        try:
+            entry = cache.get(kconfig_path, os.stat(kconfig_path))
+        except OSError:
+            entry = None
+        if entry and entry.trusted_keys == signing_key:
+            return None
+        kconf = KernelConfig(kconfig_path)
+
+    if not kconf.okay:
+        print(f'Failed to open: {kconfig_path}')
+        return kconf
+
+    kconf.set(TRUSTED_KEYS_NAME, signing_key)
+    if not kconf.stage():
+        kconf.okay = False
+    return kconf
 
 
-def _update_one_config(genkeys: GenKeysBase, kconfig_path: str,
-                       signing_key: str) -> bool:
+def _stage_configs(genkeys: GenKeysBase, signing_key: str,
+                   cache: KconfigCache) -> list[KernelConfig | None]:
     """
-    update one kernel config
+    Read, update and stage all configs - concurrently when several.
     """
-    #
-    # Make temp file in same dir to avoid rename across file systems
-    #
-    kconfig_dir = os.path.dirname(kconfig_path)
-    kconfig_name_temp = str(uuid.uuid4())
-    kconfig_path_temp = os.path.join(kconfig_dir, kconfig_name_temp)
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ThreadPoolExecutor
 
-    conf_name = 'CONFIG_SYSTEM_TRUSTED_KEYS='
+    kconfig_paths = list(dict.fromkeys(os.path.abspath(kconfig) for kconfig
+                                       in genkeys.kconfig_list))
 
-    # read existing config
-    fobj = open_file(kconfig_path, 'r')
-    if fobj:
-        kconfig_rows = fobj.readlines()
-        fobj.close()
-    else:
-        print(f'Failed to open: {kconfig_path}')
+    def _stage(kconfig_path: str) -> KernelConfig | None:
+        return _stage_one_config(genkeys, kconfig_path, signing_key, cache)
+
+    if len(kconfig_paths) <= 1:
+        return [_stage(kconfig_path) for kconfig_path in kconfig_paths]
+
+    workers = min(len(kconfig_paths), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_stage, kconfig_paths))
+
+
+def _commit_configs(kconfs: list[KernelConfig], verb: bool) -> bool:
+    """
+    Rename all staged configs into place - or none if any failed
+    to stage. Directories are then fsync'ed so the renames are durable.
+    """
+    if not all(kconf.okay for kconf in kconfs):
+        for kconf in kconfs:
+            kconf.discard()
+        print('Configs not updated')
         return False
 
-    changed = True
-    config_rows = []
-    for row in kconfig_rows:
-        if row.startswith(conf_name):
-            rsplit = row.split('=')
-            cur_signing_key = rsplit[1]
-            if cur_signing_key == signing_key:
-                changed = False
-                break
-            new_row = conf_name + signing_key
-            config_rows.append(new_row)
+    all_ok = True
+    dirs: set[str] = set()
+    for kconf in kconfs:
+        if not kconf.changed:
+            if verb:
+                print('config up to date')
+            continue
+
+        if verb:
+            print(f'Updating config: {kconf.path}')
+        if kconf.commit():
+            dirs.add(os.path.dirname(kconf.path))
         else:
-            config_rows.append(row)
+            all_ok = False
 
-    if changed:
-        if not _save_config(config_rows, kconfig_path_temp,
-                            kconfig_path, genkeys.verb):
-            return False
-    else:
-        if genkeys.verb:
-            print('config up to date')
+    for kdir in dirs:
+        _fsync_dir(kdir)
+    return all_ok
 
-    return True
+
+def _fsync_dir(kdir: str):
+    """
+    fsync directory (makes renames in it durable).
+    """
+    try:
+        dfd = os.open(kdir, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dfd)
+        finally:
+            os.close(dfd)
+    except OSError as err:
+        print(f'Failed to sync {kdir}: {err}')
 
 
 def update_configs(genkeys: GenKeysBase) -> bool:
@@ -84,12 +112,15 @@ def update_configs(genkeys: GenKeysBase) -> bool:
     Update configs with new keys if needed
     Safest is to always read the current link and check config
     regardless if key was refreshed.
+
+    Configs are read and changed ones written to fsync'ed temp files
+    concurrently. Only when every config was staged are they renamed
+    into place, so a failure leaves all configs as they were.
     """
     #
     # Confirm path to actual directory and not the link
     # name which doesn't change
     #
-    all_ok = True
     keydir = ''
     keyname = 'signing_key.pem'
     keycur = os.path.join(genkeys.cert_dir, 'current')
@@ -106,14 +137,41 @@ def update_configs(genkeys: GenKeysBase) -> bool:
         #
         # format to match RHS of kernel config file
         #
-        signing_key = '"' + signing_key + '"\n'
+        signing_key = '"' + signing_key + '"'
     else:
         print(f'Missing: {keycur}')
         return False
 
-    for kconfig in genkeys.kconfig_list:
-        kconfig_path = os.path.abspath(kconfig)
-        okay = _update_one_config(genkeys, kconfig_path, signing_key)
-        all_ok &= okay
-
+    cache = KconfigCache(os.path.join(genkeys.cert_dir, KCONFIG_CACHE_NAME))
+    kconfs: list[KernelConfig] = []
+    for kconf in _stage_configs(genkeys, signing_key, cache):
+        if not kconf:
+            if genkeys.verb:
+                print('config up to date')
+            continue
+        genkeys.kconfigs[kconf.path] = kconf
+        kconfs.append(kconf)
+
+    all_ok = _commit_configs(kconfs, genkeys.verb)
+    _update_cache(genkeys, cache)
     return all_ok
+
+
+def _update_cache(genkeys: GenKeysBase, cache: KconfigCache):
+    """
+    Record what configs we read now contain - rewritten ones have a
+    new fingerprint - so the next run need not read them.
+    """
+    for kconf in genkeys.kconfigs.values():
+        if not (kconf.okay and kconf.stat):
+            continue
+        entry = cache.get(kconf.path, kconf.stat)
+        if entry:
+            (okay, key_type, hash_type) = (True, entry.key_type,
+                                           entry.hash_type)
+        else:
+            (okay, key_type, hash_type) = kconf.key_hash_types()
+        if okay:
+            cache.put(kconf.path, kconf.stat, key_type, hash_type,
+                      kconf.get(TRUSTED_KEYS_NAME) or '')
+    cache.save()
@@ -3,10 +3,14 @@
 """
 # Support module for kernel signing tools
 """
-from typing import IO
+from typing import (IO, Any)
 import os
+from dataclasses import asdict
 from datetime import datetime
 import glob
+import json
+import time
+import uuid
 
 
 def date_time_now() -> datetime:
@@ -56,3 +60,118 @@ def open_file(path: str, mode: str) -> IO | None:
         fobj = None
 
     return fobj
+
+
+def write_file_atomic(path: str, data: bytes | memoryview,
+                      timings: dict[str, float] | None = None) -> bool:
+    """
+    Replace file with data.
+
+    Written to temp file in same directory (avoids rename across
+    file systems) then renamed over the original.
+    If timings given, the secs taken to 'write' and 'rename'
+    are added to it.
+    """
+    path_dir = os.path.dirname(os.path.abspath(path))
+    path_temp = os.path.join(path_dir, str(uuid.uuid4()))
+
+    start = time.perf_counter()
+    fobj = open_file(path_temp, 'wb')
+    if not fobj:
+        return False
+
+    try:
+        fobj.write(data)
+        fobj.close()
+        written = time.perf_counter()
+        os.rename(path_temp, path)
+        if timings is not None:
+            timings['write'] = timings.get('write', 0.0) + written - start
+            timings['rename'] = timings.get('rename', 0.0) \
+                + time.perf_counter() - written
+
+    except OSError as err:
+        print(f'Failed to write {path}: {err}')
+        fobj.close()
+        remove_file(path_temp)
+        return False
+    return True
+
+
+def load_json_entries[T](path: str, version: int, section: str,
+                         entry_type: type[T]) -> dict[str, T]:
+    """
+    Read versioned json file of named entries:
+
+        {"version": version, section: {name: {field: value, ...}, ...}}
+
+    Missing or bad file, or a different version, gives no entries.
+    Entries not matching entry_type (a dataclass) are dropped.
+    """
+    entries: dict[str, T] = {}
+    if not os.path.exists(path):
+        return entries
+
+    fobj = open_file(path, 'r')
+    if not fobj:
+        return entries
+    try:
+        data = json.load(fobj)
+    except ValueError:
+        print(f'Ignoring bad file: {path}')
+        data = {}
+    fobj.close()
+
+    if not isinstance(data, dict) or data.get('version') != version:
+        return entries
+
+    for (name, item) in data.get(section, {}).items():
+        try:
+            entries[name] = entry_type(**item)
+        except TypeError:
+            continue
+    return entries
+
+
+def save_json_entries(path: str, version: int, section: str,
+                      entries: dict[str, Any]) -> bool:
+    """
+    Write entries (dataclasses) in the form read by load_json_entries()
+    using write_file_atomic().
+    """
+    data = {'version': version,
+            section: {name: asdict(entry)
+                      for (name, entry) in sorted(entries.items())}}
+    return write_file_atomic(path, json.dumps(data, indent=1).encode())
+
+
+def parse_opts(obj: Any, desc: str, options: list[tuple[Any, dict]]):
+    """
+    Parse command line and save each option as attribute of obj.
+
+    Args:
+        obj (Any):
+        Object to update (e.g. GenKeysBase, SignOpts).
+
+        desc (str):
+        Program description for help.
+
+        options (list[tuple[str | tuple[str, ...], dict]]):
+        Each is (flag or flags, argparse add_argument kwargs).
+    """
+    # pylint: disable=import-outside-toplevel
+    import argparse
+
+    par = argparse.ArgumentParser(description=desc)
+    for (opt_list, kwargs) in options:
+        if isinstance(opt_list, str):
+            par.add_argument(opt_list, **kwargs)
+        else:
+            par.add_argument(*opt_list, **kwargs)
+
+    parsed = par.parse_args()
+    if not parsed:
+        return
+
+    for (key, val) in vars(parsed).items():
+        setattr(obj, key, val)
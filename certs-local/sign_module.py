@@ -17,11 +17,50 @@ Signs one or more kernel modules
 
 dkms uses (2)
 
+With -r the directory is searched recursively, optionally
+filtered with -I / -X globs (see lib/mod_find.py). Signing
+starts while the tree is still being searched.
+
+Modules may be signed in parallel using -j <jobs>.
+
+Signing is done in process when python cryptography is available,
+otherwise (or with -s) the kernel sign-file tool is used.
+
+Large modules (see --stream-size) are signed in chunks to keep
+memory use bounded (needs in process signing).
+
 Modules can be uncompressed (.ko) or compressed
 with zstd (.zst), xz (.xz) or gzip (.gz)
 
 Modules may also be already signed in which case the
-signature is removeed before re-signing.
+signature is removeed before re-signing. Modules already
+signed with the current key are skipped unless -f is given.
+
+A manifest (certs-local/sign-manifest.json) records the stat
+fingerprint, content hash and key of each signed module. Modules
+it shows to be unchanged are skipped without being opened.
+
+sign_module.py --serve runs a signing daemon which keeps keys
+loaded. When it is running, sign_module.py hands modules to it
+over a unix socket and falls back to signing itself otherwise.
+
+--report FILE writes one json record per module with the time
+taken by each stage (read, decompress, strip, sign, compress,
+write, rename ...), sizes, codec and sign-file exit status,
+followed by a summary record (see lib/sign_report.py).
+--json writes the same to stdout in place of the usual output.
+
+-K KVER (repeatable) or --all-kernels signs modules for several
+kernels in one run. Each module goes to the keys of the kernel named
+in its vermagic (<kernel-root>/<kver>/build/certs-local) and all
+share one worker pool. Without modules or -d, each kernel's updates/
+directory is signed (see lib/kernel_signers.py).
+
+--verify checks the signatures of the modules given (or -d dir)
+against the current key and any earlier key in certs-local, and
+--audit DIR does the same for every module under DIR. Modules
+unsigned, signed with an earlier (stale) key, with an unknown
+key or with a bad signature are listed (see lib/mod_verify.py).
 
 Supporting files need to be installed in same directory -
 this is handled by install-certs.py signer_class.py and utils.py
@@ -43,119 +82,294 @@ key files reside in current dir:
   /usr/lib/modules/<kern-vers>/build/certs-local/current/
   signing_key.pem , signing_crt.crt, khash
 
-We use file extension to determine if/how compressed.
-We do not use magic bytes.
+The file extension selects which files are modules, while
+the compression type is found from the leading magic bytes.
+Files that are not compressed or plain ELF modules are rejected.
 We work in memory rather than via filesystem.
-Each module is small emough its not a problem
+Most modules are small enough its not a problem. Large
+ones are streamed.
 
 While it may be fine to leave existing sig and sign
 the (already previously) signed module - we choose to remove it.
-Maybe simpler and cleaner not to bother - however, not clear if
-this might cause problem for kernel sig check or not.
-So we strip it out. This also removes any debug symbols
-so it has a downside if the module had any debug info.
+The signature is cut off using the appended signature trailer,
+so any debug info in the module is kept.
 """
+from typing import (TYPE_CHECKING, Iterable, Iterator)
 import os
 import sys
+import time
 
-from lib import (ModuleTool, KernelModSigner)
+from lib import (FindOpts, KernelModSigner, SignManifest, SignOpts,
+                 SignResult, ToolOpts, daemon_sign, find_modules,
+                 sign_modules, socket_path)
 
+if TYPE_CHECKING:
+    from lib import VerifyResult
 
-def modules_from_dir(mdir: str) -> list[str]:
-    """
-    Get a list of kernel modules from a directory
 
-    Returns list of (recognizable) modules located in a directory
+def modules_from_dir(mdir: str, find_opts: FindOpts) -> Iterator[str]:
     """
-    mod_list: list[str] = []
+    Kernel modules in a directory (tree).
 
-    #
-    # Includes modules with known compressed extensions
-    #
+    Returns generator of (recognizable) modules located in a directory
+    so signing can start while still looking - see find_modules.
+    """
     if not os.path.exists(mdir):
-        print(f'Module directory bad: {mdir}')
-        return mod_list
+        print(f'Module directory bad: {mdir}', file=sys.stderr)
+        return iter([])
 
     if not os.path.isdir(mdir):
-        print(f'Module directory must be a directory: {mdir}')
-        return mod_list
+        print(f'Module directory must be a directory: {mdir}', file=sys.stderr)
+        return iter([])
 
-    mod_dir = os.path.abspath(mdir)
-    known_exts = ['.ko', '.ko.zst', '.ko.xz', '.ko.gz']
+    return find_modules(mdir, find_opts)
 
-    try:
-        scan = os.scandir(mod_dir)
-    except OSError:
-        print(f'Error scanning directory {mod_dir}')
-        return mod_list
 
-    for item in scan:
-        if item.is_file():
-            for ext in known_exts:
-                if item.name.endswith(ext):
-                    mod_path = os.path.join(mod_dir, item.name)
-                    mod_list.append(mod_path)
-                    break
-    return mod_list
+def verify_manifest(manifest: SignManifest | None, jobs: int):
+    """
+    Check manifest entries against the module files.
+    Drops any that no longer match.
+    """
+    if not manifest:
+        print('No manifest available')
+        return
 
+    bad = manifest.verify(jobs)
+    for mod_path in bad:
+        print(f'Manifest stale: {mod_path}')
 
-def parse_args(arv):
-    """
-    Get modules to be signed.
+    num_good = len(manifest.entries) - len(bad)
+    print(f'Manifest: {num_good} of {len(manifest.entries)} entries okay')
+    if manifest.save():
+        print('Success: all done')
 
-    Command line handling - either 1) or 2)
-        1. 1 or more modules as list
-        2. -d <module dir>
+
+def report(results: list[SignResult]):
+    """
+    Summary of signing results in module order.
     """
-    myname = arv[0]
-    if len(arv) == 1:
+    if not results:
         print('No modules to sign')
-        return myname, None
-
-    if arv[1] == '-d':
-        if len(arv) >= 3:
-            mod_dir = arv[2]
-        else:
-            print('Missing module dir after -d')
-            return myname, None
-        modules = modules_from_dir(mod_dir)
-    else:
-        modules = arv[1:]
+        return
 
-    return myname, modules
+    num_failed = 0
+    for result in results:
+        if not result.found:
+            print(f'Module not found: {result.mod_path}')
+        elif not result.okay:
+            num_failed += 1
+            msg = f'Problem signing: {result.mod_path}'
+            if result.msg:
+                msg += f' : {result.msg}'
+            print(msg)
+
+    if len(results) > 1:
+        num_skipped = sum(1 for result in results if result.skipped)
+        num_signed = sum(1 for result in results if result.okay) - num_skipped
+        msg = f'Signed {num_signed} of {len(results)} modules'
+        if num_skipped:
+            msg += f' ({num_skipped} already signed with current key)'
+        print(msg)
+    elif results and results[0].skipped:
+        print('Already signed with current key')
+
+    if num_failed == 0:
+        print('Success: all done')
+
+
+def verify(opts: SignOpts, modules: Iterable[str]):
+    """
+    Check module signatures against current and earlier keys.
+    """
+    # pylint: disable=import-outside-toplevel
+    from lib import ModuleVerifier
 
+    cert_dir = os.path.dirname(os.path.realpath(opts.myname))
+    verifier = ModuleVerifier(cert_dir)
+    if not verifier.okay:
+        print(f'Unable to verify: {verifier.msg}')
+        return
 
-def main():
+    results = verifier.verify_modules(modules, opts.jobs)
+    report_verify(results)
+
+
+def report_verify(results: list['VerifyResult']):
     """
-    sign_module: -d <dir> or mod1 mod2 ...
+    List modules not signed by current key then counts.
     """
-    arv = sys.argv
-    myname, modules = parse_args(arv)
-    if not modules:
-        print('No modules to sign')
+    if not results:
+        print('No modules to verify')
+        return
+
+    labels = {'stale': 'Stale key',
+              'unsigned': 'Unsigned',
+              'unknown': 'Unknown key',
+              'invalid': 'Bad signature',
+              'error': 'Error'}
+    counts = {status: 0 for status in ('valid', *labels)}
+    for result in results:
+        counts[result.status] += 1
+        if result.status == 'valid':
+            continue
+        msg = f'{labels[result.status]}: {result.mod_path}'
+        if result.status == 'stale':
+            msg += f' ({result.key})'
+        if result.msg:
+            msg += f' : {result.msg}'
+        print(msg)
+
+    summary = ', '.join(f'{count} {labels.get(status, status).lower()}'
+                        for (status, count) in counts.items()
+                        if count or status == 'valid')
+    print(f'Verified {len(results)} modules: {summary}')
+    if counts['valid'] == len(results):
+        print('Success: all done')
+
+
+def find_options(opts: SignOpts, recursive: bool) -> FindOpts:
+    """
+    How to look for modules - from command line.
+    """
+    return FindOpts(recursive=recursive,
+                    include=opts.include, exclude=opts.exclude,
+                    follow_symlinks=opts.symlinks == 'follow',
+                    one_fs=opts.one_file_system)
+
+
+def sign_kernels(opts: SignOpts, modules: Iterable[str] | None,
+                 tool_opts: ToolOpts, start: float):
+    """
+    Sign modules for several kernels - each with its own keys.
+    Without modules, those in each kernel's updates/ are signed.
+    """
+    # pylint: disable=import-outside-toplevel
+    from lib import (KernelSigners, installed_kernels)
+
+    kvers = opts.kernel
+    if opts.all_kernels:
+        kvers = installed_kernels(opts.kernel_root)
+
+    signers = KernelSigners(opts.kernel_root, kvers,
+                            native=not opts.sign_file,
+                            manifest=not opts.no_manifest,
+                            rebuild=opts.rebuild_manifest)
+    if not signers.signers:
+        print('No kernels with signing keys', file=sys.stderr)
         return
 
+    if modules is None:
+        modules = signers.modules(find_options(opts, True))
+
+    results = signers.sign_modules(modules, opts.jobs, tool_opts)
+    if not signers.save():
+        print('Failed to save manifest', file=sys.stderr)
+    finish(opts, results, start)
+
+
+def finish(opts: SignOpts, results: list[SignResult], start: float):
+    """
+    Report results - as json lines (--report/--json) and/or text.
+    """
+    if opts.report:
+        # pylint: disable=import-outside-toplevel
+        from lib import write_report
+        write_report(opts.report, results, time.perf_counter() - start)
+
+    if not opts.json:
+        report(results)
+        if opts.verb:
+            # pylint: disable=import-outside-toplevel
+            from lib import prog_usage
+            for line in prog_usage(results).lines():
+                print(line)
+
+
+def sign(opts: SignOpts, modules: Iterable[str], tool_opts: ToolOpts,
+         start: float):
+    """
+    Sign modules for this kernel - via daemon if running.
+    """
+    #
+    # Use daemon if running - unless asked for something only we do
+    #
+    local_only = (opts.no_daemon or opts.sign_file or opts.no_manifest
+                  or opts.rebuild_manifest or opts.verify_manifest)
+    sock_path = socket_path(opts.myname)
+    if not local_only and os.path.exists(sock_path):
+        modules = list(modules)
+        results = daemon_sign(sock_path, modules, tool_opts)
+        if results is not None:
+            finish(opts, results, start)
+            return
+
     #
     # Instantiate signer
     #
-    signer = KernelModSigner(myname)
+    signer = KernelModSigner(opts.myname, native=not opts.sign_file)
     if not signer.initialized:
         return
 
+    manifest: SignManifest | None = None
+    if not opts.no_manifest and signer.signer_id:
+        manifest = SignManifest(signer.manifest, signer.signer_id.key_id(),
+                                rebuild=opts.rebuild_manifest)
+
+    if opts.verify_manifest:
+        verify_manifest(manifest, opts.jobs)
+        return
+
     #
     # sign each module from command line
     #
-    for mod in modules:
-        mod_tool = ModuleTool(signer, mod)
-        if mod_tool.path_ok:
-            okay = mod_tool.sign()
-            if not okay:
-                print(f'Problem signing: {mod}')
-                return
-        else:
-            print(f'Module not found: {mod}')
-
-    print('Success: all done')
+    results = sign_modules(signer, modules, opts.jobs, tool_opts, manifest)
+    if manifest and not manifest.save():
+        print('Failed to save manifest', file=sys.stderr)
+
+    finish(opts, results, start)
+
+
+def main():
+    """
+    sign_module: -d <dir> or mod1 mod2 ...
+    """
+    start = time.perf_counter()
+    opts = SignOpts()
+    if opts.serve:
+        # pylint: disable=import-outside-toplevel
+        from lib import serve
+        serve(opts.myname, native=not opts.sign_file, jobs=opts.jobs)
+        return
+
+    multi_kernel = bool(opts.kernel or opts.all_kernels)
+    modules: Iterable[str] = opts.modules
+    if opts.audit:
+        modules = modules_from_dir(opts.audit, find_options(opts, True))
+
+    elif opts.dir:
+        modules = modules_from_dir(opts.dir,
+                                   find_options(opts, opts.recursive))
+
+    elif not (modules or opts.verify_manifest or multi_kernel):
+        print('No modules to sign')
+        return
+
+    if opts.verify or opts.audit:
+        verify(opts, modules)
+        return
+
+    tool_opts = ToolOpts(stream_size=opts.stream_size * 1024 * 1024,
+                         bufsize=max(opts.bufsize, 4) * 1024,
+                         level=opts.level,
+                         threads=opts.threads,
+                         xz_one_block=not opts.threads_given,
+                         force=opts.force)
+
+    if multi_kernel:
+        given = bool(opts.dir or opts.modules)
+        sign_kernels(opts, modules if given else None, tool_opts, start)
+    else:
+        sign(opts, modules, tool_opts, start)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,439 @@
+#!/usr/bin/python
+"""
+Signing throughput benchmarks.
+
+Synthetic ELF modules are generated in each size and format
+(.ko, .ko.zst, .ko.xz, .ko.gz) in a scratch directory along with
+a throw away key. The kernel sign-file tool is replaced by a local
+stand-in (sign_file_stub.py) so no kernel build tree is needed.
+
+Stages timed:
+    read:   read, sniff and decompress module
+    sign:   sign uncompressed module (native and sign-file)
+    write:  recompress and replace module
+    module: all of the above as sign_module.py does it (native and
+            sign-file) - large modules are streamed.
+
+Each measurement runs in its own process so its peak RSS (VmHWM)
+can be reported. Calls are repeated for at least --min-time seconds.
+
+Results are saved as json (-o) along with the git commit, and two
+result files can be compared:
+
+    ./bench_sign.py -s 10K,1M -o before.json
+    ... change code ...
+    ./bench_sign.py -s 10K,1M -o after.json
+    ./bench_sign.py --compare before.json after.json
+
+Generating the 100M xz module takes a while - use -s to pick sizes.
+"""
+# pylint: disable=import-outside-toplevel, import-error
+from typing import (Any, Callable)
+import argparse
+import json
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_util import (BENCH_DIR, CERTS_LOCAL, bench_meta, save_results)
+
+FORMATS = ('.ko', '.ko.zst', '.ko.xz', '.ko.gz')
+SIZES = '10K,100K,1M,10M,100M'
+STAGES = ('read', 'sign', 'write', 'module')
+SIGNERS = ('native', 'sign-file')
+
+_UNITS = {'K': 1000, 'M': 1000 ** 2, 'G': 1000 ** 3}
+
+
+def _parse_size(size: str) -> int:
+    """
+    10K, 1M etc to bytes.
+    """
+    size = size.strip().upper()
+    if size[-1:] in _UNITS:
+        return int(float(size[:-1]) * _UNITS[size[-1]])
+    return int(size)
+
+
+def _size_name(size: int) -> str:
+    """
+    Bytes to short name e.g. 10K
+    """
+    for (unit, scale) in reversed(_UNITS.items()):
+        if size >= scale and size % scale == 0:
+            return f'{size // scale}{unit}'
+    return str(size)
+
+
+def make_module(size: int) -> bytes:
+    """
+    Synthetic kernel module of size bytes.
+
+    An ELF64 relocatable header followed by a mix of random
+    (code like) and repetitive (tables, strings, zero padding) data
+    so it compresses roughly as well as a real module (3-4x).
+    Always the same for a given size.
+    """
+    header = b'\x7fELF' + bytes([2, 1, 1, 0]) + b'\0' * 8
+    header += struct.pack('<HHIQQQIHHHHHH', 1, 62, 1, 0, 0, 0, 0, 64,
+                          0, 0, 64, 0, 0)
+
+    rand = random.Random(size)
+    words = [rand.randbytes(rand.randint(4, 16)) for _count in range(64)]
+    body = bytearray(header)
+    while len(body) < size:
+        match rand.randint(0, 3):
+            case 0:
+                body += rand.randbytes(512)
+            case 1 | 2:
+                body += b''.join(rand.choices(words, k=64))
+            case _:
+                body += b'\0' * rand.randint(64, 1024)
+    return bytes(body[:size])
+
+
+def _make_keys(cert_dir: str) -> bool:
+    """
+    Throw away key and certificate as genkeys.py makes them.
+    """
+    os.makedirs(cert_dir, exist_ok=True)
+    key = os.path.join(cert_dir, 'signing_key.pem')
+    crt = os.path.join(cert_dir, 'signing_crt.crt')
+    pargs = ['openssl', 'req', '-new', '-nodes', '-x509', '-sha512',
+             '-newkey', 'rsa:4096', '-days', '1', '-batch',
+             '-subj', '/CN=bench signing key',
+             '-outform', 'DER', '-out', crt, '-keyout', key]
+    proc = subprocess.run(pargs, capture_output=True, check=False)
+    if proc.returncode != 0:
+        print(f'openssl failed: {proc.stderr.decode(errors="replace")}')
+        return False
+
+    with open(os.path.join(cert_dir, 'khash'), 'w', encoding='utf-8') as fobj:
+        fobj.write('sha512\n')
+    return True
+
+
+def _make_workspace(top: str) -> bool:
+    """
+    Kernel build dir lookalike:
+        top/certs-local/current/  keys
+        top/scripts/sign-file     stand-in
+        top/mods/                 modules
+    """
+    if not _make_keys(os.path.join(top, 'certs-local', 'current')):
+        return False
+
+    scripts = os.path.join(top, 'scripts')
+    os.makedirs(scripts, exist_ok=True)
+    os.makedirs(os.path.join(top, 'mods'), exist_ok=True)
+
+    sign_file = os.path.join(scripts, 'sign-file')
+    with open(os.path.join(BENCH_DIR, 'sign_file_stub.py'), 'r',
+              encoding='utf-8') as fobj:
+        stub = fobj.read().split('\n', 1)[1]
+    with open(sign_file, 'w', encoding='utf-8') as fobj:
+        fobj.write(f'#!{sys.executable}\n{stub}')
+    os.chmod(sign_file, 0o755)
+    return True
+
+
+def _make_modules(top: str, sizes: list[int], formats: list[str]):
+    """
+    Write one module per size and format.
+    """
+    from lib.mod_codec import (CodecParams, compress)
+
+    for size in sizes:
+        data = make_module(size)
+        for fmt in formats:
+            path = _module_path(top, size, fmt)
+            fext = fmt.removeprefix('.ko') or '.ko'
+            mod_data = data if fext == '.ko' else \
+                compress(data, CodecParams(fext))
+            with open(path, 'wb') as fobj:
+                fobj.write(mod_data)
+
+
+def _module_path(top: str, size: int, fmt: str) -> str:
+    """
+    Module file for size and format
+    """
+    return os.path.join(top, 'mods', f'bench-{_size_name(size)}{fmt}')
+
+
+#
+# Worker side - one measurement per process
+#
+def _stage_call(job: dict[str, Any], work: str) -> Callable[[], bool] | str:
+    """
+    The function to time for job or reason it can't be run.
+    work is a copy of the module which may be rewritten.
+    """
+    from lib.signer_class import (KernelModSigner, ModuleTool, ToolOpts)
+    from lib.mod_codec import compress
+    from lib.utils import write_file_atomic
+
+    myname = os.path.join(job['top'], 'certs-local', 'sign_module.py')
+    signer = KernelModSigner(myname, native=job['signer'] != 'sign-file')
+    if not signer.initialized:
+        return 'signer not initialized'
+    if job['signer'] == 'native' and not signer.native:
+        return 'native signing not available'
+
+    shutil.copyfile(_module_path(job['top'], job['size'], job['format']),
+                    work)
+    opts = ToolOpts(force=True)
+    from_file: dict[str, Callable[[], bool]] = {
+            'read': lambda: bool(ModuleTool(signer, work, opts).read()),
+            'module': lambda: ModuleTool(signer, work, opts).sign(),
+            }
+    if job['stage'] in from_file:
+        return from_file[job['stage']]
+
+    # sign and write start from uncompressed module in memory
+    tool = ModuleTool(signer, work, opts)
+    data = tool.read()
+    if not data:
+        return tool.msg
+    if job['stage'] == 'sign':
+        return lambda: signer.sign_data(data) is not None
+
+    def _write() -> bool:
+        mod_data = compress(data, tool.codec) \
+            if tool.compress and tool.codec else data
+        return write_file_atomic(work, mod_data)
+    return _write
+
+
+def _time_calls(func: Callable[[], bool], min_time: float,
+                max_count: int) -> tuple[int, float]:
+    """
+    Call func repeatedly for at least min_time secs.
+
+    The first call is not counted when it is quick, as it may
+    include one off costs (imports, loading key).
+
+    Returns:
+        tuple[count: int, secs: float]
+        count is 0 if any call failed.
+    """
+    start = time.perf_counter()
+    if not func():
+        return (0, 0.0)
+    first = time.perf_counter() - start
+
+    (count, secs) = (1, first) if first >= min_time / 10 else (0, 0.0)
+    while secs < min_time and count < max_count:
+        start = time.perf_counter()
+        if not func():
+            return (0, 0.0)
+        secs += time.perf_counter() - start
+        count += 1
+    return (count, secs)
+
+
+def _peak_rss() -> int:
+    """
+    Peak RSS (KiB) of this process.
+
+    Not getrusage - after exec from a vfork'ed parent, as subprocess
+    does, ru_maxrss starts at the parent's peak.
+    """
+    with open('/proc/self/status', 'r', encoding='utf-8') as fobj:
+        for line in fobj:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return 0
+
+
+def _worker(job_json: str) -> int:
+    """
+    Run one measurement and print result as json.
+    """
+    sys.path.insert(0, CERTS_LOCAL)
+    job = json.loads(job_json)
+    work = os.path.join(job['top'], f'work-{os.getpid()}{job["format"]}')
+    try:
+        func = _stage_call(job, work)
+        if isinstance(func, str):
+            print(json.dumps({'skip': func}))
+            return 0
+        (count, secs) = _time_calls(func, job['min_time'], job['max_count'])
+    finally:
+        if os.path.exists(work):
+            os.unlink(work)
+
+    if not count:
+        print(json.dumps({'skip': 'failed'}))
+        return 1
+    print(json.dumps({'count': count, 'secs': secs, 'rss': _peak_rss()}))
+    return 0
+
+
+#
+# Parent side
+#
+def _run_job(job: dict[str, Any]) -> dict[str, Any]:
+    """
+    Run job in its own process.
+    """
+    pargs = [sys.executable, os.path.abspath(__file__),
+             '--worker', json.dumps(job)]
+    proc = subprocess.run(pargs, stdout=subprocess.PIPE, check=False)
+
+    row = {key: job[key] for key in ('stage', 'format', 'size', 'signer')}
+    try:
+        reply = json.loads(proc.stdout.splitlines()[-1])
+    except (ValueError, IndexError):
+        reply = {'skip': f'worker failed ({proc.returncode})'}
+
+    if 'skip' in reply:
+        row['skip'] = reply['skip']
+        return row
+
+    (count, secs) = (reply['count'], reply['secs'])
+    row['count'] = count
+    row['secs'] = round(secs, 6)
+    row['modules_per_sec'] = round(count / secs, 2)
+    row['mb_per_sec'] = round(job['size'] * count / secs / 1e6, 2)
+    row['peak_rss_mb'] = round(reply['rss'] / 1024, 1)
+    return row
+
+
+def _row_key(row: dict[str, Any]) -> tuple:
+    """ Identifies a measurement across result files """
+    return (row['stage'], row['format'], row['size'], row['signer'])
+
+
+def _print_row(row: dict[str, Any], extra: str = ''):
+    """
+    One line of results table.
+    """
+    name = f'{row["stage"]:7s}{row["format"]:8s}{_size_name(row["size"]):>6s}'
+    name += f'  {row["signer"] or "-":10s}'
+    if 'skip' in row:
+        print(f'{name}  skipped: {row["skip"]}')
+        return
+    print(f'{name}{row["modules_per_sec"]:>12.1f}{row["mb_per_sec"]:>10.1f}'
+          f'{row["peak_rss_mb"]:>10.1f}{extra}')
+
+
+def _print_header(extra: str = ''):
+    """ Results table heading """
+    print(f'{"stage":7s}{"format":8s}{"size":>6s}  {"signer":10s}'
+          f'{"mod/s":>12s}{"MB/s":>10s}{"RSS MiB":>10s}{extra}')
+
+
+def run_bench(args: argparse.Namespace) -> dict[str, Any]:
+    """
+    Run all measurements.
+    """
+    sys.path.insert(0, CERTS_LOCAL)
+    sizes = [_parse_size(size) for size in args.sizes.split(',')]
+    top = tempfile.mkdtemp(prefix='bench-sign-', dir=args.dir)
+    meta = bench_meta(sizes=sizes, formats=args.formats,
+                      min_time=args.min_time)
+    results: dict[str, Any] = {'meta': meta, 'results': []}
+    try:
+        if not _make_workspace(top):
+            return results
+        print('Generating modules ...')
+        _make_modules(top, sizes, args.formats)
+
+        _print_header()
+        for size in sizes:
+            for fmt in args.formats:
+                for stage in args.stages:
+                    signers = SIGNERS if stage in ('sign', 'module') else ('',)
+                    for signer in signers:
+                        job = {'top': top, 'stage': stage, 'format': fmt,
+                               'size': size, 'signer': signer,
+                               'min_time': args.min_time,
+                               'max_count': args.max_count}
+                        row = _run_job(job)
+                        _print_row(row)
+                        results['results'].append(row)
+    finally:
+        if args.keep:
+            print(f'Workspace kept: {top}')
+        else:
+            shutil.rmtree(top, ignore_errors=True)
+    return results
+
+
+def compare(old_file: str, new_file: str) -> int:
+    """
+    Show new results relative to old (MB/s ratio).
+    """
+    with open(old_file, 'r', encoding='utf-8') as fobj:
+        old = json.load(fobj)
+    with open(new_file, 'r', encoding='utf-8') as fobj:
+        new = json.load(fobj)
+
+    print(f'old: {old["meta"]["commit"]} {old["meta"]["date"]}')
+    print(f'new: {new["meta"]["commit"]} {new["meta"]["date"]}')
+    old_rows = {_row_key(row): row for row in old['results']}
+
+    _print_header(f'{"speedup":>10s}')
+    for row in new['results']:
+        old_row = old_rows.get(_row_key(row))
+        extra = ''
+        if old_row and 'skip' not in row and 'skip' not in old_row:
+            extra = f'{row["mb_per_sec"] / old_row["mb_per_sec"]:>9.2f}x'
+        _print_row(row, extra)
+    return 0
+
+
+def _parse_args() -> argparse.Namespace:
+    """
+    Command line options
+    """
+    par = argparse.ArgumentParser(description='Signing benchmarks')
+    par.add_argument('-s', '--sizes', default=SIZES,
+                     help=f'Comma separated module sizes ({SIZES})')
+    par.add_argument('-F', '--formats', default=list(FORMATS), nargs='+',
+                     choices=FORMATS, help='Module formats (all)')
+    par.add_argument('-S', '--stages', default=list(STAGES), nargs='+',
+                     choices=STAGES, help='Stages to time (all)')
+    par.add_argument('-t', '--min-time', default=1.0, type=float,
+                     help='Minimum secs per measurement (1.0)')
+    par.add_argument('-n', '--max-count', default=1000, type=int,
+                     help='Maximum calls per measurement (1000)')
+    par.add_argument('-o', '--output', default='bench-sign.json',
+                     help='Results file (bench-sign.json)')
+    par.add_argument('-d', '--dir', default=None,
+                     help='Scratch directory (system temp dir)')
+    par.add_argument('-k', '--keep', action='store_true',
+                     help='Keep scratch workspace')
+    par.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                     help='Compare two results files')
+    par.add_argument('--worker', help=argparse.SUPPRESS)
+    return par.parse_args()
+
+
+def main() -> int:
+    """
+    Run benchmarks or compare results.
+    """
+    args = _parse_args()
+    if args.worker:
+        return _worker(args.worker)
+
+    if args.compare:
+        return compare(*args.compare)
+
+    results = run_bench(args)
+    if not results['results']:
+        return 1
+
+    save_results(args.output, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
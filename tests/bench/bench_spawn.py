@@ -0,0 +1,168 @@
+#!/usr/bin/python
+"""
+Subprocess spawn latency as parent memory grows.
+
+The parent process is grown step by step (--rss) to mimic a signing
+run holding large decompressed modules, and at each step a trivial
+program (/usr/bin/true) is started and waited for repeatedly by:
+
+    run_prog:    run_prog_copy.run_prog() - what the tools use
+    popen:       subprocess.Popen() with default settings
+    posix_spawn: os.posix_spawn() directly
+    fork:        subprocess.Popen() with a preexec_fn - forces a
+                 real fork() which copies the parent page tables
+
+run_prog, popen and posix_spawn should stay flat (vfork or
+posix_spawn) while fork grows with parent size. A run_prog which
+grows with the fork line has lost the fast path.
+
+    ./bench_spawn.py --rss 0,256M,1G,2G -o spawn.json
+"""
+# pylint: disable=import-outside-toplevel, import-error
+# pylint: disable=subprocess-popen-preexec-fn
+from typing import (Any, Callable)
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from bench_util import (CERTS_LOCAL, bench_meta, save_results)
+
+PROG = '/usr/bin/true'
+RSS_STEPS = '0,256M,1G'
+METHODS = ('run_prog', 'popen', 'posix_spawn', 'fork')
+
+_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def _parse_size(size: str) -> int:
+    """
+    256M, 1G etc to bytes.
+    """
+    size = size.strip().upper()
+    if size[-1:] in _UNITS:
+        return int(float(size[:-1]) * _UNITS[size[-1]])
+    return int(size)
+
+
+def _rss_kib() -> int:
+    """
+    Current RSS (KiB) of this process.
+    """
+    with open('/proc/self/status', 'r', encoding='utf-8') as fobj:
+        for line in fobj:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def _spawn_calls() -> dict[str, Callable[[], bool]]:
+    """
+    One spawn + wait for each method.
+    """
+    from lib.run_prog_copy import run_prog
+
+    def _run_prog() -> bool:
+        return run_prog([PROG])[0] == 0
+
+    def _popen() -> bool:
+        with subprocess.Popen([PROG], stdout=subprocess.PIPE) as proc:
+            proc.communicate()
+        return proc.returncode == 0
+
+    def _posix_spawn() -> bool:
+        pid = os.posix_spawn(PROG, [PROG], os.environ)
+        return os.waitpid(pid, 0)[1] == 0
+
+    def _fork() -> bool:
+        with subprocess.Popen([PROG], stdout=subprocess.PIPE,
+                              preexec_fn=lambda: None) as proc:
+            proc.communicate()
+        return proc.returncode == 0
+
+    return {'run_prog': _run_prog, 'popen': _popen,
+            'posix_spawn': _posix_spawn, 'fork': _fork}
+
+
+def _time_calls(func: Callable[[], bool], min_time: float,
+                max_count: int) -> float:
+    """
+    Mean secs per call - calls repeated for at least min_time secs.
+    0 if any call failed.
+    """
+    (count, secs) = (0, 0.0)
+    while secs < min_time and count < max_count:
+        start = time.perf_counter()
+        if not func():
+            return 0.0
+        secs += time.perf_counter() - start
+        count += 1
+    return secs / count
+
+
+def run_bench(args: argparse.Namespace) -> list[dict[str, Any]]:
+    """
+    Grow parent to each rss step and time every method.
+    """
+    sys.path.insert(0, CERTS_LOCAL)
+    calls = _spawn_calls()
+    hold: list[bytes] = []
+    rows: list[dict[str, Any]] = []
+
+    print(f'{"RSS MiB":>8s}' + ''.join(f'{meth:>13s}' for meth in
+                                       args.methods) + '   (ms/spawn)')
+    for step in [_parse_size(size) for size in args.rss.split(',')]:
+        #
+        # Pages must be touched to count - b'\1' * n writes every byte
+        #
+        grow = step - sum(len(chunk) for chunk in hold)
+        if grow > 0:
+            hold.append(b'\1' * grow)
+
+        row: dict[str, Any] = {'rss_mb': round(_rss_kib() / 1024, 1)}
+        for meth in args.methods:
+            secs = _time_calls(calls[meth], args.min_time, args.max_count)
+            row[meth] = round(secs * 1000, 4)
+        rows.append(row)
+        print(f'{row["rss_mb"]:>8.0f}' + ''.join(f'{row[meth]:>13.3f}'
+                                                 for meth in args.methods))
+    return rows
+
+
+def _parse_args() -> argparse.Namespace:
+    """
+    Command line options
+    """
+    par = argparse.ArgumentParser(description='Spawn latency benchmark')
+    par.add_argument('-r', '--rss', default=RSS_STEPS,
+                     help=f'Comma separated parent sizes ({RSS_STEPS})')
+    par.add_argument('-m', '--methods', default=list(METHODS), nargs='+',
+                     choices=METHODS, help='Spawn methods (all)')
+    par.add_argument('-t', '--min-time', default=0.5, type=float,
+                     help='Minimum secs per measurement (0.5)')
+    par.add_argument('-n', '--max-count', default=500, type=int,
+                     help='Maximum spawns per measurement (500)')
+    par.add_argument('-o', '--output', default='',
+                     help='Results file (json)')
+    return par.parse_args()
+
+
+def main() -> int:
+    """
+    Run benchmark.
+    """
+    args = _parse_args()
+    if not os.access(PROG, os.X_OK):
+        print(f'Missing {PROG}')
+        return 1
+
+    meta = bench_meta(prog=PROG, min_time=args.min_time)
+    results = {'meta': meta, 'results': run_bench(args)}
+    if args.output:
+        save_results(args.output, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,44 @@
+"""
+Helpers shared by the benchmarks.
+
+    bench_meta():   what and where was measured (git commit etc)
+    save_results(): write results json
+"""
+from typing import Any
+import json
+import os
+import platform
+import subprocess
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(os.path.dirname(BENCH_DIR))
+CERTS_LOCAL = os.path.join(REPO_DIR, 'certs-local')
+
+
+def bench_meta(**extra: Any) -> dict[str, Any]:
+    """
+    What and where was measured, plus any extra items.
+    """
+    proc = subprocess.run(['git', '-C', REPO_DIR, 'describe', '--always',
+                           '--dirty'], capture_output=True, text=True,
+                          check=False)
+    meta = {
+        'commit': proc.stdout.strip() if proc.returncode == 0 else '',
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        }
+    meta.update(extra)
+    return meta
+
+
+def save_results(path: str, results: dict[str, Any]):
+    """
+    Write results (json).
+    """
+    with open(path, 'w', encoding='utf-8') as fobj:
+        json.dump(results, fobj, indent=2)
+        fobj.write('\n')
+    print(f'Results saved: {path}')
@@ -0,0 +1,58 @@
+#!/usr/bin/python
+"""
+Stand-in for the kernel scripts/sign-file tool.
+
+Used by the benchmarks so they run without a kernel build tree.
+Same arguments as sign-file:
+
+    sign-file <hash> <key> <x509> <module> [<dest>]
+
+The module is read, hashed with <hash> and written (to dest or in place)
+with a fixed size dummy PKCS#7 blob and a real signature trailer
+appended, so the cost is close to that of sign-file while the
+result can still have its signature stripped and be re-signed.
+The signature itself is not valid.
+"""
+import hashlib
+import os
+import struct
+import sys
+
+_SIG_MAGIC = b'~Module signature appended~\n'
+_PKEY_ID_PKCS7 = 2
+_SIG_SIZE = 700
+
+
+def main() -> int:
+    """
+    sign-file stand-in
+    """
+    if len(sys.argv) not in (5, 6):
+        print('Usage: sign-file <hash> <key> <x509> <module> [<dest>]',
+              file=sys.stderr)
+        return 2
+
+    (khash, key, crt, mod_in) = sys.argv[1:5]
+    mod_out = sys.argv[5] if len(sys.argv) == 6 else mod_in
+    for path in (key, crt):
+        if not os.path.exists(path):
+            print(f'sign-file: {path}: not found', file=sys.stderr)
+            return 1
+
+    with open(mod_in, 'rb') as fobj:
+        data = fobj.read()
+
+    digest = hashlib.new(khash, data).digest()
+    sig = (digest * (_SIG_SIZE // len(digest) + 1))[:_SIG_SIZE]
+    trailer = struct.pack('>BBBBB3sI', 0, 0, _PKEY_ID_PKCS7, 0, 0,
+                          b'\0' * 3, len(sig))
+
+    with open(mod_out, 'wb') as fobj:
+        fobj.write(data)
+        fobj.write(sig)
+        fobj.write(trailer + _SIG_MAGIC)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
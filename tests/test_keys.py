@@ -6,11 +6,15 @@ Tests:
 
 Please set PYTHONPATH=../src/dns_tools
 """
-from subprocess import CalledProcessError
+from subprocess import (CalledProcessError, Popen, DEVNULL)
+import json
+import os
+import shutil
+import time
 import pytest
 
 
-from lib import run_prog
+from lib import (KernelConfig, run_many, run_prog)
 
 
 @pytest.fixture(scope='session', autouse=True)
@@ -41,7 +45,7 @@ class TestKeys:
         Generate keys
         """
         pargs = ['./certs-local/genkeys.py']
-        pargs += ['-c', './config']
+        pargs += ['-c', './config', '-v']
         (rc, stdout, _stderr) = run_prog(pargs)
         assert rc == 0
         assert 'Success: all done' in stdout
@@ -65,3 +69,376 @@ class TestKeys:
         (rc, stdout, _stderr) = run_prog(pargs)
         assert rc == 0
         assert 'Success: all done' in stdout
+
+    def test_04_sign_modules_sign_file(self):
+        """
+        Sign sample modules using kernel sign-file
+        """
+        pargs = ['./certs-local/sign_module.py']
+        pargs += ['-s', '-f', '-v', '-d', './modules']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'Success: all done' in stdout
+        assert 'already signed' not in stdout
+        assert 'sign-file: 6 runs' in stdout
+
+    def test_05_skip_signed_modules(self):
+        """
+        Modules already signed with current key are skipped
+        """
+        pargs = ['./certs-local/sign_module.py']
+        pargs += ['-d', './modules']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'Signed 0 of 6 modules (6 already signed' in stdout
+        assert 'Success: all done' in stdout
+
+    def test_06_verify_manifest(self):
+        """
+        Manifest has an entry for each signed module
+        """
+        pargs = ['./certs-local/sign_module.py', '-vm']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'Manifest: 6 of 6 entries okay' in stdout
+        assert 'Success: all done' in stdout
+
+    def test_07_sign_daemon(self):
+        """
+        Sign modules using signing daemon
+        """
+        sock = './certs-local/sign_module.sock'
+        with Popen(['./certs-local/sign_module.py', '--serve'],
+                   stdout=DEVNULL) as daemon:
+            for _count in range(50):
+                if os.path.exists(sock):
+                    break
+                time.sleep(0.1)
+            assert os.path.exists(sock)
+
+            pargs = ['./certs-local/sign_module.py']
+            pargs += ['-f', '-d', './modules']
+            (rc, stdout, _stderr) = run_prog(pargs)
+            daemon.terminate()
+
+        assert rc == 0
+        assert 'Signed 6 of 6 modules' in stdout
+        assert not os.path.exists(sock)
+
+    def test_08_sign_modules_recursive(self):
+        """
+        Find and sign modules in a directory tree
+        """
+        pargs = ['./certs-local/sign_module.py']
+        pargs += ['-f', '-r', '-d', '.', '-I', 'modules/*', '-X', 'scripts']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'Signed 6 of 6 modules' in stdout
+        assert 'Success: all done' in stdout
+
+    def test_09_sign_modules_by_magic(self):
+        """
+        Format is taken from content, not name.
+        Files that are not modules are rejected.
+        """
+        os.makedirs('./misnamed', exist_ok=True)
+        shutil.copy('./modules/moxa.ko.zst', './misnamed/moxa.ko.xz')
+        with open('./misnamed/junk.ko.gz', 'wb') as fobj:
+            fobj.write(b'not a kernel module\n')
+
+        pargs = ['./certs-local/sign_module.py', '-f', '-d', './misnamed']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        shutil.rmtree('./misnamed')
+        assert rc == 0
+        assert 'Signed 1 of 2 modules' in stdout
+        assert 'junk.ko.gz : Not a kernel module' in stdout
+
+    def test_10_sign_report(self):
+        """
+        json lines report - one record per module then summary
+        """
+        pargs = ['./certs-local/sign_module.py', '-f', '--json']
+        pargs += ['-d', './modules']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        records = [json.loads(line) for line in stdout.splitlines()]
+        assert len(records) == 7
+        for record in records[:-1]:
+            assert record['okay']
+            assert record['codec'] == '.zst'
+            assert record['stripped']
+            assert 'sign' in record['stages']
+
+        summary = records[-1]['summary']
+        assert summary['signed'] == 6
+        assert summary['codecs'] == {'.zst': 6}
+        assert summary['hot_stage'] in summary['stages']
+
+        # streamed modules report stripped signature too
+        pargs += ['-ss', '0']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        records = [json.loads(line) for line in stdout.splitlines()]
+        for record in records[:-1]:
+            assert record['streamed']
+            assert record['stripped']
+
+        # diagnostics go to stderr - stdout stays json lines
+        kdir = './kroot/6.14.7-stable-1'
+        os.makedirs(kdir, exist_ok=True)
+        os.symlink(os.getcwd(), os.path.join(kdir, 'build'))
+        kargs = ['./certs-local/sign_module.py', '-f', '--json']
+        kargs += ['--kernel-root', './kroot']
+        kargs += ['-K', '6.14.7-stable-1', '-K', '1.0.0-none']
+        kargs += ['-d', './modules']
+        (rc, stdout, stderr) = run_prog(kargs)
+        shutil.rmtree('./kroot')
+        assert rc == 0
+        assert 'Kernel 1.0.0-none: no signing keys' in stderr
+        records = [json.loads(line) for line in stdout.splitlines()]
+        assert records[-1]['summary']['signed'] == 6
+
+        # manifest digests are of the streamed output
+        pargs = ['./certs-local/sign_module.py', '-vm']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'Manifest stale: ' + os.path.abspath('./modules') \
+            not in stdout
+
+    def test_11_verify_modules(self):
+        """
+        Verify module signatures in process
+        """
+        pargs = ['./certs-local/sign_module.py', '--verify', '-d', './modules']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'Verified 6 modules: 6 valid' in stdout
+        assert 'Success: all done' in stdout
+
+    def test_12_sign_multi_kernel(self):
+        """
+        Modules routed to kernel keys by vermagic
+        """
+        kdir = './kroot/6.14.7-stable-1'
+        os.makedirs(kdir, exist_ok=True)
+        os.symlink(os.getcwd(), os.path.join(kdir, 'build'))
+
+        pargs = ['./certs-local/sign_module.py', '--kernel-root', './kroot']
+        pargs += ['-K', '6.14.7-stable-1', '-K', '1.0.0-none']
+        pargs += ['-f', '-d', './modules']
+        (rc, stdout, stderr) = run_prog(pargs)
+        shutil.rmtree('./kroot')
+        assert rc == 0
+        assert 'Kernel 1.0.0-none: no signing keys' in stderr
+        assert 'Signed 6 of 6 modules' in stdout
+
+    def test_13_run_many(self):
+        """
+        Concurrent programs - results in order
+        """
+        pargs_list = [['/usr/bin/sh', '-c', f'sleep 0.2; echo {num}']
+                      for num in range(4)]
+        pargs_list.append(['/usr/bin/false'])
+        pargs_list.append(['/no/such/prog'])
+
+        start = time.time()
+        results = run_many(pargs_list, limit=4)
+        elapsed = time.time() - start
+
+        assert [res[1] for res in results[:4]] == ['0\n', '1\n', '2\n', '3\n']
+        assert results[4][0] == 1
+        assert results[5][0] != 0 and results[5][2]
+        assert elapsed < 0.6
+
+    def test_14_genkeys_openssl(self):
+        """
+        Keys made by openssl (not in process) sign and verify the same
+        """
+        pargs = ['./certs-local/genkeys.py']
+        pargs += ['-c', './config', '-r', 'always', '--openssl', '-v']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'openssl req: 1 runs' in stdout
+        assert 'Success: all done' in stdout
+
+        pargs = ['./certs-local/sign_module.py', '-f', '-d', './modules']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'Signed 6 of 6 modules' in stdout
+
+        pargs = ['./certs-local/sign_module.py', '--verify', '-d', './modules']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'Verified 6 modules: 6 valid' in stdout
+
+    def test_15_key_pool(self):
+        """
+        Keys made ahead of time are used when keys are refreshed
+        """
+        pargs = ['./certs-local/genkeys.py', '-c', './config', '-v']
+        (rc, stdout, _stderr) = run_prog(pargs + ['--fill-pool', '2'])
+        assert rc == 0
+        assert 'Key pool: 2 ready (2 made)' in stdout
+
+        (rc, stdout, _stderr) = run_prog(pargs + ['--fill-pool', '2'])
+        assert rc == 0
+        assert 'Key pool: 2 ready (0 made)' in stdout
+
+        #
+        # Earlier keys were made this same minute - move them aside
+        # so the refresh gets a new key dir
+        #
+        current = os.path.realpath('./certs-local/current')
+        os.rename(current, current + '-old')
+
+        (rc, stdout, _stderr) = run_prog(pargs + ['-r', 'always'])
+        assert rc == 0
+        assert 'Using keys from key pool' in stdout
+        assert len(os.listdir('./certs-local/pool')) == 1
+
+        pargs = ['./certs-local/sign_module.py', '-f', '-d', './modules']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'Signed 6 of 6 modules' in stdout
+
+    def test_16_key_index(self):
+        """
+        Key index is kept up to date and old keys can be pruned
+        """
+        current = os.path.realpath('./certs-local/current')
+        os.rename(current + '-old', './certs-local/20000101-0000')
+        time.sleep(1)
+
+        pargs = ['./certs-local/genkeys.py', '-c', './config', '-v']
+        pargs += ['--prune-age', '1s']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'Removed old keys: 20000101-0000' in stdout
+        assert not os.path.exists('./certs-local/20000101-0000')
+
+        with open('./certs-local/key-index.json', encoding='utf-8') as fobj:
+            index = json.load(fobj)
+        assert list(index['keys']) == [os.path.basename(current)]
+
+        pargs = ['./certs-local/sign_module.py', '--verify', '-d', './modules']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'Verified 6 modules: 6 valid' in stdout
+
+    def test_17_kconfig_cache(self):
+        """
+        Config signing fields are cached until the config changes
+        """
+        cache_path = './certs-local/kconfig-cache.json'
+        kconfig = os.path.abspath('./config')
+        with open(cache_path, encoding='utf-8') as fobj:
+            entry = json.load(fobj)['configs'][kconfig]
+        assert (entry['key_type'], entry['hash_type']) == ('ec', 'sha512')
+
+        with open(kconfig, 'a', encoding='utf-8') as fobj:
+            fobj.write('# kconfig cache test\n')
+
+        pargs = ['./certs-local/genkeys.py', '-c', './config']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'Success: all done' in stdout
+
+        with open(cache_path, encoding='utf-8') as fobj:
+            entry = json.load(fobj)['configs'][kconfig]
+        assert entry['size'] == os.stat(kconfig).st_size
+
+    def test_18_kernel_config(self):
+        """
+        Kernel config is read once, edited in place and only
+        written when changed
+        """
+        kconf = KernelConfig('./config')
+        assert kconf.key_hash_types() == (True, 'ec', 'sha512')
+
+        name = 'CONFIG_SYSTEM_TRUSTED_KEYS'
+        current = os.path.realpath('./certs-local/current')
+        trusted = f'"{current}/signing_key.pem"'
+        assert kconf.get(name) == trusted
+        assert not kconf.set(name, trusted)
+
+        mtime_ns = os.stat('./config').st_mtime_ns
+        assert kconf.save()
+        assert os.stat('./config').st_mtime_ns == mtime_ns
+
+        assert kconf.set(name, '"/tmp/signing_key.pem"')
+        assert kconf.save()
+        assert KernelConfig('./config').get(name) == '"/tmp/signing_key.pem"'
+
+        pargs = ['./certs-local/genkeys.py', '-c', './config', '-v']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'Updating config' in stdout
+        assert KernelConfig('./config').get(name) == trusted
+
+    def test_19_update_many_configs(self):
+        """
+        Several configs updated together - unchanged ones left alone
+        """
+        name = 'CONFIG_SYSTEM_TRUSTED_KEYS'
+        current = os.path.realpath('./certs-local/current')
+        trusted = f'"{current}/signing_key.pem"'
+
+        os.makedirs('./configs', exist_ok=True)
+        for num in range(4):
+            kconfig = f'./configs/config.{num}'
+            shutil.copy2('./config', kconfig)
+            if num % 2:
+                kconf = KernelConfig(kconfig)
+                kconf.set(name, '"/tmp/signing_key.pem"')
+                assert kconf.save()
+
+        mtime_ns = os.stat('./configs/config.0').st_mtime_ns
+        pargs = ['./certs-local/genkeys.py', '-c', './configs/config.*', '-v']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert stdout.count('Updating config') == 2
+        assert stdout.count('config up to date') == 2
+        assert os.stat('./configs/config.0').st_mtime_ns == mtime_ns
+        for num in range(4):
+            assert KernelConfig(f'./configs/config.{num}').get(name) == trusted
+
+        #
+        # Staged but discarded leaves config and no temp file
+        #
+        kconf = KernelConfig('./configs/config.0')
+        kconf.set(name, '"/tmp/signing_key.pem"')
+        assert kconf.stage()
+        assert len(os.listdir('./configs')) == 5
+        kconf.discard()
+        assert sorted(os.listdir('./configs')) == \
+            [f'config.{num}' for num in range(4)]
+        assert KernelConfig('./configs/config.0').get(name) == trusted
+        shutil.rmtree('./configs')
+
+    def test_20_kconfig_not_read(self, monkeypatch):
+        """
+        Unchanged config already holding current key is not opened
+        """
+        pargs = ['./certs-local/genkeys.py', '-c', './config']
+        (rc, stdout, _stderr) = run_prog(pargs)
+        assert rc == 0
+        assert 'Success: all done' in stdout
+
+        # pylint: disable=import-outside-toplevel
+        from lib import GenKeys
+        from lib import get_key_hash, update_config
+        opened: list[str] = []
+
+        class _CountingConfig(KernelConfig):
+            def _read(self):
+                opened.append(self.path)
+                super()._read()
+
+        monkeypatch.setattr(get_key_hash, 'KernelConfig', _CountingConfig)
+        monkeypatch.setattr(update_config, 'KernelConfig', _CountingConfig)
+        monkeypatch.setattr('sys.argv', pargs)
+
+        genkeys = GenKeys()
+        assert genkeys.okay
+        assert genkeys.update_configs()
+        assert not opened
@@ -0,0 +1,113 @@
+"""
+Tests:
+    - Startup: what sign_module.py and genkeys.py load
+    - Startup time of sign_module.py (opt-in - see below)
+
+sign_module.py is run once per dkms build so its startup time is
+most of the cost of signing a module. These keep the import path
+from growing again.
+
+Wall clock timing depends on the machine and its load, so the startup
+time test only runs when SIGN_MODULE_STARTUP_MS is set - to the time
+budget in ms (e.g. 200).
+"""
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+_CERTS_LOCAL = os.path.join(os.path.dirname(__file__), '..', 'certs-local')
+_SIGN_MODULE = os.path.join(_CERTS_LOCAL, 'sign_module.py')
+_GENKEYS = os.path.join(_CERTS_LOCAL, 'genkeys.py')
+
+# never needed just to start sign_module.py
+_SIGN_NOT_IMPORTED = ['zstandard', 'gzip', 'cryptography', 'pyconcurrent',
+                      'socketserver', 'lib.class_genkeys', 'lib._genkeys_base',
+                      'lib.make_keys', 'lib.update_config',
+                      'lib.native_signer', 'lib.sign_daemon',
+                      'lib.sign_report', 'lib.mod_verify',
+                      'lib.kernel_signers']
+
+# genkeys doesn't sign anything
+_GENKEYS_NOT_IMPORTED = ['zstandard', 'lib.signer_class', 'lib.mod_codec',
+                         'lib.sign_pool', 'lib.native_signer']
+
+
+def _imported(script: str, args: list[str]) -> set[str]:
+    """
+    Modules loaded by the time script exits.
+    """
+    code = ('import atexit, runpy, sys\n'
+            'atexit.register(lambda: print(*sys.modules, file=sys.stderr))\n'
+            f'sys.argv = [{script!r}] + {args!r}\n'
+            f'sys.path.insert(0, {os.path.dirname(script)!r})\n'
+            f'runpy.run_path({script!r}, run_name="__main__")\n')
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True,
+                          text=True, check=False)
+    lines = proc.stderr.strip().splitlines()
+    return set(lines[-1].split()) if lines else set()
+
+
+def _best_time(pargs: list[str], count: int = 5) -> float:
+    """
+    Fastest wall time (secs) of count runs
+    """
+    best = 1e9
+    for _count in range(count):
+        start = time.perf_counter()
+        subprocess.run(pargs, capture_output=True, check=False)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+class TestStartup:
+    """
+    Startup test class
+    """
+    def test_01_sign_module_imports(self):
+        """
+        sign_module.py loads neither codecs nor key generation code
+        """
+        modules = _imported(_SIGN_MODULE, ['--help'])
+        assert 'lib.signer_class' in modules
+        for name in _SIGN_NOT_IMPORTED:
+            assert name not in modules
+
+    def test_02_genkeys_imports(self):
+        """
+        genkeys.py loads no signing code
+        """
+        modules = _imported(_GENKEYS, ['--help'])
+        assert 'lib.class_genkeys' in modules
+        for name in _GENKEYS_NOT_IMPORTED:
+            assert name not in modules
+
+    def test_03_codecs_loaded_on_use(self):
+        """
+        Only the codec actually used is imported
+        """
+        code = ('import sys, gzip\n'
+                'from lib.mod_codec import decompress\n'
+                'assert decompress(gzip.compress(b"ko"), ".gz") == b"ko"\n'
+                'print("zstandard" in sys.modules)\n')
+        proc = subprocess.run([sys.executable, '-c', code],
+                              cwd=_CERTS_LOCAL, capture_output=True,
+                              text=True, check=False)
+        assert proc.returncode == 0
+        assert proc.stdout.strip() == 'False'
+
+    @pytest.mark.skipif(not os.environ.get('SIGN_MODULE_STARTUP_MS'),
+                        reason='set SIGN_MODULE_STARTUP_MS to run')
+    def test_04_sign_module_startup_time(self):
+        """
+        sign_module.py startup time over bare interpreter
+        """
+        budget_ms = int(os.environ['SIGN_MODULE_STARTUP_MS'])
+        bare = _best_time([sys.executable, '-c', 'pass'])
+        sign = _best_time([_SIGN_MODULE, '--help'])
+        overhead_ms = (sign - bare) * 1000
+        print(f'sign_module.py startup: {sign * 1000:.0f} ms '
+              f'(python {bare * 1000:.0f} ms)')
+        assert overhead_ms < budget_ms